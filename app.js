@@ -6,6 +6,7 @@ const API_BASE_URL = window.location.origin.includes('localhost')
 // グローバル変数
 let selectedFile = null;
 let metadata = {};
+let historyCursor = null;
 
 // トークンの有効期限をチェック
 function isTokenExpired(token) {
@@ -55,6 +56,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // イベントリスナー設定
     setupEventListeners();
     updateDynamicTitle();
+    loadHistory(false);
 });
 
 // イベントリスナーの設定
@@ -68,6 +70,13 @@ function setupEventListeners() {
     const dropZone = document.getElementById('dropZone');
     const fileInput = document.getElementById('audioFile');
 
+    // 過去の議事録の検索
+    document.getElementById('historySearch').addEventListener('keydown', (e) => {
+        if (e.key === 'Enter') {
+            searchHistory();
+        }
+    });
+
     dropZone.addEventListener('click', () => fileInput.click());
     fileInput.addEventListener('change', handleFileSelect);
 
@@ -121,6 +130,7 @@ function goToStep2() {
 
     // UI更新
     document.getElementById('metadataSection').classList.add('hidden');
+    document.getElementById('historySection').classList.add('hidden');
     document.getElementById('uploadSection').classList.remove('hidden');
     updateStepIndicator(2);
 }
@@ -128,9 +138,128 @@ function goToStep2() {
 function goToStep1() {
     document.getElementById('uploadSection').classList.add('hidden');
     document.getElementById('metadataSection').classList.remove('hidden');
+    document.getElementById('historySection').classList.remove('hidden');
     updateStepIndicator(1);
 }
 
+// 過去の議事録一覧を読み込み（append: trueで次ページを追加）
+async function loadHistory(append) {
+    const token = localStorage.getItem('access_token');
+    const params = new URLSearchParams({ limit: '10' });
+    if (append && historyCursor) {
+        params.append('cursor', historyCursor);
+    }
+
+    try {
+        const response = await fetch(`${API_BASE_URL}/api/minutes?${params}`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+        checkAuthResponse(response);
+        if (!response.ok) {
+            // 保存機能が無効の場合は一覧を表示しない
+            return;
+        }
+
+        const data = await response.json();
+        renderHistoryItems(data.items, append);
+
+        historyCursor = data.next_cursor;
+        document.getElementById('historyMoreBtn').classList.toggle('hidden', !historyCursor);
+        document.getElementById('historySection').classList.remove('hidden');
+    } catch (error) {
+        console.error('History error:', error);
+    }
+}
+
+// 過去の議事録を全文検索（空欄の場合は一覧に戻す）
+async function searchHistory() {
+    const query = document.getElementById('historySearch').value.trim();
+    if (!query) {
+        loadHistory(false);
+        return;
+    }
+
+    const token = localStorage.getItem('access_token');
+    const params = new URLSearchParams({ q: query, limit: '20' });
+
+    try {
+        const response = await fetch(`${API_BASE_URL}/api/minutes/search?${params}`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+        checkAuthResponse(response);
+        if (!response.ok) {
+            const error = await response.json();
+            throw new Error(error.detail || '検索に失敗しました');
+        }
+
+        const data = await response.json();
+        renderHistoryItems(data.items, false);
+        historyCursor = null;
+        document.getElementById('historyMoreBtn').classList.add('hidden');
+    } catch (error) {
+        console.error('Search error:', error);
+        alert(`検索エラー: ${error.message}`);
+    }
+}
+
+// 議事録一覧の表示
+function renderHistoryItems(items, append) {
+    const list = document.getElementById('historyList');
+    if (!append) {
+        list.innerHTML = '';
+    }
+
+    items.forEach(item => {
+        const li = document.createElement('li');
+        li.className = 'history-item';
+        li.addEventListener('click', () => openMinutes(item.id));
+
+        const left = document.createElement('div');
+        const title = document.createElement('p');
+        title.className = 'file-name';
+        title.textContent = item.title || '（タイトルなし）';
+        const detail = document.createElement('p');
+        detail.className = 'file-size';
+        detail.textContent = `${item.metadata.creator || ''} / ${item.metadata.meeting_place || ''}`;
+        left.appendChild(title);
+        left.appendChild(detail);
+
+        const date = document.createElement('span');
+        date.className = 'file-size';
+        date.textContent = new Date(item.created_at * 1000).toLocaleString('ja-JP');
+
+        li.appendChild(left);
+        li.appendChild(date);
+        list.appendChild(li);
+    });
+
+    document.getElementById('historyEmpty').classList.toggle('hidden', list.children.length > 0);
+}
+
+// 保存済みの議事録を開く（再生成せずに編集・出力へ）
+async function openMinutes(minutesId) {
+    const token = localStorage.getItem('access_token');
+
+    try {
+        const response = await fetch(`${API_BASE_URL}/api/minutes/${encodeURIComponent(minutesId)}`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+        checkAuthResponse(response);
+        if (!response.ok) {
+            throw new Error('議事録の取得に失敗しました');
+        }
+
+        const record = await response.json();
+        metadata = record.metadata;
+        document.getElementById('metadataSection').classList.add('hidden');
+        document.getElementById('historySection').classList.add('hidden');
+        displayResults(record);
+    } catch (error) {
+        console.error('Open minutes error:', error);
+        alert(`エラー: ${error.message}`);
+    }
+}
+
 function updateStepIndicator(currentStep) {
     // ステップの状態を更新
     [1, 2, 3].forEach(s => {
@@ -199,7 +328,7 @@ function formatFileSize(bytes) {
     return Math.round(bytes / Math.pow(k, i) * 100) / 100 + ' ' + sizes[i];
 }
 
-// 音声アップロードと解析（署名付きURL経由でGCSへ）
+// 音声アップロードと解析（署名付きURL経由でGCSへ、GCSが使えない場合はサーバーへ直接）
 async function uploadAudio() {
     if (!selectedFile) {
         alert('ファイルを選択してください');
@@ -216,16 +345,30 @@ async function uploadAudio() {
 
         // ステップ1: 署名付きURLを取得
         updateProgress(5, '署名付きURLを取得中...');
-        const { upload_url, blob_name } = await generateUploadUrl(selectedFile, token);
+        const signed = await generateUploadUrl(selectedFile, token);
 
         // ステップ2: GCSへ直接アップロード（Cloud Run制限を回避）
-        updateProgress(10, 'GCSへファイルをアップロード中...');
-        await uploadToGCS(upload_url, selectedFile);
+        let blob_name;
+        if (signed) {
+            updateProgress(10, 'GCSへファイルをアップロード中...');
+            await uploadToGCS(signed.upload_url, selectedFile);
+            blob_name = signed.blob_name;
+        } else {
+            // GCSが設定されていない環境ではサーバーへ直接アップロード
+            updateProgress(10, 'サーバーへファイルをアップロード中...');
+            blob_name = (await uploadDirect(selectedFile, token)).blob_name;
+        }
         updateProgress(30, 'アップロード完了');
 
         // ステップ3: バックエンドで音声解析
         updateProgress(40, 'AIが音声を解析中...（数分かかる場合があります）');
-        const finalResult = await processAudioFromGCS(blob_name, token);
+        const stopQueueWatch = watchQueuePosition(blob_name, token);
+        let finalResult;
+        try {
+            finalResult = await processAudioFromGCS(blob_name, token);
+        } finally {
+            stopQueueWatch();
+        }
         updateProgress(100, '完了！');
 
         // 結果を表示
@@ -241,7 +384,7 @@ async function uploadAudio() {
     }
 }
 
-// 署名付きURL取得
+// 署名付きURL取得（GCSが設定されていない場合はnull）
 async function generateUploadUrl(file, token) {
     console.log(`署名付きURL取得: ${file.name}`);
 
@@ -259,6 +402,11 @@ async function generateUploadUrl(file, token) {
 
     checkAuthResponse(response);
 
+    if (response.status === 503) {
+        console.log('GCSが利用できないため、サーバーへ直接アップロードします');
+        return null;
+    }
+
     if (!response.ok) {
         const error = await response.json();
         throw new Error(error.detail || '署名付きURLの取得に失敗しました');
@@ -267,6 +415,37 @@ async function generateUploadUrl(file, token) {
     return await response.json();
 }
 
+// サーバーへ直接アップロード（ファイルをそのまま本文として送信）
+async function uploadDirect(file, token) {
+    console.log(`サーバーへアップロード: ${file.name} (${(file.size / (1024 * 1024)).toFixed(2)} MB)`);
+
+    const response = await fetch(
+        `${API_BASE_URL}/api/direct-upload?filename=${encodeURIComponent(file.name)}`,
+        {
+            method: 'PUT',
+            headers: {
+                'Authorization': `Bearer ${token}`,
+                'Content-Type': 'application/octet-stream'
+            },
+            body: file
+        }
+    );
+
+    checkAuthResponse(response);
+
+    if (!response.ok) {
+        let detail = '';
+        try {
+            detail = (await response.json()).detail;
+        } catch (e) {
+            console.error('JSONパースエラー:', e);
+        }
+        throw new Error(detail || `アップロードに失敗しました (ステータス: ${response.status})`);
+    }
+
+    return await response.json();
+}
+
 // GCSへ直接アップロード
 async function uploadToGCS(uploadUrl, file) {
     console.log(`GCSへアップロード: ${file.name} (${(file.size / (1024 * 1024)).toFixed(2)} MB)`);
@@ -359,6 +538,38 @@ async function processAudioFromGCS(blobName, token) {
     }
 }
 
+// 処理待ちの順番を定期的に表示（混雑時のみ）
+function watchQueuePosition(blobName, token) {
+    let stopped = false;
+    let lastState = null;
+
+    const poll = async () => {
+        if (stopped) return;
+        try {
+            const response = await fetch(
+                `${API_BASE_URL}/api/queue?blob_name=${encodeURIComponent(blobName)}`,
+                { headers: { 'Authorization': `Bearer ${token}` } }
+            );
+            if (response.ok && !stopped) {
+                const job = (await response.json()).jobs[0];
+                if (job && job.state === 'queued') {
+                    const position = job.position != null ? `（${job.position}番目）` : '';
+                    updateProgress(40, `処理の順番待ち中...${position}`);
+                } else if (job && lastState === 'queued') {
+                    updateProgress(45, 'AIが音声を解析中...（数分かかる場合があります）');
+                }
+                lastState = job ? job.state : lastState;
+            }
+        } catch (e) {
+            console.warn('順番の取得に失敗:', e);
+        }
+        if (!stopped) setTimeout(poll, 5000);
+    };
+    setTimeout(poll, 1000);
+
+    return () => { stopped = true; };
+}
+
 function updateProgress(percent, message) {
     document.getElementById('progressBar').style.width = `${percent}%`;
     document.getElementById('progressPercent').textContent = `${percent}%`;
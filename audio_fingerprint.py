@@ -0,0 +1,457 @@
+"""
+音声の指紋（acoustic fingerprint）による同一録音の検出モジュール
+16kHzモノラルに変換した音声の帯域ごとのエネルギー変化を1フレーム15ビットに圧縮し、
+再エンコード・再書き出しでバイト列が異なる同じ録音を見つけて議事録を再利用する
+あわせてPCMを一定時間の区間ごとにハッシュ化し、前回の録音を先頭に含む（続きを録音した）録音を見つける
+"""
+import os
+import hashlib
+import sqlite3
+import threading
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from minutes_store import MINUTES_STORE, MINUTES_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+    logger.warning("NumPyが利用できないため、音声の指紋による重複検出は無効です")
+
+# 指紋による重複検出の有効/無効
+FINGERPRINT_ENABLED = os.getenv("FINGERPRINT_ENABLED", "true").lower() == "true"
+# 同一とみなすビット誤り率の上限（別の録音同士は約0.5）
+FINGERPRINT_MAX_BIT_ERROR_RATE = float(os.getenv("FINGERPRINT_MAX_BIT_ERROR_RATE", "0.25"))
+# 先頭・末尾のトリミングを許容する時間（秒）
+FINGERPRINT_MAX_OFFSET_SECONDS = float(os.getenv("FINGERPRINT_MAX_OFFSET_SECONDS", "30"))
+# 再利用する範囲（owner: 同じユーザーの議事録のみ / all: 全ユーザー）
+FINGERPRINT_SCOPE = os.getenv("FINGERPRINT_SCOPE", "owner").lower()
+# 区間ハッシュの区間の長さ（秒）
+FINGERPRINT_SEGMENT_SECONDS = int(os.getenv("FINGERPRINT_SEGMENT_SECONDS", "30"))
+# 続きの録音とみなす追加部分の長さの下限（秒、これより短い差は同一録音として扱う）
+CONTINUATION_MIN_TAIL_SECONDS = float(os.getenv("CONTINUATION_MIN_TAIL_SECONDS", "60"))
+# 続きの録音の追加部分を解析する時に、前回の録音の末尾から重ねて含める時間（秒、話の途中で切らないため）
+CONTINUATION_OVERLAP_SECONDS = 5
+# Firestoreのコレクション名
+FINGERPRINT_FIRESTORE_COLLECTION = os.getenv("FINGERPRINT_FIRESTORE_COLLECTION", "minutes_fingerprints")
+
+# 解析のサンプルレート・フレーム長・フレーム間隔（サンプル数）
+SAMPLE_RATE = 16000
+FRAME_SIZE = 8192
+HOP_SIZE = 1024
+# 帯域の範囲（会話音声の主な帯域、Hz）と帯域数（ビット数は帯域数-1）
+BAND_MIN_HZ = 300
+BAND_MAX_HZ = 4000
+BAND_COUNT = 16
+# 末尾のこの時間に掛かる区間はエンコーダーの終端処理で変わりうるためハッシュに含めない（秒）
+SEGMENT_END_MARGIN_SECONDS = 1.0
+# 無音とみなすフレームの平均二乗振幅（約-70dBFS）と、指紋を作る有音フレームの割合の下限
+SILENCE_MEAN_SQUARE = 1e-7
+MIN_ACTIVE_RATIO = 0.5
+# Firestoreのドキュメントに保存する指紋の上限（ドキュメントの上限は1MiB）
+FIRESTORE_MAX_FINGERPRINT_BYTES = 900 * 1024
+# 再生位置のずれの探索に使う先頭フレーム数
+OFFSET_SEARCH_FRAMES = 2000
+# 重なっている部分が長い方の録音に占める割合の下限
+MIN_OVERLAP_RATIO = 0.9
+
+
+class AudioFingerprint:
+    """音声の指紋（フレームごとに15ビット）"""
+
+    def __init__(self, frames, duration_seconds: float, segments: Optional[List[str]] = None):
+        """
+        Args:
+            frames: フレームごとのビット列（uint16の配列）
+            duration_seconds: 音声の長さ（秒）
+            segments: 先頭からの区間ごとのPCMのハッシュ
+        """
+        self.frames = frames
+        self.duration_seconds = duration_seconds
+        self.segments = segments or []
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def to_bytes(self) -> bytes:
+        return self.frames.astype("<u2").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, duration_seconds: float) -> "AudioFingerprint":
+        return cls(np.frombuffer(data, dtype="<u2").astype(np.uint16), duration_seconds)
+
+    def compare(self, other: "AudioFingerprint",
+                max_offset_seconds: float = FINGERPRINT_MAX_OFFSET_SECONDS) -> Tuple[float, float, float]:
+        """
+        もう一方の指紋との一致度
+
+        Args:
+            other: 比較する指紋
+            max_offset_seconds: 探索する再生位置のずれ（秒）
+
+        Returns:
+            (ビット誤り率, 再生位置のずれ（秒）, 重なりの割合)
+        """
+        if not len(self) or not len(other):
+            return 1.0, 0.0, 0.0
+        max_offset = int(max_offset_seconds * SAMPLE_RATE / HOP_SIZE)
+        # 先頭部分でずれを探索し、最も一致するずれで全体を比較
+        best_offset, best_rate = 0, 1.0
+        for offset in range(-max_offset, max_offset + 1):
+            a, b = _aligned(self.frames, other.frames, offset, OFFSET_SEARCH_FRAMES)
+            if len(a) < min(OFFSET_SEARCH_FRAMES, len(self), len(other)) // 2:
+                continue
+            rate = _bit_error_rate(a, b)
+            if rate < best_rate:
+                best_offset, best_rate = offset, rate
+
+        a, b = _aligned(self.frames, other.frames, best_offset)
+        overlap = len(a) / max(len(self), len(other))
+        return _bit_error_rate(a, b), best_offset * HOP_SIZE / SAMPLE_RATE, overlap
+
+
+def _aligned(a, b, offset: int, limit: Optional[int] = None):
+    """ずれ（aに対するbの開始位置）を合わせて重なる部分を切り出す"""
+    if offset >= 0:
+        a = a[offset:]
+    else:
+        b = b[-offset:]
+    length = min(len(a), len(b))
+    if limit is not None:
+        length = min(length, limit)
+    return a[:length], b[:length]
+
+
+def _bit_error_rate(a, b) -> float:
+    if not len(a):
+        return 1.0
+    diff = np.bitwise_xor(a, b).view(np.uint8)
+    return float(np.unpackbits(diff).sum()) / (len(a) * (BAND_COUNT - 1))
+
+
+class FingerprintBuilder:
+    """16kHzモノラルのPCMを少しずつ受け取って指紋を作成（保持するのはビット列のみ）"""
+
+    def __init__(self):
+        self._window = np.hanning(FRAME_SIZE).astype(np.float32)
+        # FFTの周波数ビン → 帯域の集計行列（帯域エネルギーを行列積でまとめて計算）
+        frequencies = np.fft.rfftfreq(FRAME_SIZE, 1.0 / SAMPLE_RATE)
+        band_index = np.digitize(frequencies, np.geomspace(BAND_MIN_HZ, BAND_MAX_HZ, BAND_COUNT + 1)) - 1
+        self._bands = np.zeros((len(frequencies), BAND_COUNT), dtype=np.float32)
+        in_range = (band_index >= 0) & (band_index < BAND_COUNT)
+        self._bands[np.nonzero(in_range)[0], band_index[in_range]] = 1.0
+        self._weights = (1 << np.arange(BAND_COUNT - 1)).astype(np.uint16)
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._last_diff = None
+        self._frames: List = []
+        self._samples = 0
+        self._total_frames = 0
+        self._active_frames = 0
+        self._segment_samples = FINGERPRINT_SEGMENT_SECONDS * SAMPLE_RATE
+        self._segment_hash = hashlib.sha1()
+        self._segment_filled = 0
+        self._segments: List[str] = []
+
+    def add(self, samples):
+        """
+        PCMを追加
+
+        Args:
+            samples: 16kHzモノラルのサンプル（float32、-1〜1）
+        """
+        self._samples += len(samples)
+        self._hash_segments(samples)
+        buffer = np.concatenate([self._pending, samples])
+        count = 0 if len(buffer) < FRAME_SIZE else (len(buffer) - FRAME_SIZE) // HOP_SIZE + 1
+        self._pending = buffer[count * HOP_SIZE:]
+        if not count:
+            return
+
+        # フレームをまとめて切り出してFFT（ループせずにベクトル化）
+        index = np.arange(FRAME_SIZE)[None, :] + HOP_SIZE * np.arange(count)[:, None]
+        frames = buffer[index]
+        self._total_frames += count
+        self._active_frames += int(np.count_nonzero(np.mean(frames ** 2, axis=1) > SILENCE_MEAN_SQUARE))
+        spectrum = np.abs(np.fft.rfft(frames * self._window, axis=1)) ** 2
+        energies = np.log(spectrum @ self._bands + 1e-10)
+
+        # 隣接帯域のエネルギー差の時間変化の符号（音量・音質の違いに影響されにくい）
+        band_diff = energies[:, :-1] - energies[:, 1:]
+        if self._last_diff is not None:
+            band_diff = np.vstack([self._last_diff, band_diff])
+        self._last_diff = band_diff[-1:]
+        bits = (band_diff[1:] - band_diff[:-1]) > 0
+        self._frames.append((bits.astype(np.uint16) * self._weights).sum(axis=1).astype(np.uint16))
+
+    def _hash_segments(self, samples):
+        """区間の境界で区切ってPCMをハッシュ化（受け取る単位に関係なく同じ区間になる）"""
+        data = samples.astype("<f4")
+        position = 0
+        while position < len(data):
+            take = min(self._segment_samples - self._segment_filled, len(data) - position)
+            self._segment_hash.update(data[position:position + take].tobytes())
+            self._segment_filled += take
+            position += take
+            if self._segment_filled == self._segment_samples:
+                self._segments.append(self._segment_hash.hexdigest()[:16])
+                self._segment_hash = hashlib.sha1()
+                self._segment_filled = 0
+
+    def build(self) -> AudioFingerprint:
+        """
+        指紋を作成
+
+        Returns:
+            指紋
+        """
+        duration = self._samples / SAMPLE_RATE
+        if self._total_frames < 2 or self._active_frames < self._total_frames * MIN_ACTIVE_RATIO:
+            # 無音がほとんどの録音は別の録音とも一致してしまうため指紋を作らない
+            return AudioFingerprint(np.zeros(0, dtype=np.uint16), duration)
+        complete = int((duration - SEGMENT_END_MARGIN_SECONDS) // FINGERPRINT_SEGMENT_SECONDS)
+        return AudioFingerprint(np.concatenate(self._frames), duration, self._segments[:max(0, complete)])
+
+
+def find_best_match(fingerprint: AudioFingerprint,
+                    candidates: Iterable[Tuple[str, AudioFingerprint]],
+                    max_bit_error_rate: float = FINGERPRINT_MAX_BIT_ERROR_RATE) -> Optional[Dict]:
+    """
+    候補の中から同じ録音を探す
+
+    Args:
+        fingerprint: 検索する指紋
+        candidates: (議事録ID, 指紋) の一覧
+        max_bit_error_rate: 同一とみなすビット誤り率の上限
+
+    Returns:
+        最も一致した議事録（議事録ID・ビット誤り率・ずれ）、見つからない場合はNone
+    """
+    best = None
+    for minutes_id, candidate in candidates:
+        rate, offset, overlap = fingerprint.compare(candidate)
+        if rate <= max_bit_error_rate and overlap >= MIN_OVERLAP_RATIO:
+            if best is None or rate < best["bit_error_rate"]:
+                best = {
+                    "minutes_id": minutes_id,
+                    "bit_error_rate": round(rate, 4),
+                    "offset_seconds": round(offset, 2),
+                    "overlap": round(overlap, 3),
+                }
+    return best
+
+
+class FingerprintIndex(ABC):
+    """議事録ごとの指紋の保存先"""
+
+    @abstractmethod
+    def add(self, minutes_id: str, owner: Optional[str], fingerprint: AudioFingerprint):
+        """
+        議事録の指紋を登録
+
+        Args:
+            minutes_id: 議事録ID
+            owner: 議事録の作成ユーザー
+            fingerprint: 指紋
+        """
+
+    @abstractmethod
+    def _candidates(self, owner: Optional[str], min_duration: float,
+                    max_duration: float) -> Iterable[Tuple[str, AudioFingerprint]]:
+        """長さが近い指紋の一覧"""
+
+    @abstractmethod
+    def _prefix_candidates(self, owner: Optional[str], first_segment: str,
+                           max_duration: float) -> Iterable[Tuple[str, float, List[str]]]:
+        """先頭の区間ハッシュが同じで、指定より短い録音の (議事録ID, 長さ, 区間ハッシュ) の一覧"""
+
+    def find_continued(self, fingerprint: AudioFingerprint, owner: Optional[str]) -> Optional[Dict]:
+        """
+        この録音が先頭に含む（続きを録音する前の）録音の議事録を検索
+
+        Args:
+            fingerprint: 指紋
+            owner: ユーザー（FINGERPRINT_SCOPE=owner の場合はこのユーザーの議事録のみ対象）
+
+        Returns:
+            最も長く一致した議事録（議事録ID・一致した録音の長さ・区間数）、見つからない場合はNone
+        """
+        if not fingerprint.segments:
+            return None
+        best = None
+        candidates = self._prefix_candidates(
+            owner if FINGERPRINT_SCOPE == "owner" else None,
+            fingerprint.segments[0],
+            fingerprint.duration_seconds - CONTINUATION_MIN_TAIL_SECONDS,
+        )
+        for minutes_id, duration, segments in candidates:
+            if not segments or fingerprint.segments[:len(segments)] != segments:
+                continue
+            if best is None or duration > best["duration_seconds"]:
+                best = {"minutes_id": minutes_id, "duration_seconds": duration, "segments": len(segments)}
+        return best
+
+    def find_match(self, fingerprint: AudioFingerprint, owner: Optional[str]) -> Optional[Dict]:
+        """
+        同じ録音の議事録を検索
+
+        Args:
+            fingerprint: 指紋
+            owner: ユーザー（FINGERPRINT_SCOPE=owner の場合はこのユーザーの議事録のみ対象）
+
+        Returns:
+            一致した議事録（議事録ID・ビット誤り率・ずれ）、見つからない場合はNone
+        """
+        # トリミングされた分だけ長さが異なる場合も対象にする
+        tolerance = max(FINGERPRINT_MAX_OFFSET_SECONDS, fingerprint.duration_seconds * 0.02)
+        candidates = self._candidates(
+            owner if FINGERPRINT_SCOPE == "owner" else None,
+            fingerprint.duration_seconds - tolerance,
+            fingerprint.duration_seconds + tolerance,
+        )
+        return find_best_match(fingerprint, candidates)
+
+
+class SQLiteFingerprintIndex(FingerprintIndex):
+    """SQLiteに保存（議事録と同じデータベースファイル）"""
+
+    def __init__(self, path: str = MINUTES_DB_PATH):
+        """
+        Args:
+            path: データベースファイルのパス
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS minutes_fingerprints (
+                    minutes_id TEXT PRIMARY KEY,
+                    owner TEXT,
+                    duration_seconds REAL NOT NULL,
+                    fingerprint BLOB NOT NULL,
+                    first_segment TEXT,
+                    segments TEXT
+                )
+                """
+            )
+            # 区間ハッシュ追加前に作成したデータベースの移行
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(minutes_fingerprints)")}
+            for column in ("first_segment", "segments"):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE minutes_fingerprints ADD COLUMN {column} TEXT")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_fingerprints_first_segment ON minutes_fingerprints (first_segment)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_fingerprints_duration ON minutes_fingerprints (duration_seconds)"
+            )
+
+    def add(self, minutes_id: str, owner: Optional[str], fingerprint: AudioFingerprint):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO minutes_fingerprints "
+                "(minutes_id, owner, duration_seconds, fingerprint, first_segment, segments) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    minutes_id, owner, fingerprint.duration_seconds, fingerprint.to_bytes(),
+                    fingerprint.segments[0] if fingerprint.segments else None, ",".join(fingerprint.segments),
+                ),
+            )
+
+    def _candidates(self, owner: Optional[str], min_duration: float,
+                    max_duration: float) -> Iterable[Tuple[str, AudioFingerprint]]:
+        query = "SELECT minutes_id, duration_seconds, fingerprint FROM minutes_fingerprints " \
+                "WHERE duration_seconds BETWEEN ? AND ?"
+        params: list = [min_duration, max_duration]
+        if owner is not None:
+            query += " AND owner = ?"
+            params.append(owner)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        for minutes_id, duration, data in rows:
+            yield minutes_id, AudioFingerprint.from_bytes(data, duration)
+
+    def _prefix_candidates(self, owner: Optional[str], first_segment: str,
+                           max_duration: float) -> Iterable[Tuple[str, float, List[str]]]:
+        query = "SELECT minutes_id, duration_seconds, segments FROM minutes_fingerprints " \
+                "WHERE first_segment = ? AND duration_seconds <= ?"
+        params: list = [first_segment, max_duration]
+        if owner is not None:
+            query += " AND owner = ?"
+            params.append(owner)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        for minutes_id, duration, segments in rows:
+            yield minutes_id, duration, segments.split(",") if segments else []
+
+
+class FirestoreFingerprintIndex(FingerprintIndex):
+    """Firestoreに保存（1時間の録音で約110KB、ドキュメントの上限を超える長時間の録音は登録しない）"""
+
+    def __init__(self, collection: str = FINGERPRINT_FIRESTORE_COLLECTION):
+        """
+        Args:
+            collection: コレクション名
+        """
+        from google.cloud import firestore
+
+        self._collection = firestore.Client().collection(collection)
+
+    def add(self, minutes_id: str, owner: Optional[str], fingerprint: AudioFingerprint):
+        data = fingerprint.to_bytes()
+        if len(data) > FIRESTORE_MAX_FINGERPRINT_BYTES:
+            logger.info(f"指紋が大きすぎるため登録しません: {minutes_id} ({len(data)} bytes)")
+            return
+        self._collection.document(minutes_id).set({
+            "minutes_id": minutes_id,
+            "owner": owner,
+            "duration_seconds": fingerprint.duration_seconds,
+            "fingerprint": data,
+            "first_segment": fingerprint.segments[0] if fingerprint.segments else None,
+            "segments": fingerprint.segments,
+        })
+
+    def _candidates(self, owner: Optional[str], min_duration: float,
+                    max_duration: float) -> Iterable[Tuple[str, AudioFingerprint]]:
+        query = self._collection.where("duration_seconds", ">=", min_duration) \
+            .where("duration_seconds", "<=", max_duration)
+        if owner is not None:
+            query = query.where("owner", "==", owner)
+        for snapshot in query.stream():
+            data = snapshot.to_dict()
+            yield data["minutes_id"], AudioFingerprint.from_bytes(data["fingerprint"], data["duration_seconds"])
+
+    def _prefix_candidates(self, owner: Optional[str], first_segment: str,
+                           max_duration: float) -> Iterable[Tuple[str, float, List[str]]]:
+        # 等価条件のみで検索し（複合インデックス不要）、長さは取得後に判定
+        query = self._collection.where("first_segment", "==", first_segment)
+        if owner is not None:
+            query = query.where("owner", "==", owner)
+        for snapshot in query.select(["minutes_id", "duration_seconds", "segments"]).stream():
+            data = snapshot.to_dict()
+            if data["duration_seconds"] <= max_duration:
+                yield data["minutes_id"], data["duration_seconds"], data.get("segments") or []
+
+
+def create_fingerprint_index() -> Optional[FingerprintIndex]:
+    """
+    議事録の保存先（MINUTES_STORE）に合わせて指紋の保存先を作成
+
+    Returns:
+        指紋の保存先（無効の場合はNone）
+    """
+    if not FINGERPRINT_ENABLED or not NUMPY_AVAILABLE or MINUTES_STORE == "none":
+        return None
+    if MINUTES_STORE == "firestore":
+        return FirestoreFingerprintIndex()
+    return SQLiteFingerprintIndex()
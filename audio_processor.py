@@ -1,27 +1,36 @@
 """
 音声ファイルの圧縮処理モジュール
-PyDubまたはffmpegを使用してファイルを圧縮
+ffmpegを使用してファイルを圧縮（ffmpegがない場合はWAVを窓ごとに変換・圧縮）
 """
 import os
 import tempfile
 import logging
-from typing import List
+from typing import List, Optional
 import shutil
 import subprocess
+import wave
+from functools import lru_cache
+
+from transcode_pool import transcode_pool
+from audio_fingerprint import SAMPLE_RATE, AudioFingerprint, FingerprintBuilder
+from pcm_stream import NUMPY_AVAILABLE, iter_wav_pcm
+from tracing import tracer, set_span_attributes
 
 logger = logging.getLogger(__name__)
 
-# Python 3.13のaudioop問題への対応
+# ffmpegがない場合のMP3エンコーダー（未インストールの場合は16kHzモノラルのWAVで出力）
 try:
-    from pydub import AudioSegment
-    PYDUB_AVAILABLE = True
-    logger.info("PyDubを使用した音声処理が利用可能です")
-except (ImportError, ModuleNotFoundError) as e:
-    PYDUB_AVAILABLE = False
-    logger.warning(f"PyDubが利用できません: {str(e)}. ffmpegでの処理を試みます")
-    AudioSegment = None
-
-# ffmpegの利用可能性をチェック
+    import lameenc
+    LAMEENC_AVAILABLE = True
+except ImportError:
+    lameenc = None
+    LAMEENC_AVAILABLE = False
+
+# ffmpegがない場合に、WAVを窓ごとにモノラル化・16kHzに変換して圧縮（録音全体をメモリに載せない）
+WINDOWED_FALLBACK_ENABLED = NUMPY_AVAILABLE
+
+# ffmpegの利用可能性をチェック（起動時間短縮のため初回利用時に判定して結果をキャッシュ）
+@lru_cache(maxsize=None)
 def check_ffmpeg_available() -> tuple:
     """
     ffmpegが利用可能かチェック
@@ -46,33 +55,63 @@ def check_ffmpeg_available() -> tuple:
                 timeout=5
             )
             if result.returncode == 0:
+                logger.info(f"ffmpegを使用した音声処理が利用可能です: {ffmpeg_path}")
                 return (True, ffmpeg_path)
         except (FileNotFoundError, subprocess.TimeoutExpired):
             continue
 
+    logger.warning("ffmpegが利用できません")
     return (False, None)
 
-FFMPEG_AVAILABLE, FFMPEG_PATH = check_ffmpeg_available()
-if FFMPEG_AVAILABLE:
-    logger.info(f"ffmpegを使用した音声処理が利用可能です: {FFMPEG_PATH}")
-else:
-    logger.warning("ffmpegが利用できません")
+@lru_cache(maxsize=None)
+def check_ffprobe_available() -> tuple:
+    """
+    ffmpegと同じ場所にあるffprobeが利用可能かチェック
+
+    Returns:
+        (利用可能かどうか, ffprobeコマンドのパス)
+    """
+    _, ffmpeg_path = check_ffmpeg_available()
+    if not ffmpeg_path:
+        return (False, None)
+
+    directory, name = os.path.split(ffmpeg_path)
+    ffprobe_path = os.path.join(directory, name.replace('ffmpeg', 'ffprobe'))
+    try:
+        result = subprocess.run(
+            [ffprobe_path, '-version'],
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
+        if result.returncode == 0:
+            return (True, ffprobe_path)
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        pass
+
+    return (False, None)
 
 class AudioProcessor:
     TARGET_BITRATE = "64k"
     TARGET_SAMPLE_RATE = 16000
 
     def __init__(self):
-        """AudioProcessorの初期化"""
-        self.temp_files = []
+        """AudioProcessorの初期化（ffmpegの利用可否をここで判定）"""
+        check_ffmpeg_available()
+        check_ffprobe_available()
 
-    def process_audio(self, file_path: str) -> List[str]:
+    @tracer.traced("audio.process_audio")
+    def process_audio(self, file_path: str, duration_seconds: Optional[float] = None,
+                      output_dir: Optional[str] = None) -> List[str]:
         """
         音声ファイルを処理（圧縮のみ、分割なし）
         メモリ効率のため、ffmpegを優先使用
+        出力ファイルの削除は呼び出し側の責任（output_dirにジョブ用作業ディレクトリを渡す）
 
         Args:
             file_path: 入力音声ファイルのパス
+            duration_seconds: 再生時間（秒）。ffmpegキューの優先度に使用（省略時は計測）
+            output_dir: 出力先ディレクトリ（省略時はシステムの一時ディレクトリ）
 
         Returns:
             処理済み音声ファイルのパスのリスト（1ファイルのみ）
@@ -81,87 +120,278 @@ class AudioProcessor:
             file_size = os.path.getsize(file_path)
             file_size_mb = file_size / (1024 * 1024)
             logger.info(f"入力ファイルサイズ: {file_size_mb:.2f} MB")
+            set_span_attributes(input_bytes=file_size)
 
             # 大きなファイル（50MB以上）または常にffmpegを優先使用（メモリ効率が良い）
-            if FFMPEG_AVAILABLE:
+            ffmpeg_available, _ = check_ffmpeg_available()
+            if ffmpeg_available:
                 logger.info("ffmpegを使用してファイルを圧縮します（メモリ効率優先）")
-                return [self._compress_with_ffmpeg(file_path)]
-
-            # ffmpegが使えない場合のみPyDubを使用
-            if PYDUB_AVAILABLE:
-                logger.info("PyDubを使用してファイルを圧縮します")
-                # PyDubで音声ファイルを読み込み
-                audio = AudioSegment.from_file(file_path)
-                duration_minutes = len(audio) / (1000 * 60)
-                logger.info(
-                    f"音声情報 - 長さ: {duration_minutes:.2f}分, "
-                    f"チャンネル: {audio.channels}, サンプルレート: {audio.frame_rate}Hz"
-                )
-
-                # 圧縮処理
-                logger.info("音声ファイルを圧縮します（モノラル、16kHz）")
-                audio = self._compress_audio(audio)
-
-                # 圧縮済みファイルを出力
-                output_path = tempfile.mktemp(suffix=".mp3")
-                audio.export(output_path, format="mp3", bitrate=self.TARGET_BITRATE)
-                output_size = os.path.getsize(output_path)
-                logger.info(f"圧縮完了 - 出力サイズ: {output_size / (1024 * 1024):.2f} MB")
-                self.temp_files.append(output_path)
-
-                # メモリ解放
-                del audio
-
-                return [output_path]
-
-            # どちらも使えない場合
-            logger.warning("音声処理機能が無効のため、元のファイルをそのまま使用します")
+                if duration_seconds is None:
+                    duration_seconds = self.get_duration(file_path)
+                return [self._compress_with_ffmpeg(file_path, duration_seconds, output_dir)]
+
+            # ffmpegが使えない場合は、WAVを窓ごとに変換して圧縮（メモリ使用量は録音の長さに関係なく一定）
+            if WINDOWED_FALLBACK_ENABLED:
+                output_path = self._compress_windowed(file_path, output_dir)
+                if output_path is not None:
+                    return [output_path]
+
+            # 圧縮できない場合
+            logger.warning("音声を圧縮できないため、元のファイルをそのまま使用します")
             _, ext = os.path.splitext(file_path)
-            output_path = tempfile.mktemp(suffix=ext)
+            output_path = self._new_output_path(ext, output_dir)
             shutil.copy2(file_path, output_path)
-            self.temp_files.append(output_path)
             return [output_path]
 
         except Exception as e:
             logger.error(f"音声処理エラー: {str(e)}")
             raise
 
-    def _compress_audio(self, audio: AudioSegment) -> AudioSegment:
+    def _new_output_path(self, suffix: str, output_dir: Optional[str] = None) -> str:
+        """
+        出力ファイルのパスを生成
+
+        Args:
+            suffix: 拡張子
+            output_dir: 出力先ディレクトリ（省略時はシステムの一時ディレクトリ）
+
+        Returns:
+            出力ファイルのパス
+        """
+        fd, output_path = tempfile.mkstemp(suffix=suffix, prefix="processed-", dir=output_dir)
+        os.close(fd)
+        return output_path
+
+    @tracer.traced("audio.get_duration")
+    def get_duration(self, file_path: str) -> Optional[float]:
+        """
+        音声ファイルの再生時間を取得（ffprobe優先、WAVは標準ライブラリで判定）
+
+        Args:
+            file_path: 音声ファイルのパス
+
+        Returns:
+            再生時間（秒）。取得できない場合はNone
+        """
+        ffprobe_available, ffprobe_path = check_ffprobe_available()
+        if ffprobe_available:
+            cmd = [
+                ffprobe_path,
+                '-v', 'error',
+                '-show_entries', 'format=duration',
+                '-of', 'default=noprint_wrappers=1:nokey=1',
+                file_path
+            ]
+            try:
+                result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+                if result.returncode == 0 and result.stdout.strip():
+                    return float(result.stdout.strip())
+                logger.warning(f"ffprobeエラー: {result.stderr}")
+            except (subprocess.TimeoutExpired, ValueError) as e:
+                logger.warning(f"再生時間の取得に失敗しました: {str(e)}")
+
+        try:
+            with wave.open(file_path, 'rb') as wav:
+                return wav.getnframes() / float(wav.getframerate())
+        except (wave.Error, EOFError, OSError):
+            pass
+
+        logger.warning(f"再生時間を取得できません: {file_path}")
+        return None
+
+    @tracer.traced("audio.extract_tail")
+    def extract_tail(self, file_path: str, start_seconds: float,
+                     output_dir: Optional[str] = None,
+                     duration_seconds: Optional[float] = None) -> Optional[str]:
+        """
+        音声の途中から末尾までを切り出し（続きの録音の追加部分のみ解析する場合に使用）
+        ffmpegが使えない場合はWAVのみ標準ライブラリで切り出し
+
+        Args:
+            file_path: 音声ファイルのパス
+            start_seconds: 切り出しの開始位置（秒）
+            output_dir: 出力先ディレクトリ
+            duration_seconds: 音声全体の再生時間（切り出す長さを実行枠の優先度に使用）
+
+        Returns:
+            切り出した音声ファイルのパス（切り出せない場合はNone）
+        """
+        ffmpeg_available, ffmpeg_path = check_ffmpeg_available()
+        if ffmpeg_available:
+            output_path = self._new_output_path(".mp3", output_dir)
+            cmd = [
+                ffmpeg_path,
+                '-ss', f"{start_seconds:.3f}",
+                '-i', file_path,
+                '-c:a', 'libmp3lame',
+                '-b:a', self.TARGET_BITRATE,
+                '-ar', str(self.TARGET_SAMPLE_RATE),
+                '-ac', '1',
+                '-y',
+                output_path
+            ]
+            # 優先度は切り出す末尾部分の長さ（短い追加部分を全体の長さで後回しにしない）
+            tail_seconds = max(0.0, duration_seconds - start_seconds) if duration_seconds is not None else None
+            result = transcode_pool.run(cmd, duration_seconds=tail_seconds, timeout=600)
+            if result.returncode != 0:
+                logger.warning(f"音声の切り出しエラー: {result.stderr}")
+                os.unlink(output_path)
+                return None
+            return output_path
+
+        try:
+            with wave.open(file_path, 'rb') as source:
+                params = source.getparams()
+                source.setpos(min(params.nframes, int(start_seconds * params.framerate)))
+                output_path = self._new_output_path(".wav", output_dir)
+                with wave.open(output_path, 'wb') as output:
+                    output.setparams(params)
+                    while True:
+                        data = source.readframes(params.framerate * 30)
+                        if not data:
+                            break
+                        output.writeframes(data)
+            return output_path
+        except (wave.Error, EOFError, OSError):
+            logger.info(f"ffmpegが利用できないため、WAV以外は切り出せません: {file_path}")
+            return None
+
+    # 指紋作成時にPCMを読み込む単位（サンプル数、約30秒分）
+    FINGERPRINT_CHUNK_SAMPLES = SAMPLE_RATE * 30
+
+    @tracer.traced("audio.fingerprint")
+    def fingerprint(self, file_path: str) -> Optional[AudioFingerprint]:
+        """
+        音声の指紋を作成（16kHzモノラルにデコードして少しずつ解析）
+        ffmpegが使えない場合はWAVのみ標準ライブラリで読み込み
+
+        Args:
+            file_path: 音声ファイルのパス
+
+        Returns:
+            指紋（NumPyが無い・デコードできない場合はNone）
+        """
+        if not NUMPY_AVAILABLE:
+            return None
+        builder = FingerprintBuilder()
+        ffmpeg_available, ffmpeg_path = check_ffmpeg_available()
+        if ffmpeg_available:
+            if not self._fingerprint_with_ffmpeg(ffmpeg_path, file_path, builder):
+                return None
+        elif not self._fingerprint_wav(file_path, builder):
+            return None
+        fingerprint = builder.build()
+        set_span_attributes(fingerprint_frames=len(fingerprint))
+        return fingerprint
+
+    def _fingerprint_with_ffmpeg(self, ffmpeg_path: str, file_path: str, builder: FingerprintBuilder) -> bool:
+        """ffmpegで16kHzモノラルのPCMにデコードしながら指紋に追加"""
+        import numpy as np
+
+        cmd = [
+            ffmpeg_path,
+            '-v', 'error',
+            '-i', file_path,
+            '-f', 's16le',
+            '-ac', '1',
+            '-ar', str(SAMPLE_RATE),
+            'pipe:1'
+        ]
+        chunk_bytes = self.FINGERPRINT_CHUNK_SAMPLES * 2
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+            try:
+                while True:
+                    data = process.stdout.read(chunk_bytes)
+                    if not data:
+                        break
+                    samples = np.frombuffer(data[:len(data) // 2 * 2], dtype="<i2")
+                    builder.add(samples.astype(np.float32) / 32768.0)
+                stderr = process.stderr.read()
+                process.wait(timeout=30)
+            except Exception:
+                process.kill()
+                raise
+        if process.returncode != 0:
+            logger.warning(f"指紋作成のデコードエラー: {stderr.decode('utf-8', 'replace')[-500:]}")
+            return False
+        return True
+
+    def _fingerprint_wav(self, file_path: str, builder: FingerprintBuilder) -> bool:
+        """WAVを窓ごとに読み込み、モノラル化・16kHzに変換しながら指紋に追加"""
+        try:
+            for samples in iter_wav_pcm(file_path, SAMPLE_RATE):
+                builder.add(samples)
+            return True
+        except (wave.Error, EOFError, OSError):
+            logger.info(f"ffmpegが利用できないため、WAV以外は指紋を作成しません: {file_path}")
+            return False
+
+    def _compress_windowed(self, file_path: str, output_dir: Optional[str] = None) -> Optional[str]:
         """
-        音声ファイルを圧縮
+        WAVを一定時間ずつ読み込み、モノラル化・16kHzに変換して圧縮（ffmpegがない場合）
+        lameencがあればMP3、なければ16kHzモノラルのWAVで出力
 
         Args:
-            audio: 圧縮前の音声データ
+            file_path: 入力音声ファイルのパス
+            output_dir: 出力先ディレクトリ
 
         Returns:
-            圧縮後の音声データ
+            圧縮された音声ファイルのパス（WAV以外で変換できない場合はNone）
         """
-        # モノラル化
-        if audio.channels > 1:
-            logger.info("ステレオからモノラルに変換")
-            audio = audio.set_channels(1)
+        import numpy as np
 
-        # サンプリングレート変更
-        if audio.frame_rate != self.TARGET_SAMPLE_RATE:
-            logger.info(f"サンプリングレートを {audio.frame_rate}Hz から {self.TARGET_SAMPLE_RATE}Hz に変更")
-            audio = audio.set_frame_rate(self.TARGET_SAMPLE_RATE)
+        output_path = self._new_output_path(".mp3" if LAMEENC_AVAILABLE else ".wav", output_dir)
+        logger.info(f"WAVを窓ごとに変換して圧縮中...（出力: {'MP3' if LAMEENC_AVAILABLE else 'WAV'}）")
+        try:
+            with tracer.span("audio.compress_windowed", encoder="lameenc" if LAMEENC_AVAILABLE else "wav"):
+                windows = iter_wav_pcm(file_path, self.TARGET_SAMPLE_RATE)
+                if LAMEENC_AVAILABLE:
+                    encoder = lameenc.Encoder()
+                    encoder.set_bit_rate(int(self.TARGET_BITRATE.rstrip("k")))
+                    encoder.set_in_sample_rate(self.TARGET_SAMPLE_RATE)
+                    encoder.set_channels(1)
+                    encoder.set_quality(5)
+                    with open(output_path, "wb") as output:
+                        for samples in windows:
+                            pcm = np.clip(samples * 32767, -32768, 32767).astype("<i2")
+                            output.write(encoder.encode(pcm.tobytes()))
+                        output.write(encoder.flush())
+                else:
+                    with wave.open(output_path, "wb") as output:
+                        output.setnchannels(1)
+                        output.setsampwidth(2)
+                        output.setframerate(self.TARGET_SAMPLE_RATE)
+                        for samples in windows:
+                            pcm = np.clip(samples * 32767, -32768, 32767).astype("<i2")
+                            output.writeframes(pcm.tobytes())
+        except (wave.Error, EOFError) as e:
+            logger.info(f"ffmpegが利用できないため、WAV以外は圧縮できません: {str(e)}")
+            os.unlink(output_path)
+            return None
 
-        return audio
+        output_size = os.path.getsize(output_path)
+        logger.info(f"圧縮完了 - 出力サイズ: {output_size / (1024 * 1024):.2f} MB")
+        return output_path
 
-    def _compress_with_ffmpeg(self, file_path: str) -> str:
+    def _compress_with_ffmpeg(self, file_path: str, duration_seconds: Optional[float] = None,
+                              output_dir: Optional[str] = None) -> str:
         """
         ffmpegを使用して音声ファイルを圧縮
+        CPU数に合わせたワーカープール経由で実行（短い音声を優先）
 
         Args:
             file_path: 入力音声ファイルのパス
+            duration_seconds: 再生時間（秒）
+            output_dir: 出力先ディレクトリ
 
         Returns:
             圧縮された音声ファイルのパス
         """
-        output_path = tempfile.mktemp(suffix=".mp3")
+        output_path = self._new_output_path(".mp3", output_dir)
+        _, ffmpeg_path = check_ffmpeg_available()
 
         cmd = [
-            FFMPEG_PATH,
+            ffmpeg_path,
             '-i', file_path,
             '-c:a', 'libmp3lame',
             '-b:a', '64k',
@@ -173,35 +403,20 @@ class AudioProcessor:
 
         logger.info("ffmpegで音声ファイルを圧縮中...")
 
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=600  # 10分タイムアウト
-        )
+        with tracer.span("ffmpeg.compress", duration_seconds=duration_seconds):
+            result = transcode_pool.run(
+                cmd,
+                duration_seconds=duration_seconds,
+                timeout=600  # 10分タイムアウト（実行開始から）
+            )
 
         if result.returncode != 0:
             logger.error(f"ffmpegエラー: {result.stderr}")
+            if os.path.exists(output_path):
+                os.unlink(output_path)
             raise RuntimeError(f"音声圧縮に失敗しました")
 
         output_size = os.path.getsize(output_path)
         logger.info(f"圧縮完了 - 出力サイズ: {output_size / (1024 * 1024):.2f} MB")
 
-        self.temp_files.append(output_path)
         return output_path
-
-    def cleanup(self):
-        """一時ファイルのクリーンアップ"""
-        for temp_file in self.temp_files:
-            try:
-                if os.path.exists(temp_file):
-                    os.unlink(temp_file)
-                    logger.debug(f"一時ファイル削除: {temp_file}")
-            except Exception as e:
-                logger.warning(f"一時ファイル削除エラー: {temp_file} - {str(e)}")
-
-        self.temp_files.clear()
-
-    def __del__(self):
-        """デストラクタ - 一時ファイルのクリーンアップ"""
-        self.cleanup()
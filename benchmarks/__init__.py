@@ -0,0 +1,3 @@
+"""
+ベンチマーク（クラウド認証情報なしでローカル実行）
+"""
@@ -0,0 +1,325 @@
+"""
+ベンチマーク用のGCS・Gemini APIの代替実装
+実際のGeminiServiceのコードパス（アップロード → PROCESSING待機 → 生成）をそのまま通し、
+通信部分のみを設定可能な遅延で置き換える
+"""
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+# 固定の議事録出力（5セクション構成）
+CANNED_MINUTES = """1. 打合せ概要
+お客様のご要望を伺い、間取りと設備仕様について検討しました。
+
+2. 打合せ内容
+・【間取りについて】リビングを20畳に拡張したいとのご要望
+・【設備について】キッチンは品番ABC-1234、カラーはホワイトを希望
+・【予算について】総額3,500万円以内で調整
+
+3. 決定事項
+・キッチン仕様をABC-1234で確定
+
+4. 次回までの確認・準備事項
+【お客様】
+・外構プランのイメージ写真を準備
+【当社】
+・見積書の再作成
+
+5. 補足メモ
+特になし"""
+
+
+@dataclass
+class FakeLatency:
+    """代替実装の遅延設定（秒）"""
+    gcs_seconds_per_mb: float = 0.01
+    gemini_upload_seconds_per_mb: float = 0.05
+    gemini_processing_seconds: float = 2.0
+    gemini_generation_seconds_per_mb: float = 0.5
+    gemini_generation_min_seconds: float = 1.0
+
+
+class FakeBlob:
+    """google.cloud.storage.Blob の代替（メモリ上）"""
+
+    def __init__(self, bucket: "FakeBucket", name: str, generation: Optional[int] = None):
+        self.bucket = bucket
+        self.name = name
+        # 一覧取得・reload() 時点の世代（bucket.blob() で作成した場合はNone）
+        self.generation = generation
+
+    @property
+    def _entry(self) -> Dict:
+        entry = self.bucket._objects.get(self.name)
+        if entry is None:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        return entry
+
+    @property
+    def size(self) -> Optional[int]:
+        entry = self.bucket._objects.get(self.name)
+        return len(entry["data"]) if entry else None
+
+    @property
+    def time_created(self) -> Optional[datetime]:
+        entry = self.bucket._objects.get(self.name)
+        return entry["time_created"] if entry else None
+
+    @property
+    def updated(self) -> Optional[datetime]:
+        # 代替実装では上書き時に作成日時も更新されるため同じ値
+        return self.time_created
+
+    def exists(self) -> bool:
+        return self.name in self.bucket._objects
+
+    def reload(self):
+        self.bucket._sleep(0)
+        self.generation = self._entry["generation"]
+
+    def _check_generation(self, if_generation_match: Optional[int]):
+        if if_generation_match is None:
+            return
+        entry = self.bucket._objects.get(self.name)
+        if (entry["generation"] if entry else 0) != if_generation_match:
+            raise PreconditionFailed(f"Generation mismatch: {self.bucket.name}/{self.name}")
+
+    def upload_from_string(self, data: bytes, content_type: Optional[str] = None,
+                           if_generation_match: Optional[int] = None):
+        self.bucket._sleep(len(data))
+        with self.bucket._lock:
+            self._check_generation(if_generation_match)
+            self.generation = self.bucket._next_generation()
+            self.bucket._objects[self.name] = {
+                "data": bytes(data),
+                "time_created": datetime.now(timezone.utc),
+                "generation": self.generation,
+            }
+
+    def upload_from_filename(self, filename: str, content_type: Optional[str] = None):
+        with open(filename, "rb") as f:
+            self.upload_from_string(f.read(), content_type)
+
+    def download_to_file(self, file_obj):
+        data = self._entry["data"]
+        self.bucket._sleep(len(data))
+        file_obj.write(data)
+
+    def download_as_bytes(self, if_generation_match: Optional[int] = None) -> bytes:
+        with self.bucket._lock:
+            self._check_generation(if_generation_match)
+            data = self._entry["data"]
+        self.bucket._sleep(len(data))
+        return data
+
+    def download_to_filename(self, filename: str):
+        with open(filename, "wb") as f:
+            self.download_to_file(f)
+
+    def delete(self):
+        with self.bucket._lock:
+            if self.bucket._objects.pop(self.name, None) is None:
+                raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+            self.bucket.delete_calls += 1
+
+
+class _FakePageIterator:
+    """list_blobs() の戻り値（ページ単位の反復に対応）"""
+
+    def __init__(self, bucket: "FakeBucket", names: List[Tuple[str, int]], page_size: int):
+        self._bucket = bucket
+        self._names = names
+        self._page_size = page_size
+        self.num_pages = 0
+
+    @property
+    def pages(self) -> Iterator[List[FakeBlob]]:
+        for i in range(0, len(self._names), self._page_size):
+            self.num_pages += 1
+            yield [
+                FakeBlob(self._bucket, name, generation)
+                for name, generation in self._names[i:i + self._page_size]
+            ]
+
+    def __iter__(self) -> Iterator[FakeBlob]:
+        for page in self.pages:
+            yield from page
+
+
+class _FakeClient:
+    """google.cloud.storage.Client の代替（バッチリクエストのみ）"""
+
+    def __init__(self):
+        self.batch_count = 0
+
+    @contextmanager
+    def batch(self, raise_exception: bool = True):
+        # 代替実装では各操作を即時実行し、バッチの回数のみ記録
+        self.batch_count += 1
+        yield self
+
+
+class FakeBucket:
+    """google.cloud.storage.Bucket の代替（メモリ上）"""
+
+    def __init__(self, name: str = "fake-bucket", latency: Optional[FakeLatency] = None):
+        self.name = name
+        self.latency = latency or FakeLatency()
+        self.client = _FakeClient()
+        self.delete_calls = 0
+        self._objects: Dict[str, Dict] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self, name)
+
+    def put(self, name: str, data: bytes, time_created: Optional[datetime] = None) -> FakeBlob:
+        """作成日時を指定してオブジェクトを追加（孤立ファイルの再現用）"""
+        with self._lock:
+            self._objects[name] = {
+                "data": bytes(data),
+                "time_created": time_created or datetime.now(timezone.utc),
+                "generation": self._next_generation(),
+            }
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix: Optional[str] = None, page_size: Optional[int] = None,
+                   **kwargs) -> _FakePageIterator:
+        with self._lock:
+            names = sorted(
+                (name, entry["generation"]) for name, entry in self._objects.items()
+                if not prefix or name.startswith(prefix)
+            )
+        return _FakePageIterator(self, names, page_size or 1000)
+
+    def _next_generation(self) -> int:
+        """オブジェクトの世代（書き込みごとに増加、ロックを保持して呼び出す）"""
+        self._generation += 1
+        return self._generation
+
+    def _sleep(self, size_bytes: int):
+        time.sleep(self.latency.gcs_seconds_per_mb * size_bytes / (1024 * 1024))
+
+
+class _FakeFile:
+    """Gemini Files API のファイル"""
+
+    def __init__(self, name: str, size_bytes: int, ready_at: float):
+        self.name = name
+        self.size_bytes = size_bytes
+        self.ready_at = ready_at
+
+    @property
+    def state(self):
+        return SimpleNamespace(name="PROCESSING" if time.time() < self.ready_at else "ACTIVE")
+
+
+class _FakeGenerativeModel:
+    """genai.GenerativeModel の代替"""
+
+    def __init__(self, fake: "FakeGenAI", model_name: str = "", system_instruction=None, **kwargs):
+        self._fake = fake
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+    def count_tokens(self, contents, **kwargs):
+        return SimpleNamespace(total_tokens=len(str(contents)))
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        size_bytes = 0
+        for part in contents if isinstance(contents, list) else [contents]:
+            if isinstance(part, _FakeFile):
+                size_bytes += part.size_bytes
+            elif isinstance(part, dict) and "data" in part:
+                size_bytes += len(part["data"])
+        latency = self._fake.latency
+        time.sleep(max(
+            latency.gemini_generation_min_seconds,
+            latency.gemini_generation_seconds_per_mb * size_bytes / (1024 * 1024)
+        ))
+        text = self._fake.output
+        return SimpleNamespace(
+            text=text,
+            candidates=[SimpleNamespace(finish_reason="FinishReason.STOP")],
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=size_bytes // 250,
+                cached_content_token_count=0,
+                candidates_token_count=len(text),
+            ),
+        )
+
+
+class FakeGenAI:
+    """google.generativeai モジュールの代替（GeminiServiceが使う関数のみ）"""
+
+    def __init__(self, latency: Optional[FakeLatency] = None, output: str = CANNED_MINUTES):
+        self.latency = latency or FakeLatency()
+        self.output = output
+        self._files: Dict[str, _FakeFile] = {}
+        self.types = SimpleNamespace(GenerationConfig=lambda **kwargs: kwargs)
+        fake = self
+
+        class GenerativeModel(_FakeGenerativeModel):
+            def __init__(self, model_name: str = "", **kwargs):
+                super().__init__(fake, model_name, **kwargs)
+
+            @classmethod
+            def from_cached_content(cls, cached_content, **kwargs):
+                return cls(cached_content.model)
+
+        self.GenerativeModel = GenerativeModel
+
+    def configure(self, **kwargs):
+        pass
+
+    def upload_file(self, path: str, **kwargs) -> _FakeFile:
+        size_bytes = os.path.getsize(path)
+        time.sleep(self.latency.gemini_upload_seconds_per_mb * size_bytes / (1024 * 1024))
+        name = f"files/{uuid.uuid4().hex[:12]}"
+        audio_file = _FakeFile(name, size_bytes, time.time() + self.latency.gemini_processing_seconds)
+        self._files[name] = audio_file
+        return audio_file
+
+    def get_file(self, name: str) -> _FakeFile:
+        return self._files[name]
+
+    def delete_file(self, name: str):
+        self._files.pop(name, None)
+
+
+class FakeCaching:
+    """google.generativeai.caching の代替（キャッシュ作成は常に失敗してフォールバック）"""
+
+    class CachedContent:
+        @staticmethod
+        def create(**kwargs):
+            raise RuntimeError("context caching is not available in the fake backend")
+
+
+def install_fake_gemini(latency: Optional[FakeLatency] = None, output: str = CANNED_MINUTES) -> FakeGenAI:
+    """
+    gemini_service モジュールのAPI呼び出しを代替実装に差し替え
+
+    Args:
+        latency: 遅延設定
+        output: 生成結果として返すテキスト
+
+    Returns:
+        差し替えた代替実装
+    """
+    import gemini_service
+
+    fake = FakeGenAI(latency, output)
+    gemini_service.genai = fake
+    gemini_service.caching = FakeCaching
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark-dummy-key")
+    return fake
@@ -0,0 +1,258 @@
+"""
+負荷ベンチマーク
+GCS・Gemini APIを代替実装に置き換えて main.app に同時リクエストを送り、
+エンドポイント・ステージごとのレイテンシ（p50/p95/p99）を計測
+
+使い方:
+    python -m benchmarks.load_benchmark --requests 20 --concurrency 4 --durations 60,600,1800
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import wave
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+# main のimport前に設定（実際の認証情報・ウォームアップを使わない）
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-dummy-key")
+os.environ.setdefault("WARMUP_ON_STARTUP", "false")
+os.environ.setdefault("TRACING_EXPORTER", "local")
+# 議事録・ワークキューの保存先は一時ディレクトリ（実行ごとに作り直す）
+_BENCH_DATA_DIR = tempfile.mkdtemp(prefix="minutes-bench-")
+os.environ.setdefault("MINUTES_DB_PATH", os.path.join(_BENCH_DATA_DIR, "minutes.sqlite3"))
+os.environ.setdefault("WORK_QUEUE_DB_PATH", os.path.join(_BENCH_DATA_DIR, "work_queue.sqlite3"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeBucket, FakeLatency, install_fake_gemini  # noqa: E402
+
+# 合成音声のサンプリングレート（16kHzモノラル16bit = 約1.9MB/分）
+SYNTHETIC_SAMPLE_RATE = 16000
+
+
+def synthetic_wav(duration_seconds: float, sample_rate: int = SYNTHETIC_SAMPLE_RATE) -> bytes:
+    """
+    指定した長さの無音WAVを作成
+
+    Args:
+        duration_seconds: 再生時間（秒）
+        sample_rate: サンプリングレート
+
+    Returns:
+        WAVファイルのバイト列
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b"\x00\x00" * int(duration_seconds * sample_rate))
+    return buffer.getvalue()
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近傍法によるパーセンタイル"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, Dict]:
+    """名前ごとの件数・p50/p95/p99・最大値"""
+    return {
+        name: {
+            "count": len(values),
+            "p50": round(percentile(values, 50), 4),
+            "p95": round(percentile(values, 95), 4),
+            "p99": round(percentile(values, 99), 4),
+            "max": round(max(values), 4),
+        }
+        for name, values in sorted(samples.items())
+    }
+
+
+def print_table(title: str, rows: Dict[str, Dict]):
+    print(f"\n{title}")
+    print(f"{'name':<36} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for name, row in rows.items():
+        print(f"{name:<36} {row['count']:>6} {row['p50']:>9.3f} {row['p95']:>9.3f} "
+              f"{row['p99']:>9.3f} {row['max']:>9.3f}")
+
+
+def configure_app(latency: FakeLatency, force_copy: bool):
+    """
+    main.app のGCS・Geminiを代替実装に差し替え
+
+    Args:
+        latency: 代替実装の遅延設定
+        force_copy: ffmpeg/窓ごとの変換を使わず圧縮をスキップするか
+
+    Returns:
+        (main モジュール, 代替バケット)
+    """
+    import main
+    import audio_processor
+    from gemini_service import GeminiService
+    from tracing import TracedBucket, tracer
+
+    install_fake_gemini(latency)
+    fake_bucket = FakeBucket(latency=latency)
+    main.bucket_service.override(TracedBucket(fake_bucket, tracer))
+    main.gemini_service_holder.override(GeminiService())
+
+    ffmpeg_available, _ = audio_processor.check_ffmpeg_available()
+    if force_copy or not ffmpeg_available:
+        # 圧縮せずにコピーするパスで計測
+        audio_processor.WINDOWED_FALLBACK_ENABLED = False
+        audio_processor.check_ffmpeg_available.cache_clear()
+        audio_processor.check_ffmpeg_available = lambda: (False, None)
+    return main, fake_bucket
+
+
+async def run_benchmark(args) -> Dict:
+    """
+    ベンチマークを実行
+
+    Args:
+        args: コマンドライン引数
+
+    Returns:
+        エンドポイント・ステージごとの集計結果
+    """
+    import httpx
+
+    latency = FakeLatency(
+        gcs_seconds_per_mb=args.gcs_seconds_per_mb,
+        gemini_upload_seconds_per_mb=args.gemini_upload_seconds_per_mb,
+        gemini_processing_seconds=args.gemini_processing_seconds,
+        gemini_generation_seconds_per_mb=args.gemini_generation_seconds_per_mb,
+        gemini_generation_min_seconds=args.gemini_generation_min_seconds,
+    )
+    main, fake_bucket = configure_app(latency, args.force_copy)
+    from tracing import tracer
+    from loop_monitor import loop_monitor
+
+    # ASGITransportではstartupイベントが実行されないため、ループ監視をここで開始
+    loop_monitor.start(asyncio.get_running_loop())
+
+    durations = [float(d) for d in args.durations.split(",")]
+    wav_cache = {duration: synthetic_wav(duration) for duration in durations}
+    # ユーザーごとの同時実行数上限があるため、リクエストを複数ユーザーに振り分け
+    user_headers = [
+        {"Authorization": f"Bearer {main.auth_service.create_access_token(data={'sub': f'benchmark-{i}'})}"}
+        for i in range(max(1, args.users))
+    ]
+
+    endpoint_samples: Dict[str, List[float]] = defaultdict(list)
+    stage_samples: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+
+        async def one_request(index: int):
+            duration = durations[index % len(durations)]
+            headers = user_headers[index % len(user_headers)]
+            blob_name = f"benchmark/{index:05d}_{int(duration)}s.wav"
+            fake_bucket.blob(blob_name).upload_from_string(wav_cache[duration], "audio/wav")
+            form = {
+                "blob_name": blob_name,
+                "created_date": "2026-01-01",
+                "creator": "ベンチマーク",
+                "customer_name": "テスト様",
+                "meeting_place": "本社",
+            }
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/api/upload", data=form, headers=headers)
+                endpoint_samples["POST /api/upload"].append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors[f"POST /api/upload {response.status_code}"] += 1
+                    return
+
+                job_id = response.headers.get("x-job-id")
+                timeline = tracer.job_timeline(job_id) if job_id else None
+                for entry in (timeline or {}).get("timeline", []):
+                    if entry["depth"] > 0 and entry["duration_seconds"] is not None:
+                        stage_samples[entry["name"]].append(entry["duration_seconds"])
+
+                if args.export:
+                    export_body = {
+                        "summary": response.json()["summary"],
+                        "metadata": {k: v for k, v in form.items() if k != "blob_name"},
+                        "format": args.export,
+                    }
+                    start = time.perf_counter()
+                    response = await client.post("/api/export", json=export_body, headers=headers)
+                    endpoint_samples[f"POST /api/export ({args.export})"].append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        errors[f"POST /api/export {response.status_code}"] += 1
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(one_request(i) for i in range(args.requests)))
+        wall_seconds = time.perf_counter() - wall_start
+    loop_monitor.stop()
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "users": args.users,
+        "durations": durations,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(args.requests / wall_seconds, 3) if wall_seconds else None,
+        "errors": dict(errors),
+        "endpoints": summarize(endpoint_samples),
+        "stages": summarize(stage_samples),
+        "event_loop_blocking": loop_monitor.report()["locations"],
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="議事録生成APIの負荷ベンチマーク（クラウド認証情報不要）")
+    parser.add_argument("--requests", type=int, default=20, help="送信するリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時実行数")
+    parser.add_argument("--users", type=int, default=4, help="リクエストを振り分けるユーザー数")
+    parser.add_argument("--durations", default="60,600,1800", help="合成音声の長さ（秒、カンマ区切り）")
+    parser.add_argument("--export", choices=["word", "pdf"], help="生成後にエクスポートも計測")
+    parser.add_argument("--force-copy", action="store_true", help="ffmpegがあっても圧縮をスキップ")
+    parser.add_argument("--gcs-seconds-per-mb", type=float, default=0.01)
+    parser.add_argument("--gemini-upload-seconds-per-mb", type=float, default=0.05)
+    parser.add_argument("--gemini-processing-seconds", type=float, default=2.0)
+    parser.add_argument("--gemini-generation-seconds-per-mb", type=float, default=0.5)
+    parser.add_argument("--gemini-generation-min-seconds", type=float, default=1.0)
+    parser.add_argument("--json", dest="json_path", help="結果をJSONファイルに保存")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    result = asyncio.run(run_benchmark(args))
+
+    print(f"requests={result['requests']} concurrency={result['concurrency']} "
+          f"wall={result['wall_seconds']}s throughput={result['throughput_rps']} req/s")
+    if result["errors"]:
+        print(f"errors: {result['errors']}")
+    print_table("Endpoints (seconds)", result["endpoints"])
+    print_table("Stages (seconds)", result["stages"])
+
+    if result["event_loop_blocking"]:
+        print("\nEvent loop blocking (count / total seconds)")
+        for row in result["event_loop_blocking"]:
+            print(f"{row['count']:>6} {row['total_seconds']:>9.3f}  {row['location']}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+ドキュメント生成・後処理のマイクロベンチマーク
+DocumentGenerator.generate_pdf / generate_word と GeminiService._remove_duplicate_lines を
+議事録の長さ別（small / medium / huge）に計測し、所要時間とピークメモリを出力
+
+使い方:
+    python -m benchmarks.render_benchmark
+    python -m benchmarks.render_benchmark --save-baseline baseline.json
+    python -m benchmarks.render_benchmark --compare baseline.json --threshold 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-dummy-key")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 議事録の長さ別フィクスチャ（各セクションの箇条書き数）
+FIXTURE_SIZES = {
+    "small": 3,
+    "medium": 40,
+    "huge": 700,
+}
+
+METADATA = {
+    "created_date": "2026-01-01",
+    "creator": "山田太郎",
+    "customer_name": "佐藤様",
+    "meeting_place": "本社ショールーム",
+}
+
+_TOPICS = ["間取り", "設備", "外構", "予算", "スケジュール", "電気配線", "収納", "内装"]
+_DETAILS = [
+    "リビングを20畳に拡張したいとのご要望。南側の掃き出し窓は幅2,600mmで検討",
+    "キッチンは品番ABC-1234、カラーはホワイト。食洗機は深型を希望",
+    "駐車場は2台分、カーポートの有無は次回までにご検討いただく",
+    "総額3,500万円以内で調整。**太陽光パネル**はオプションとして別途見積もり",
+    "着工は4月上旬、上棟は5月中旬を目安に工程を組む",
+    "コンセントは各部屋2口以上、書斎にはLAN配線を追加",
+]
+
+
+def minutes_fixture(items_per_section: int) -> str:
+    """
+    5セクション構成の議事録を作成（重複行・類似行を一定割合で含む）
+
+    Args:
+        items_per_section: 各セクションの箇条書き数
+
+    Returns:
+        議事録テキスト
+    """
+    lines = ["1. 打合せ概要", "お客様のご要望を伺い、間取りと設備仕様について検討しました。", ""]
+    lines.append("2. 打合せ内容")
+    for i in range(items_per_section):
+        topic = _TOPICS[i % len(_TOPICS)]
+        detail = _DETAILS[i % len(_DETAILS)]
+        lines.append(f"・【{topic}について】{detail}（{i + 1}）")
+        # 生成結果に混ざる繰り返し・言い換えを再現
+        if i % 7 == 0:
+            lines.append(f"・【{topic}について】{detail}（{i + 1}）")
+            lines.append(f"・【{topic}について】{detail}（{i + 1}）")
+        if i % 11 == 0:
+            lines.append(f"・【{topic}について】{detail}。")
+        if i % 5 == 0:
+            lines.append(f"{detail}。詳細は図面にて確認済み。")
+    lines.append("")
+    lines.append("3. 決定事項")
+    lines.extend(f"・{_DETAILS[i % len(_DETAILS)]}で確定（{i + 1}）" for i in range(max(1, items_per_section // 4)))
+    lines.append("")
+    lines.append("4. 次回までの確認・準備事項")
+    lines.append("【お客様】")
+    lines.extend(f"・{_TOPICS[i % len(_TOPICS)]}のイメージ写真を準備（{i + 1}）" for i in range(max(1, items_per_section // 4)))
+    lines.append("【当社】")
+    lines.extend(f"・{_TOPICS[i % len(_TOPICS)]}の見積書を再作成（{i + 1}）" for i in range(max(1, items_per_section // 4)))
+    lines.append("")
+    lines.append("5. 補足メモ")
+    lines.append("特になし")
+    return "\n".join(lines)
+
+
+def _measure(func: Callable[[], Optional[str]], repeat: int) -> Dict:
+    """
+    所要時間（repeat回の中央値・最小値）とピークメモリ（1回分）を計測
+
+    Args:
+        func: 計測する処理（ファイルを出力した場合はそのパスを返す）
+        repeat: 繰り返し回数
+
+    Returns:
+        計測結果
+    """
+    def _run_once():
+        output = func()
+        if isinstance(output, str) and os.path.isfile(output):
+            os.unlink(output)
+
+    # ウォームアップ（フォント読み込み・import等の初回コストを除外）
+    _run_once()
+
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _run_once()
+        timings.append(time.perf_counter() - start)
+
+    # tracemallocは処理を遅くするため時間計測とは別に実行
+    tracemalloc.start()
+    try:
+        _run_once()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_seconds": round(statistics.median(timings), 6),
+        "min_seconds": round(min(timings), 6),
+        "peak_memory_bytes": peak,
+    }
+
+
+def run_benchmarks(repeat: int, only: Optional[List[str]] = None) -> Dict[str, Dict]:
+    """
+    全ケースを計測
+
+    Args:
+        repeat: 各ケースの繰り返し回数
+        only: 計測するパス名（generate_pdf, generate_word, remove_duplicate_lines）
+
+    Returns:
+        「パス名/サイズ」ごとの計測結果
+    """
+    from document_generator import DocumentGenerator
+    from gemini_service import GeminiService
+
+    doc_generator = DocumentGenerator()
+    # API初期化を行わず後処理のみ使用
+    gemini_service = GeminiService.__new__(GeminiService)
+
+    paths = {
+        "generate_pdf": lambda text: doc_generator.generate_pdf(text, METADATA),
+        "generate_word": lambda text: doc_generator.generate_word(text, METADATA),
+        "remove_duplicate_lines": lambda text: gemini_service._remove_duplicate_lines(text) and None,
+    }
+
+    results: Dict[str, Dict] = {}
+    for path_name, func in paths.items():
+        if only and path_name not in only:
+            continue
+        for size_name, items in FIXTURE_SIZES.items():
+            text = minutes_fixture(items)
+            key = f"{path_name}/{size_name}"
+            try:
+                result = _measure(lambda: func(text), repeat)
+            except Exception as e:
+                result = {"error": f"{type(e).__name__}: {e}"}
+            result["input_chars"] = len(text)
+            results[key] = result
+    return results
+
+
+def compare_with_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict],
+                          threshold: float, memory_threshold: float) -> List[str]:
+    """
+    ベースラインと比較して劣化したケースを列挙
+
+    Args:
+        results: 今回の計測結果
+        baseline: ベースラインの計測結果
+        threshold: 許容する所要時間の増加率（0.2 = 20%）
+        memory_threshold: 許容するピークメモリの増加率
+
+    Returns:
+        劣化の内容（問題がなければ空）
+    """
+    regressions = []
+    for key, base in baseline.items():
+        current = results.get(key)
+        if not current or "error" in base:
+            continue
+        # ベースラインでは生成できたケースが失敗するようになった場合も劣化として扱う
+        if "error" in current:
+            regressions.append(f"{key}: error {current['error']} (baseline succeeded)")
+            continue
+        limit = base["median_seconds"] * (1 + threshold)
+        if current["median_seconds"] > limit:
+            regressions.append(
+                f"{key}: {current['median_seconds']:.4f}s > {base['median_seconds']:.4f}s (+{threshold:.0%})"
+            )
+        memory_limit = base["peak_memory_bytes"] * (1 + memory_threshold)
+        if current["peak_memory_bytes"] > memory_limit:
+            regressions.append(
+                f"{key}: peak {current['peak_memory_bytes']} B > {base['peak_memory_bytes']} B (+{memory_threshold:.0%})"
+            )
+    return regressions
+
+
+def print_results(results: Dict[str, Dict], baseline: Optional[Dict[str, Dict]] = None):
+    print(f"{'case':<32} {'chars':>8} {'median[s]':>11} {'min[s]':>10} {'peak[KiB]':>11} {'vs base':>9}")
+    for key, result in results.items():
+        if "error" in result:
+            print(f"{key:<32} {result['input_chars']:>8} ERROR {result['error']}")
+            continue
+        change = ""
+        base = (baseline or {}).get(key)
+        if base and "error" not in base and base["median_seconds"]:
+            change = f"{result['median_seconds'] / base['median_seconds'] - 1:+.1%}"
+        print(f"{key:<32} {result['input_chars']:>8} {result['median_seconds']:>11.4f} "
+              f"{result['min_seconds']:>10.4f} {result['peak_memory_bytes'] / 1024:>11.1f} {change:>9}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ドキュメント生成・後処理のマイクロベンチマーク")
+    parser.add_argument("--repeat", type=int, default=5, help="各ケースの繰り返し回数")
+    parser.add_argument("--only", nargs="+", choices=["generate_pdf", "generate_word", "remove_duplicate_lines"])
+    parser.add_argument("--save-baseline", help="結果をベースラインとしてJSONに保存")
+    parser.add_argument("--compare", help="比較するベースラインJSON（劣化があれば終了コード1）")
+    parser.add_argument("--threshold", type=float, default=0.2, help="許容する所要時間の増加率")
+    parser.add_argument("--memory-threshold", type=float, default=0.5, help="許容するピークメモリの増加率")
+    args = parser.parse_args(argv)
+
+    # 生成処理のINFOログを計測結果に混ぜない
+    logging.basicConfig(level=logging.WARNING)
+    # 失敗時のスタックトレースは結果の表にエラーとして出力するため抑制
+    logging.getLogger("document_generator").setLevel(logging.CRITICAL)
+
+    results = run_benchmarks(args.repeat, args.only)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nベースラインを保存: {args.save_baseline}")
+
+    if baseline is not None:
+        regressions = compare_with_baseline(results, baseline, args.threshold, args.memory_threshold)
+        if regressions:
+            print("\n性能劣化を検出:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nベースラインからの劣化はありません")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""
+GCSを使わない音声ファイルの直接アップロード
+リクエスト本文を一定サイズずつディスクに書き込み（全体をメモリに載せない）、
+サイズ上限の確認とSHA-256の計算を受信しながら行う
+保存したファイルはGCSのblobと同じ操作で議事録生成のパイプラインに渡す
+"""
+import os
+import re
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+import threading
+import logging
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 直接アップロードの有効/無効
+DIRECT_UPLOAD_ENABLED = os.getenv("DIRECT_UPLOAD_ENABLED", "true").lower() == "true"
+# 保存先のディレクトリ
+DIRECT_UPLOAD_DIR = os.getenv(
+    "DIRECT_UPLOAD_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "uploads")
+)
+# ディスクに書き込む単位（バイト）
+DIRECT_UPLOAD_CHUNK_BYTES = int(os.getenv("DIRECT_UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# 処理されずに残ったファイルを削除するまでの時間（時間）
+DIRECT_UPLOAD_TTL_HOURS = float(os.getenv("DIRECT_UPLOAD_TTL_HOURS", "24"))
+# パイプラインに渡すblob名の接頭辞（GCSのblob名と区別）
+DIRECT_UPLOAD_PREFIX = "direct/"
+# 受信途中のファイル名の接頭辞
+PARTIAL_PREFIX = ".partial-"
+
+
+class UploadTooLarge(Exception):
+    """アップロードがサイズ上限を超えた場合の例外"""
+
+
+class DirectUploadError(Exception):
+    """アップロードを受け付けられない場合の例外（空のファイル・不正なblob名など）"""
+
+
+def is_direct_upload(blob_name: str) -> bool:
+    """blob名が直接アップロードされたファイルか"""
+    return blob_name.startswith(DIRECT_UPLOAD_PREFIX)
+
+
+def _safe_extension(filename: str) -> str:
+    """ファイル名から安全な拡張子だけを取り出す"""
+    extension = os.path.splitext(os.path.basename(filename or ""))[1].lower()
+    return extension if re.fullmatch(r"\.[a-z0-9]{1,10}", extension) else ""
+
+
+class LocalBlob:
+    """直接アップロードされたファイル（パイプラインが使うGCSのblobと同じ操作を提供）"""
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.size: Optional[int] = None
+
+    def reload(self):
+        try:
+            self.size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            raise DirectUploadError(f"アップロードされたファイルが見つかりません: {self.name}")
+
+    def download_to_filename(self, path: str):
+        # 同じファイルシステムならハードリンク（コピー不要）、別ならコピー
+        try:
+            os.link(self.path, path)
+        except FileNotFoundError:
+            raise DirectUploadError(f"アップロードされたファイルが見つかりません: {self.name}")
+        except OSError:
+            shutil.copyfile(self.path, path)
+
+    def delete(self):
+        os.unlink(self.path)
+
+
+class DirectUploadStore:
+    """直接アップロードされたファイルの保存先"""
+
+    def __init__(self, directory: str = DIRECT_UPLOAD_DIR, chunk_bytes: int = DIRECT_UPLOAD_CHUNK_BYTES):
+        """
+        Args:
+            directory: 保存先のディレクトリ
+            chunk_bytes: ディスクに書き込む単位（バイト）
+        """
+        self.directory = os.path.realpath(directory)
+        self.chunk_bytes = max(64 * 1024, chunk_bytes)
+        self._sweeper = None
+        os.makedirs(self.directory, exist_ok=True)
+        logger.info(f"直接アップロードの保存先: {self.directory}")
+
+    def _user_dir(self, user: str) -> str:
+        # ユーザー名をパスに含めない
+        return hashlib.sha256(user.encode("utf-8")).hexdigest()[:16]
+
+    def blob(self, blob_name: str) -> LocalBlob:
+        """
+        blob名からファイルを取得
+
+        Args:
+            blob_name: 直接アップロードのblob名（direct/...）
+
+        Returns:
+            ファイル
+        """
+        relative = blob_name[len(DIRECT_UPLOAD_PREFIX):] if is_direct_upload(blob_name) else ""
+        path = os.path.realpath(os.path.join(self.directory, relative))
+        if not relative or os.path.dirname(os.path.dirname(path)) != self.directory:
+            raise DirectUploadError(f"不正なblob名です: {blob_name}")
+        return LocalBlob(blob_name, path)
+
+    def has_capacity(self, size_bytes: int) -> bool:
+        """
+        ディスクに書き込む予定のサイズ分の空き容量があるか
+
+        Args:
+            size_bytes: 書き込む予定のバイト数
+
+        Returns:
+            空き容量が足りる場合True
+        """
+        return size_bytes <= shutil.disk_usage(self.directory).free
+
+    async def receive(self, chunks: AsyncIterator[bytes], user: str, filename: str, max_bytes: int) -> Dict:
+        """
+        受信しながらディスクに書き込み（メモリ上に保持するのは書き込み単位分のみ）
+
+        Args:
+            chunks: リクエスト本文
+            user: ユーザー
+            filename: 元のファイル名（拡張子のみ使用）
+            max_bytes: サイズ上限（超えた時点で受信を中止）
+
+        Returns:
+            blob名・サイズ・SHA-256
+        """
+        user_dir = os.path.join(self.directory, self._user_dir(user))
+        os.makedirs(user_dir, exist_ok=True)
+        partial_path = os.path.join(user_dir, f"{PARTIAL_PREFIX}{uuid.uuid4().hex}")
+        digest = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+
+        def _flush(file, data: bytes):
+            # ハッシュ計算とディスク書き込みはイベントループを塞がないようスレッドで実行
+            digest.update(data)
+            file.write(data)
+
+        file = open(partial_path, "wb")
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(
+                        f"ファイルサイズが上限（{max_bytes / (1024 * 1024):.0f} MB）を超えています"
+                    )
+                buffer += chunk
+                if len(buffer) >= self.chunk_bytes:
+                    await asyncio.to_thread(_flush, file, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await asyncio.to_thread(_flush, file, bytes(buffer))
+            file.close()
+            if size == 0:
+                raise DirectUploadError("ファイルが空です")
+
+            # 同じ内容のファイルは同じblob名になる（再アップロードは保存済みの議事録を返す）
+            sha256 = digest.hexdigest()
+            name = f"{sha256}{_safe_extension(filename)}"
+            os.replace(partial_path, os.path.join(user_dir, name))
+        except BaseException:
+            file.close()
+            try:
+                os.unlink(partial_path)
+            except OSError:
+                pass
+            raise
+
+        blob_name = f"{DIRECT_UPLOAD_PREFIX}{self._user_dir(user)}/{name}"
+        logger.info(f"直接アップロード受信完了: {blob_name} ({size / (1024 * 1024):.2f} MB)")
+        return {"blob_name": blob_name, "size": size, "sha256": sha256}
+
+    def sweep(self, max_age_seconds: float) -> Tuple[int, int]:
+        """
+        処理されずに残ったファイル・中断した受信途中のファイルを削除
+
+        Args:
+            max_age_seconds: 削除対象とする経過時間（秒）
+
+        Returns:
+            (削除したファイル数, 解放したバイト数)
+        """
+        removed, reclaimed = 0, 0
+        now = time.time()
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                    if now - stat.st_mtime <= max_age_seconds:
+                        continue
+                    os.unlink(path)
+                    removed += 1
+                    reclaimed += stat.st_size
+                except OSError:
+                    continue
+        if removed:
+            logger.info(f"期限切れの直接アップロードを削除: {removed}件 ({reclaimed / (1024 * 1024):.1f} MB)")
+        return removed, reclaimed
+
+    def start_sweeper(self, interval_seconds: float = 3600,
+                      max_age_seconds: float = DIRECT_UPLOAD_TTL_HOURS * 3600):
+        """
+        期限切れファイルの定期削除をバックグラウンドで開始
+
+        Args:
+            interval_seconds: 実行間隔（秒）
+            max_age_seconds: 削除対象とする経過時間（秒）
+        """
+        if self._sweeper is not None:
+            return
+
+        def _loop():
+            while True:
+                try:
+                    self.sweep(max_age_seconds)
+                except Exception as e:
+                    logger.warning(f"直接アップロードの定期削除エラー: {str(e)}")
+                time.sleep(interval_seconds)
+
+        self._sweeper = threading.Thread(target=_loop, name="direct-upload-sweeper", daemon=True)
+        self._sweeper.start()
+
+
+def create_direct_upload_store() -> Optional[DirectUploadStore]:
+    """
+    直接アップロードの保存先を作成
+
+    Returns:
+        保存先（無効の場合はNone）
+    """
+    if not DIRECT_UPLOAD_ENABLED:
+        return None
+    return DirectUploadStore()
@@ -2,25 +2,42 @@
 ドキュメント生成モジュール - Word/PDF出力
 """
 from docx import Document
-from docx.shared import Pt, Inches, RGBColor
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+from xml.sax.saxutils import escape
+import io
 import tempfile
 import os
 import logging
 import re
 import glob
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Word文書のメタデータ表の項目（ラベル, メタデータのキー）
+WORD_META_ITEMS = [
+    ('作成日', 'created_date'),
+    ('作成者', 'creator'),
+    ('お客様名', 'customer_name'),
+    ('打合せ場所', 'meeting_place'),
+]
+
+# フォントごとの1ptあたりの文字幅（折り返し位置の計算用、エクスポートをまたいで再利用）
+_CHAR_WIDTHS: Dict[str, Dict[str, float]] = {}
+
 class JapanesePDF(FPDF):
     """日本語対応PDF生成クラス"""
 
     def __init__(self):
         super().__init__()
         self.font_name = None
+        # 直前に設定したフォントサイズと文字色（同じ設定への切り替えを省略）
+        self._style: Optional[Tuple[float, Tuple[int, int, int]]] = None
         self._setup_japanese_font()
 
     def _get_bundled_font_path(self):
@@ -117,12 +134,108 @@ class JapanesePDF(FPDF):
             # フォントがない場合はHelveticaを使用（日本語は表示できない）
             self.set_font("Helvetica", size=size)
 
+    def set_style(self, size: float, color: Tuple[int, int, int]):
+        """
+        フォントサイズと文字色を設定（直前と同じ設定の場合は切り替えない）
+
+        Args:
+            size: フォントサイズ
+            color: 文字色（RGB）
+        """
+        if self._style == (size, color):
+            return
+        if self._style is None or self._style[0] != size:
+            self.set_japanese_font(size)
+        if self._style is None or self._style[1] != color:
+            self.set_text_color(*color)
+        self._style = (size, color)
+
+    def wrap_text(self, text: str, width: float) -> List[str]:
+        """
+        テキストを指定幅で折り返す（文字幅はフォントごとにキャッシュし、1文字ずつ加算して一括計算）
+        空白がある場合は単語の途中で折り返さず、日本語は文字単位で折り返す
+
+        Args:
+            text: 折り返すテキスト
+            width: セルの幅
+
+        Returns:
+            折り返した行のリスト
+        """
+        widths = _CHAR_WIDTHS.setdefault(self.font_family, {})
+        size = self.font_size_pt
+        max_width = (width - 2 * self.c_margin) / size
+        lines = []
+        start, line_width, last_space = 0, 0.0, -1
+        for i, char in enumerate(text):
+            char_width = widths.get(char)
+            if char_width is None:
+                char_width = widths[char] = self.get_string_width(char) / size
+            if line_width + char_width > max_width and i > start:
+                if last_space > start:
+                    lines.append(text[start:last_space])
+                    start = last_space + 1
+                    line_width = sum(widths[c] for c in text[start:i])
+                else:
+                    lines.append(text[start:i])
+                    start, line_width = i, 0.0
+                last_space = -1
+            if char == ' ':
+                last_space = i
+            line_width += char_width
+        lines.append(text[start:])
+        return lines
+
+    def write_paragraph(self, width: float, line_height: float, text: str):
+        """
+        折り返した行を現在位置から出力（各行の左端は書き始めの位置に揃え、ページ送りは自動）
+
+        Args:
+            width: セルの幅
+            line_height: 行の高さ
+            text: 出力するテキスト
+        """
+        for line in self.wrap_text(text, width):
+            self.cell(width, line_height, line, new_x=XPos.LEFT, new_y=YPos.NEXT)
+
 
 class DocumentGenerator:
     def __init__(self):
         """ドキュメント生成の初期化"""
+        # タイトル・メタデータ表・見出しまで作成済みのWordテンプレート（エクスポートごとにバイト列から複製）
+        self._word_template = self._build_word_template()
         logger.info("DocumentGenerator初期化完了")
 
+    def _build_word_template(self) -> bytes:
+        """
+        Word文書のテンプレートを作成（本文とメタデータの値以外）
+
+        Returns:
+            テンプレートのバイト列
+        """
+        doc = Document()
+
+        # タイトル
+        title = doc.add_heading('議事録', level=0)
+        title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+        # メタデータテーブル（値はエクスポート時に設定）
+        doc.add_paragraph()
+        table = doc.add_table(rows=len(WORD_META_ITEMS), cols=2)
+        table.style = 'Light Grid Accent 1'
+        for row, (label, _) in zip(table.rows, WORD_META_ITEMS):
+            row.cells[0].text = label
+            # ラベルセルを太字に
+            row.cells[0].paragraphs[0].runs[0].font.bold = True
+
+        # 本文
+        doc.add_paragraph()
+        doc.add_heading('内容', level=1)
+
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        return buffer.getvalue()
+
     def _convert_markdown_symbols(self, text: str) -> str:
         """
         Markdown記号を日本語形式に変換
@@ -132,6 +245,24 @@ class DocumentGenerator:
         text = re.sub(r'\*\*(.+?)\*\*', r'【\1】', text)
         return text
 
+    def _word_paragraph_xml(self, text: str, style: Optional[str] = None) -> str:
+        """
+        Word文書の段落のXMLを作成
+
+        Args:
+            text: 段落のテキスト
+            style: 段落スタイルのID（Heading2、ListBulletなど）
+
+        Returns:
+            段落のXML（w:p要素）
+        """
+        properties = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+        # タブはw:tab要素に変換（python-docxのadd_paragraphと同じ）
+        runs = '<w:tab/>'.join(
+            f'<w:t xml:space="preserve">{escape(part)}</w:t>' for part in text.split('\t')
+        )
+        return f'<w:p>{properties}<w:r>{runs}</w:r></w:p>'
+
     def generate_word(self, content: str, metadata: Dict) -> str:
         """
         Word文書を生成
@@ -146,42 +277,18 @@ class DocumentGenerator:
         try:
             logger.info("Word文書の生成を開始")
 
-            # 新しい文書を作成
-            doc = Document()
-
-            # タイトル
-            title = doc.add_heading('議事録', level=0)
-            title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-            # メタデータテーブル
-            doc.add_paragraph()
-            table = doc.add_table(rows=4, cols=2)
-            table.style = 'Light Grid Accent 1'
+            # テンプレートを複製
+            doc = Document(io.BytesIO(self._word_template))
 
-            # テーブルの内容
-            meta_items = [
-                ('作成日', metadata.get('created_date', '')),
-                ('作成者', metadata.get('creator', '')),
-                ('お客様名', metadata.get('customer_name', '')),
-                ('打合せ場所', metadata.get('meeting_place', ''))
-            ]
-
-            for i, (label, value) in enumerate(meta_items):
-                row = table.rows[i]
-                row.cells[0].text = label
-                row.cells[1].text = value
-
-                # ラベルセルを太字に
-                row.cells[0].paragraphs[0].runs[0].font.bold = True
-
-            # 本文
-            doc.add_paragraph()
-            doc.add_heading('内容', level=1)
+            # メタデータテーブルの値
+            for row, (_, key) in zip(doc.tables[0].rows, WORD_META_ITEMS):
+                row.cells[1].text = metadata.get(key, '')
 
             # Markdown記号を変換
             content = self._convert_markdown_symbols(content)
 
-            # 内容を行ごとに処理
+            # 内容を行ごとに段落のXMLにし、最後にまとめて本文へ挿入
+            paragraphs = []
             for line in content.split('\n'):
                 line = line.strip()
                 if not line:
@@ -190,10 +297,10 @@ class DocumentGenerator:
                 # セクションヘッダーの判定（##で始まる、または「1. 」〜「9. 」で始まる）
                 if line.startswith('##'):
                     heading_text = line.replace('##', '').strip()
-                    doc.add_heading(heading_text, level=2)
+                    paragraphs.append(self._word_paragraph_xml(heading_text, 'Heading2'))
                 elif re.match(r'^[1-9]\.\s', line):
                     # 「1. 打合せ概要」のような形式
-                    doc.add_heading(line, level=2)
+                    paragraphs.append(self._word_paragraph_xml(line, 'Heading2'))
                 # 箇条書きの判定（・、•、-、* で始まる）
                 elif line.startswith(('・', '• ', '- ', '* ')):
                     # 箇条書き記号を除去
@@ -201,18 +308,25 @@ class DocumentGenerator:
                         if line.startswith(prefix):
                             line = line[len(prefix):].strip()
                             break
-                    p = doc.add_paragraph(line, style='List Bullet')
+                    paragraphs.append(self._word_paragraph_xml(line, 'ListBullet'))
                 else:
                     # 通常の段落
-                    doc.add_paragraph(line)
+                    paragraphs.append(self._word_paragraph_xml(line))
 
             # フッター
-            doc.add_paragraph()
-            footer = doc.add_paragraph(f"作成日時: {datetime.now().strftime('%Y年%m月%d日 %H:%M')}")
-            footer.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-            footer_run = footer.runs[0]
-            footer_run.font.size = Pt(9)
-            footer_run.font.color.rgb = RGBColor(128, 128, 128)
+            paragraphs.append('<w:p/>')
+            footer_text = escape(f"作成日時: {datetime.now().strftime('%Y年%m月%d日 %H:%M')}")
+            paragraphs.append(
+                '<w:p><w:pPr><w:jc w:val="right"/></w:pPr>'
+                '<w:r><w:rPr><w:color w:val="808080"/><w:sz w:val="18"/></w:rPr>'
+                f'<w:t xml:space="preserve">{footer_text}</w:t></w:r></w:p>'
+            )
+
+            # 1回のXML解析で全段落を作成し、セクション設定（sectPr）の前に挿入
+            body = doc.element.body
+            fragment = parse_xml(f'<w:body {nsdecls("w")}>{"".join(paragraphs)}</w:body>')
+            position = body.index(body.sectPr) if body.sectPr is not None else len(body)
+            body[position:position] = list(fragment)
 
             # 一時ファイルに保存
             output_path = tempfile.mktemp(suffix=".docx")
@@ -225,6 +339,86 @@ class DocumentGenerator:
             logger.error(f"Word文書生成エラー: {str(e)}")
             raise
 
+    def _draw_pdf_header(self, pdf: JapanesePDF, metadata: Dict, effective_width: float):
+        """
+        タイトルとメタデータのカードを描画
+
+        Args:
+            pdf: 描画先のPDF
+            metadata: メタデータ（日付、作成者など）
+            effective_width: 有効なページ幅
+        """
+        # メタデータ取得
+        created_date = str(metadata.get('created_date', '') or '')
+        creator = str(metadata.get('creator', '') or '')
+        customer_name = str(metadata.get('customer_name', '') or '')
+        meeting_place = str(metadata.get('meeting_place', '') or '')
+
+        # 日付フォーマット（ハイフンを除去）
+        date_formatted = created_date.replace('-', '')
+
+        # ===== タイトル部分 =====
+        # タイトル背景（グラデーション風に2色）
+        pdf.set_fill_color(10, 22, 40)  # ダークネイビー
+        pdf.rect(pdf.l_margin, pdf.get_y(), effective_width, 22, 'F')
+
+        # アクセントライン
+        pdf.set_fill_color(37, 99, 235)  # ブルー
+        pdf.rect(pdf.l_margin, pdf.get_y(), 4, 22, 'F')
+
+        # タイトルテキスト（日付_お客様名_議事録）
+        title_text = f'{date_formatted}_{customer_name}_議事録'
+        pdf.set_style(14, (255, 255, 255))
+        pdf.set_xy(pdf.l_margin + 12, pdf.get_y() + 6)
+        pdf.cell(effective_width - 12, 10, title_text, align='L')
+        pdf.ln(26)
+
+        # ===== メタデータ（モダンカード形式） =====
+        # 4列のグリッドレイアウト
+        card_width = effective_width / 4
+        card_height = 20
+
+        meta_items = [
+            ('DATE', created_date),
+            ('AUTHOR', creator),
+            ('CLIENT', customer_name),
+            ('PLACE', meeting_place)
+        ]
+
+        # 背景バー
+        pdf.set_fill_color(248, 250, 252)  # 薄いグレー背景
+        pdf.rect(pdf.l_margin, pdf.get_y(), effective_width, card_height + 4, 'F')
+
+        start_y = pdf.get_y() + 2
+
+        # 区切り線（最後以外）
+        pdf.set_draw_color(220, 225, 230)
+        for i in range(1, len(meta_items)):
+            line_x = pdf.l_margin + (card_width * i)
+            pdf.line(line_x, start_y + 2, line_x, start_y + card_height - 4)
+
+        # ラベル（小さく、グレー）→ 値（大きく、ダーク）の順にまとめて描画し、スタイルの切り替えを減らす
+        for i, (label, _) in enumerate(meta_items):
+            pdf.set_xy(pdf.l_margin + (card_width * i) + 4, start_y)
+            pdf.set_style(7, (130, 140, 160))
+            pdf.cell(card_width - 8, 4, label, align='L')
+
+        for i, (_, value) in enumerate(meta_items):
+            pdf.set_xy(pdf.l_margin + (card_width * i) + 4, start_y + 5)
+            pdf.set_style(9, (30, 40, 60))
+            # 値が長い場合は切り詰め
+            display_value = value if len(value) <= 12 else value[:11] + '...'
+            pdf.cell(card_width - 8, 6, display_value, align='L')
+
+        pdf.set_y(start_y + card_height + 6)
+
+        # ===== 区切り線 =====
+        pdf.set_draw_color(37, 99, 235)
+        pdf.set_line_width(0.5)
+        pdf.line(pdf.l_margin, pdf.get_y(), pdf.l_margin + effective_width, pdf.get_y())
+        pdf.set_line_width(0.2)
+        pdf.ln(10)
+
     def generate_pdf(self, content: str, metadata: Dict) -> str:
         """
         PDF文書を生成（fpdf2使用）
@@ -259,82 +453,8 @@ class DocumentGenerator:
             # 有効なページ幅を計算
             effective_width = pdf.w - pdf.l_margin - pdf.r_margin
 
-            # メタデータ取得
-            created_date = str(metadata.get('created_date', '') or '')
-            creator = str(metadata.get('creator', '') or '')
-            customer_name = str(metadata.get('customer_name', '') or '')
-            meeting_place = str(metadata.get('meeting_place', '') or '')
-
-            # 日付フォーマット（ハイフンを除去）
-            date_formatted = created_date.replace('-', '')
-
-            # ===== タイトル部分 =====
-            # タイトル背景（グラデーション風に2色）
-            pdf.set_fill_color(10, 22, 40)  # ダークネイビー
-            pdf.rect(pdf.l_margin, pdf.get_y(), effective_width, 22, 'F')
-
-            # アクセントライン
-            pdf.set_fill_color(37, 99, 235)  # ブルー
-            pdf.rect(pdf.l_margin, pdf.get_y(), 4, 22, 'F')
-
-            # タイトルテキスト（日付_お客様名_議事録）
-            title_text = f'{date_formatted}_{customer_name}_議事録'
-            pdf.set_text_color(255, 255, 255)
-            pdf.set_japanese_font(14)
-            pdf.set_xy(pdf.l_margin + 12, pdf.get_y() + 6)
-            pdf.cell(effective_width - 12, 10, title_text, align='L')
-            pdf.ln(26)
-
-            # ===== メタデータ（モダンカード形式） =====
-            # 4列のグリッドレイアウト
-            card_width = effective_width / 4
-            card_height = 20
-
-            meta_items = [
-                ('DATE', created_date),
-                ('AUTHOR', creator),
-                ('CLIENT', customer_name),
-                ('PLACE', meeting_place)
-            ]
-
-            # 背景バー
-            pdf.set_fill_color(248, 250, 252)  # 薄いグレー背景
-            pdf.rect(pdf.l_margin, pdf.get_y(), effective_width, card_height + 4, 'F')
-
-            start_y = pdf.get_y() + 2
-
-            for i, (label, value) in enumerate(meta_items):
-                x_pos = pdf.l_margin + (card_width * i) + 4
-
-                # ラベル（小さく、グレー）
-                pdf.set_xy(x_pos, start_y)
-                pdf.set_japanese_font(7)
-                pdf.set_text_color(130, 140, 160)
-                pdf.cell(card_width - 8, 4, label, align='L')
-
-                # 値（大きく、ダーク）
-                pdf.set_xy(x_pos, start_y + 5)
-                pdf.set_japanese_font(9)
-                pdf.set_text_color(30, 40, 60)
-
-                # 値が長い場合は切り詰め
-                display_value = value if len(value) <= 12 else value[:11] + '...'
-                pdf.cell(card_width - 8, 6, display_value, align='L')
-
-                # 区切り線（最後以外）
-                if i < len(meta_items) - 1:
-                    pdf.set_draw_color(220, 225, 230)
-                    line_x = pdf.l_margin + (card_width * (i + 1))
-                    pdf.line(line_x, start_y + 2, line_x, start_y + card_height - 4)
-
-            pdf.set_y(start_y + card_height + 6)
-
-            # ===== 区切り線 =====
-            pdf.set_draw_color(37, 99, 235)
-            pdf.set_line_width(0.5)
-            pdf.line(pdf.l_margin, pdf.get_y(), pdf.l_margin + effective_width, pdf.get_y())
-            pdf.set_line_width(0.2)
-            pdf.ln(10)
+            # タイトル・メタデータ
+            self._draw_pdf_header(pdf, metadata, effective_width)
 
             # ===== 本文 =====
             # Markdown記号を変換
@@ -351,36 +471,20 @@ class DocumentGenerator:
                     pdf.ln(4)
                     continue
 
-                # ## で始まる行は大見出し
-                if line.startswith('##'):
-                    heading_text = line.replace('##', '').strip()
+                # ## で始まる行は大見出し、「1. 」〜「9. 」で始まる行は番号付き見出し
+                is_heading = line.startswith('##')
+                if is_heading or re.match(r'^[1-9]\.\s', line):
+                    heading_text = line.replace('##', '').strip() if is_heading else line
                     pdf.ln(6)
                     # 見出し背景
                     pdf.set_fill_color(37, 99, 235)  # ブルー
-                    pdf.set_text_color(255, 255, 255)
-                    pdf.set_japanese_font(11)
+                    pdf.set_style(11, (255, 255, 255))
                     pdf.cell(effective_width, 10, f'  {heading_text}', fill=True)
                     pdf.ln(12)
-                    pdf.set_text_color(0, 0, 0)
                     current_section = heading_text
 
-                # 「1. 」〜「9. 」で始まる行は番号付き見出し
-                elif re.match(r'^[1-9]\.\s', line):
-                    pdf.ln(6)
-                    # 見出し背景
-                    pdf.set_fill_color(37, 99, 235)  # ブルー
-                    pdf.set_text_color(255, 255, 255)
-                    pdf.set_japanese_font(11)
-                    pdf.cell(effective_width, 10, f'  {line}', fill=True)
-                    pdf.ln(12)
-                    pdf.set_text_color(0, 0, 0)
-                    current_section = line
-
                 # ・で始まる行は箇条書き
                 elif line.startswith('・') or line.startswith('•') or line.startswith('- ') or line.startswith('* '):
-                    pdf.set_japanese_font(10)
-                    pdf.set_text_color(0, 0, 0)
-
                     # 箇条書き記号を統一
                     for prefix in ['・', '• ', '- ', '* ']:
                         if line.startswith(prefix):
@@ -389,16 +493,16 @@ class DocumentGenerator:
 
                     # インデント付きで表示
                     pdf.set_x(pdf.l_margin + indent_width)
-                    pdf.set_text_color(37, 99, 235)  # ブルー
+                    pdf.set_style(10, (37, 99, 235))  # ブルー
                     pdf.cell(5, 7, '●', align='L')
-                    pdf.set_text_color(0, 0, 0)
-                    pdf.multi_cell(effective_width - indent_width - 5, 7, line)
+                    pdf.set_style(10, (0, 0, 0))
+                    pdf.write_paragraph(effective_width - indent_width - 5, 7, line)
 
                 # 通常のテキスト
                 else:
-                    pdf.set_japanese_font(10)
-                    pdf.set_text_color(40, 40, 40)
-                    pdf.multi_cell(effective_width, 7, line)
+                    pdf.set_x(pdf.l_margin)
+                    pdf.set_style(10, (40, 40, 40))
+                    pdf.write_paragraph(effective_width, 7, line)
 
             # ===== フッター =====
             pdf.ln(15)
@@ -406,8 +510,7 @@ class DocumentGenerator:
             pdf.line(pdf.l_margin, pdf.get_y(), pdf.l_margin + effective_width, pdf.get_y())
             pdf.ln(5)
 
-            pdf.set_japanese_font(8)
-            pdf.set_text_color(128, 128, 128)
+            pdf.set_style(8, (128, 128, 128))
             footer_text = f"作成日時: {datetime.now().strftime('%Y年%m月%d日 %H:%M')}"
             pdf.cell(effective_width, 6, footer_text, align='R')
 
@@ -0,0 +1,239 @@
+"""
+ユーザー間の公平なジョブスケジューラ
+圧縮・Gemini解析の前で実行枠を割り当て、1人の大量アップロードで他のユーザーが待たされないようにする
+短い音声は interactive レーン、長い音声は batch レーンで重み付き公平キューイング（WFQ）
+"""
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from metrics import SCHEDULER_QUEUE_DEPTH, SCHEDULER_RUNNING, SCHEDULER_WAIT
+from tracing import set_span_attributes
+
+logger = logging.getLogger(__name__)
+
+# 圧縮・Gemini解析を同時に実行するジョブ数（全ユーザー合計、Cloud Runの同時リクエスト数 --concurrency と同じ）
+SCHEDULER_SLOTS = int(os.getenv("SCHEDULER_SLOTS", "10"))
+# 1ユーザー（ログインごとのセッション）が同時に実行できるジョブ数（0で上限なし）
+# パスワードのみの認証で全員が同じユーザー名になるため、公平性はログインごとのセッションで判定
+SCHEDULER_PER_USER_LIMIT = int(os.getenv("SCHEDULER_PER_USER_LIMIT", "0"))
+# この再生時間以下の音声を interactive レーンで処理（秒）
+INTERACTIVE_MAX_SECONDS = float(os.getenv("SCHEDULER_INTERACTIVE_MAX_SECONDS", "1200"))
+# レーンごとの重み（大きいほど優先）
+LANE_WEIGHTS = {
+    "interactive": float(os.getenv("SCHEDULER_INTERACTIVE_WEIGHT", "4")),
+    "batch": 1.0,
+}
+# 再生時間が不明なジョブのコスト（秒）
+UNKNOWN_DURATION_SECONDS = 3600
+# 短すぎる音声でも最低限計上するコスト（秒）
+MIN_COST_SECONDS = 60
+# 再生時間が分からない時点（ワークキューへの登録時）に、ファイルサイズから見積もる1秒あたりのバイト数
+# （128kbps相当。非圧縮のWAVは長めに見積もられ batch レーンになる）
+ESTIMATED_BYTES_PER_SECOND = 16000
+
+
+def estimate_duration(size_bytes: Optional[int]) -> Optional[float]:
+    """ファイルサイズから再生時間を見積もり（サイズ不明の場合はNone）"""
+    if not size_bytes:
+        return None
+    return size_bytes / ESTIMATED_BYTES_PER_SECOND
+
+
+class Ticket:
+    """実行枠を待つジョブ"""
+
+    def __init__(self, key: str, user: str, lane: str, duration_seconds: Optional[float], finish_tag: float):
+        self.key = key
+        self.user = user
+        self.lane = lane
+        self.duration_seconds = duration_seconds
+        self.finish_tag = finish_tag
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.granted = asyncio.Event()
+
+    def to_dict(self, position: Optional[int] = None) -> Dict:
+        now = time.monotonic()
+        return {
+            "key": self.key,
+            "lane": self.lane,
+            "duration_seconds": self.duration_seconds,
+            "state": "running" if self.started_at is not None else "queued",
+            "position": position,
+            "waited_seconds": round((self.started_at or now) - self.enqueued_at, 1),
+        }
+
+
+class FairScheduler:
+    """ユーザーごとの同時実行数上限と重み付き公平キューイングで実行枠を割り当て"""
+
+    def __init__(self, slots: int = SCHEDULER_SLOTS, per_user_limit: int = SCHEDULER_PER_USER_LIMIT,
+                 interactive_max_seconds: float = INTERACTIVE_MAX_SECONDS,
+                 lane_weights: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            slots: 全体の同時実行数
+            per_user_limit: ユーザーごとの同時実行数（0で上限なし）
+            interactive_max_seconds: interactive レーンとする再生時間の上限（秒）
+            lane_weights: レーンごとの重み
+        """
+        self.slots = max(1, slots)
+        self.per_user_limit = per_user_limit if per_user_limit > 0 else None
+        self.interactive_max_seconds = interactive_max_seconds
+        self.lane_weights = lane_weights or LANE_WEIGHTS
+        self._waiting: List[Ticket] = []
+        self._running: Dict[str, Ticket] = {}
+        self._running_by_user: Dict[str, int] = {}
+        # ユーザー・レーンごとの直近の仮想終了時刻と、全体の仮想時刻
+        self._last_finish: Dict[tuple, float] = {}
+        self._virtual_time = 0.0
+        self._sequence = 0
+
+    def lane_for(self, duration_seconds: Optional[float]) -> str:
+        """再生時間からレーンを判定（不明な場合は batch）"""
+        if duration_seconds is not None and duration_seconds <= self.interactive_max_seconds:
+            return "interactive"
+        return "batch"
+
+    def weighted_cost(self, duration_seconds: Optional[float]) -> Tuple[str, float]:
+        """
+        再生時間からレーンと仮想時間の増分を計算（ワークキューの取得順にも使用）
+
+        Args:
+            duration_seconds: 音声の再生時間（不明な場合はNone）
+
+        Returns:
+            (レーン, コスト / レーンの重み)
+        """
+        lane = self.lane_for(duration_seconds)
+        cost = max(MIN_COST_SECONDS, duration_seconds if duration_seconds else UNKNOWN_DURATION_SECONDS)
+        return lane, cost / self.lane_weights.get(lane, 1.0)
+
+    @asynccontextmanager
+    async def slot(self, user: str, duration_seconds: Optional[float],
+                   key: Optional[str] = None) -> AsyncIterator[Ticket]:
+        """
+        実行枠を取得して処理を実行（終了時に解放）
+
+        Args:
+            user: ユーザー（ログインごとのセッションID、古いトークンはJWTのsub）
+            duration_seconds: 音声の再生時間（コストとレーンの判定に使用）
+            key: キュー上の位置を問い合わせるためのキー
+
+        Yields:
+            実行中のチケット
+        """
+        ticket = self._enqueue(user, duration_seconds, key)
+        try:
+            await ticket.granted.wait()
+            wait_seconds = ticket.started_at - ticket.enqueued_at
+            SCHEDULER_WAIT.observe(wait_seconds, lane=ticket.lane)
+            set_span_attributes(scheduler_lane=ticket.lane, scheduler_wait_seconds=round(wait_seconds, 3))
+            if wait_seconds >= 1:
+                logger.info(f"実行枠を取得: {user} ({ticket.lane}, 待機 {wait_seconds:.1f}秒)")
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    def _enqueue(self, user: str, duration_seconds: Optional[float], key: Optional[str]) -> Ticket:
+        lane, cost = self.weighted_cost(duration_seconds)
+        # WFQ: ユーザー・レーンごとに仮想終了時刻を積み上げ、小さい順に実行
+        start_tag = max(self._virtual_time, self._last_finish.get((user, lane), 0.0))
+        finish_tag = start_tag + cost
+        self._last_finish[(user, lane)] = finish_tag
+
+        self._sequence += 1
+        ticket = Ticket(key or f"{user}#{self._sequence}", user, lane, duration_seconds, finish_tag)
+        self._waiting.append(ticket)
+        self._update_gauges()
+        self._dispatch()
+        if not ticket.granted.is_set():
+            logger.info(
+                f"実行枠の待機: {user} ({lane}, 順番: {self.position(ticket)}, "
+                f"待機中: {len(self._waiting)}件, 実行中: {len(self._running)}件)"
+            )
+        return ticket
+
+    def _release(self, ticket: Ticket):
+        if ticket.started_at is None:
+            # 待機中にキャンセルされた
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+        elif self._running.pop(ticket.key, None) is not None:
+            self._running_by_user[ticket.user] -= 1
+            if not self._running_by_user[ticket.user]:
+                del self._running_by_user[ticket.user]
+        # 仮想時刻に追い越された終了時刻は以後の計算に影響しないため破棄
+        for lane_key in [k for k, tag in self._last_finish.items() if tag <= self._virtual_time]:
+            del self._last_finish[lane_key]
+        self._dispatch()
+        self._update_gauges()
+
+    def _dispatch(self):
+        """空いている枠を仮想終了時刻の小さい順に割り当て（上限に達したユーザーは飛ばす）"""
+        while len(self._running) < self.slots:
+            eligible = [
+                ticket for ticket in self._waiting
+                if self.per_user_limit is None
+                or self._running_by_user.get(ticket.user, 0) < self.per_user_limit
+            ]
+            if not eligible:
+                break
+            ticket = min(eligible, key=lambda t: t.finish_tag)
+            self._waiting.remove(ticket)
+            self._virtual_time = max(self._virtual_time, ticket.finish_tag)
+            ticket.started_at = time.monotonic()
+            self._running[ticket.key] = ticket
+            self._running_by_user[ticket.user] = self._running_by_user.get(ticket.user, 0) + 1
+            ticket.granted.set()
+        self._update_gauges()
+
+    def _ordered_waiting(self) -> List[Ticket]:
+        return sorted(self._waiting, key=lambda t: t.finish_tag)
+
+    def position(self, ticket: Ticket) -> Optional[int]:
+        """待機中のチケットの順番（1始まり、実行中はNone）"""
+        if ticket.started_at is not None:
+            return None
+        return self._ordered_waiting().index(ticket) + 1
+
+    def user_status(self, user: str, key: Optional[str] = None) -> Dict:
+        """
+        ユーザーのジョブの状態と順番
+
+        Args:
+            user: ユーザー
+            key: 特定のジョブのキー（省略時はユーザーの全ジョブ）
+
+        Returns:
+            ジョブごとのレーン・状態・順番と全体の混雑状況
+        """
+        ordered = self._ordered_waiting()
+        jobs = [
+            ticket.to_dict(position=index + 1)
+            for index, ticket in enumerate(ordered) if ticket.user == user
+        ] + [ticket.to_dict() for ticket in self._running.values() if ticket.user == user]
+        if key is not None:
+            jobs = [job for job in jobs if job["key"] == key]
+        return {"jobs": jobs, **self.stats()}
+
+    def stats(self) -> Dict:
+        """全体の実行中・待機中の件数"""
+        return {
+            "slots": self.slots,
+            "per_user_limit": self.per_user_limit,
+            "running": len(self._running),
+            "waiting": len(self._waiting),
+            "waiting_by_lane": {
+                lane: sum(1 for ticket in self._waiting if ticket.lane == lane) for lane in self.lane_weights
+            },
+        }
+
+    def _update_gauges(self):
+        for lane in self.lane_weights:
+            SCHEDULER_QUEUE_DEPTH.set(sum(1 for t in self._waiting if t.lane == lane), lane=lane)
+            SCHEDULER_RUNNING.set(sum(1 for t in self._running.values() if t.lane == lane), lane=lane)
@@ -0,0 +1,181 @@
+"""
+GCSの孤立した音声ファイルの定期削除モジュール
+署名付きURLでアップロードされたまま /api/upload が呼ばれなかったファイルや、
+処理途中で失敗して残ったファイルを、一定時間経過後にまとめて削除
+"""
+import os
+import time
+import threading
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from metrics import GCS_ORPHANS_DELETED, GCS_ORPHAN_BYTES_RECLAIMED
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# この時間を過ぎたアップロードファイルを孤立とみなす（時間）
+GCS_ORPHAN_TTL_HOURS = float(os.getenv("GCS_ORPHAN_TTL_HOURS", "24"))
+# 定期実行の間隔（秒、0で無効）
+GCS_SWEEP_INTERVAL_SECONDS = float(os.getenv("GCS_SWEEP_INTERVAL_SECONDS", "3600"))
+# 対象とするblob名の接頭辞（カンマ区切り、空の場合はバケット全体）
+GCS_SWEEP_PREFIXES = [p for p in os.getenv("GCS_SWEEP_PREFIXES", "").split(",") if p] or [""]
+# 一覧取得の1ページあたりの件数
+LIST_PAGE_SIZE = 1000
+# 1回のバッチリクエストで削除する件数（GCSのバッチ上限は100）
+DELETE_BATCH_SIZE = 100
+
+
+class SweepInProgress(Exception):
+    """削除処理が既に実行中の場合の例外"""
+
+
+class GCSOrphanSweeper:
+    """期限切れのアップロードファイルをページ単位で列挙してバッチ削除"""
+
+    def __init__(self, bucket, ttl_hours: float = GCS_ORPHAN_TTL_HOURS,
+                 prefixes: Optional[List[str]] = None, exclude_prefixes: Optional[List[str]] = None,
+                 page_size: int = LIST_PAGE_SIZE, batch_size: int = DELETE_BATCH_SIZE):
+        """
+        Args:
+            bucket: GCSバケット
+            ttl_hours: 孤立とみなす経過時間（時間）
+            prefixes: 対象とするblob名の接頭辞
+            exclude_prefixes: 対象外とするblob名の接頭辞（処理中のジョブのチェックポイントなど）
+            page_size: 一覧取得の1ページあたりの件数
+            batch_size: 1回のバッチで削除する件数
+        """
+        self.bucket = bucket
+        self.ttl = timedelta(hours=ttl_hours)
+        self.prefixes = prefixes or GCS_SWEEP_PREFIXES
+        self.exclude_prefixes = tuple(p for p in (exclude_prefixes or []) if p)
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.last_report: Optional[Dict] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def sweep(self, dry_run: bool = False, now: Optional[datetime] = None) -> Dict:
+        """
+        期限切れのファイルを削除
+
+        Args:
+            dry_run: 削除せずに対象の件数・サイズのみ集計
+            now: 基準時刻（省略時は現在時刻）
+
+        Returns:
+            走査件数・削除件数・回収したバイト数などの集計
+        """
+        # 同時に複数回実行しない
+        if not self._lock.acquire(blocking=False):
+            raise SweepInProgress("GCSの孤立ファイル削除は実行中です")
+        try:
+            with tracer.span("gcs.sweep_orphans", dry_run=dry_run):
+                return self._sweep(dry_run, now or datetime.now(timezone.utc))
+        finally:
+            self._lock.release()
+
+    def _sweep(self, dry_run: bool, now: datetime) -> Dict:
+        start = time.perf_counter()
+        cutoff = now - self.ttl
+        report = {
+            "dry_run": dry_run,
+            "cutoff": cutoff.isoformat(),
+            "scanned": 0,
+            "pages": 0,
+            "expired": 0,
+            "deleted": 0,
+            "reclaimed_bytes": 0,
+            "errors": 0,
+        }
+
+        for prefix in self.prefixes:
+            iterator = self.bucket.list_blobs(prefix=prefix or None, page_size=self.page_size)
+            for page in iterator.pages:
+                report["pages"] += 1
+                expired = []
+                for blob in page:
+                    if self.exclude_prefixes and blob.name.startswith(self.exclude_prefixes):
+                        continue
+                    report["scanned"] += 1
+                    if blob.time_created is not None and blob.time_created < cutoff:
+                        expired.append(blob)
+                report["expired"] += len(expired)
+                if dry_run:
+                    report["reclaimed_bytes"] += sum(blob.size or 0 for blob in expired)
+                    continue
+                # 削除後はサイズを参照できないため一覧取得時の値を控えておく
+                sizes = {blob.name: blob.size or 0 for blob in expired}
+                for i in range(0, len(expired), self.batch_size):
+                    deleted, errors = self._delete_batch(expired[i:i + self.batch_size])
+                    reclaimed = sum(sizes[blob.name] for blob in deleted)
+                    report["deleted"] += len(deleted)
+                    report["reclaimed_bytes"] += reclaimed
+                    report["errors"] += errors
+                    GCS_ORPHANS_DELETED.inc(len(deleted))
+                    GCS_ORPHAN_BYTES_RECLAIMED.inc(reclaimed)
+
+        report["duration_seconds"] = round(time.perf_counter() - start, 3)
+        report["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self.last_report = report
+        logger.info(
+            f"GCS孤立ファイル削除{'（ドライラン）' if dry_run else ''}: "
+            f"走査 {report['scanned']}件, 期限切れ {report['expired']}件, 削除 {report['deleted']}件, "
+            f"回収 {report['reclaimed_bytes'] / (1024 * 1024):.1f} MB, エラー {report['errors']}件"
+        )
+        return report
+
+    def _delete_batch(self, blobs: list):
+        """
+        バッチリクエストで削除（失敗時は1件ずつ削除して結果を確定）
+
+        Returns:
+            (削除したblobの一覧, エラー件数)
+        """
+        if not blobs:
+            return [], 0
+        client = getattr(self.bucket, "client", None)
+        if client is not None and hasattr(client, "batch"):
+            try:
+                with client.batch(raise_exception=True):
+                    for blob in blobs:
+                        blob.delete()
+                return blobs, 0
+            except Exception as e:
+                logger.warning(f"バッチ削除エラー（1件ずつ再試行）: {str(e)}")
+
+        deleted, errors = [], 0
+        for blob in blobs:
+            try:
+                blob.delete()
+                deleted.append(blob)
+            except Exception as e:
+                # 他のインスタンスが先に削除した場合は回収済みとして扱う
+                if getattr(e, "code", None) == 404 or type(e).__name__ == "NotFound":
+                    deleted.append(blob)
+                else:
+                    errors += 1
+                    logger.warning(f"GCSファイル削除エラー: {blob.name} - {str(e)}")
+        return deleted, errors
+
+    def start(self, interval_seconds: float = GCS_SWEEP_INTERVAL_SECONDS):
+        """
+        定期削除をバックグラウンドで開始
+
+        Args:
+            interval_seconds: 実行間隔（秒、0以下の場合は開始しない）
+        """
+        if self._thread is not None or interval_seconds <= 0:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.warning(f"GCS孤立ファイルの定期削除エラー: {str(e)}")
+
+        self._thread = threading.Thread(target=_loop, name="gcs-orphan-sweeper", daemon=True)
+        self._thread.start()
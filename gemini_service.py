@@ -2,13 +2,67 @@
 Google Gemini APIを使用した音声解析サービス
 """
 import google.generativeai as genai
+from google.generativeai import caching
 import os
+import asyncio
 import logging
-from typing import Dict, Any
+import threading
+from datetime import timedelta
+from typing import Dict, Any, Callable, Optional, Set, Tuple
 import time
 
+from metrics import STAGE_DURATION, GEMINI_TOKENS, GEMINI_TRUNCATED, GEMINI_AUDIO_DURATION
+from tracing import tracer
+
 logger = logging.getLogger(__name__)
 
+# コンテキストキャッシュ設定（固定のシステムプロンプトをサーバー側にキャッシュ）
+CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE", "true").lower() == "true"
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = 300  # 有効期限の5分前に延長
+CONTEXT_CACHE_RETRY_SECONDS = 600  # 作成失敗後、再試行までの待機時間
+# コンテキストキャッシュを作成できる最小トークン数（モデルごと、未記載のモデルは既定値）
+CONTEXT_CACHE_MIN_TOKENS = {
+    "models/gemini-2.5-pro": 4096,
+}
+CONTEXT_CACHE_DEFAULT_MIN_TOKENS = 1024
+
+# このサイズ（バイト）以下の音声はFiles APIを使わずリクエストに直接含める
+# （アップロード・処理待ち・削除の往復を省略。リクエスト全体の上限20MBに対しBase64で約1.33倍になるため余裕を持たせる）
+GEMINI_INLINE_MAX_BYTES = int(os.getenv("GEMINI_INLINE_MAX_BYTES", str(10 * 1024 * 1024)))
+# リクエストに直接含める場合のMIMEタイプ（Geminiが対応する形式のみ、それ以外はFiles API）
+INLINE_MIME_TYPES = {
+    ".mp3": "audio/mp3",
+    ".wav": "audio/wav",
+    ".aac": "audio/aac",
+    ".ogg": "audio/ogg",
+    ".flac": "audio/flac",
+    ".aiff": "audio/aiff",
+}
+
+# トークン関連の上限値
+MAX_OUTPUT_TOKENS = 65536  # Gemini 2.5 Flashの最大値（3時間超の会議に対応）
+INPUT_TOKEN_LIMIT = 1048576  # Gemini 2.5系の入力コンテキスト上限
+AUDIO_TOKENS_PER_SECOND = 32  # Gemini APIの音声トークン換算（1秒あたり）
+COUNT_TOKENS_TIMEOUT_SECONDS = 10  # プロンプトのトークン数の計測の待機上限
+COUNT_TOKENS_RETRY_SECONDS = 600  # 計測失敗後、概算値を使って再計測するまでの待機時間
+
+# 続きの録音の追加部分のみを解析する場合の指示（システムプロンプトの出力形式はそのまま）
+CONTINUATION_PROMPT = """この音声は、以下の議事録にまとめた打合せの続きの部分です（冒頭の数秒は前回の末尾と重なっています）。
+続きの音声の内容を以下の議事録に統合し、打合せ全体の議事録として同じ5セクション構成で出力してください。
+・これまでの議事録の内容は削除せず、続きの内容を該当するセクションに追記してください
+・続きの音声で決定・変更された事項は、決定事項と次回までの確認・準備事項に反映してください
+・重なっている冒頭部分の内容を重複して記載しないでください
+
+【これまでの議事録】
+{previous_minutes}"""
+
+def _is_cache_too_small(error: Exception) -> bool:
+    """コンテキストキャッシュの作成エラーが最小トークン数未満によるものか"""
+    message = str(error).lower()
+    return "too small" in message or "min_total_token_count" in message
+
+
 class GeminiService:
     def __init__(self):
         """Gemini APIサービスの初期化"""
@@ -39,6 +93,15 @@ class GeminiService:
             "models/gemini-flash-latest",       # 最新のFlashモデル (フォールバック)
         ]
 
+        # モデルごとのコンテキストキャッシュ {model_name: (CachedContent, GenerativeModel, 期限)}
+        self._context_caches: Dict[str, Tuple[Any, Any, float]] = {}
+        self._context_cache_retry_at: Dict[str, float] = {}
+        self._context_cache_disabled: Set[str] = set()
+        self._system_models: Dict[str, Any] = {}
+        self._cache_lock = threading.Lock()
+        self._prompt_token_count = None
+        self._prompt_token_retry_at = 0.0  # 概算値を使用中の場合の再計測の時刻（0は計測済み）
+
         self.model_name = None
         model_initialized = False
         last_error = None
@@ -108,27 +171,69 @@ class GeminiService:
 5. 補足メモ
 その他の気づきや注意点（なければ「特になし」）"""
     
-    async def analyze_audio(self, audio_file_path: str) -> str:
+    @tracer.traced("gemini.analyze_audio")
+    async def analyze_audio(self, audio_file_path: str, file_name: Optional[str] = None,
+                            on_uploaded: Optional[Callable[[str], None]] = None,
+                            previous_minutes: Optional[str] = None) -> str:
         """
         音声ファイルをGemini APIで解析
 
         Args:
             audio_file_path: 解析する音声ファイルのパス
+            file_name: 前回アップロード済みのGeminiファイル名（有効なら再アップロードしない）
+            on_uploaded: アップロード完了時にファイル名を受け取る処理（チェックポイント保存用）
+            previous_minutes: 音声が続きの部分の場合、それまでの議事録（統合した議事録全体を返す）
 
         Returns:
             解析結果（統合された議事録）
         """
+        # アップロード・処理待ち・生成はすべて同期APIのため、イベントループを塞がないようスレッドで実行
+        return await asyncio.to_thread(
+            self._analyze_audio_blocking, audio_file_path, file_name, on_uploaded, previous_minutes
+        )
+
+    def _reuse_uploaded_file(self, file_name: str):
+        """
+        アップロード済みのGeminiファイルを取得（期限切れ・処理失敗の場合はNone）
+
+        Args:
+            file_name: Geminiファイル名
+
+        Returns:
+            Geminiファイル
+        """
         try:
-            # ファイルサイズを取得
-            import os
-            file_size_mb = os.path.getsize(audio_file_path) / (1024 * 1024)
-            logger.info(f"Gemini APIで音声を解析: {audio_file_path} ({file_size_mb:.2f} MB)")
-            logger.info(f"使用モデル: {self.model_name}")
+            with tracer.span("gemini.get_file", file=file_name):
+                audio_file = genai.get_file(file_name)
+        except Exception as e:
+            logger.info(f"アップロード済みファイルを再利用できません: {file_name} - {str(e)}")
+            return None
+        if audio_file.state.name == "FAILED":
+            return None
+        logger.info(f"アップロード済みファイルを再利用: {file_name}")
+        return audio_file
+
+    def _upload_audio_file(self, audio_file_path: str, file_size_mb: float, audio_file=None,
+                           on_uploaded: Optional[Callable[[str], None]] = None):
+        """
+        音声ファイルをFiles APIでアップロードし、処理の完了を待機
 
-            # 音声ファイルをアップロード
+        Args:
+            audio_file_path: 音声ファイルのパス
+            file_size_mb: ファイルサイズ（MB）
+            audio_file: 前回アップロード済みのGeminiファイル（有効なら再アップロードしない）
+            on_uploaded: アップロード完了時にファイル名を受け取る処理
+
+        Returns:
+            処理が完了したGeminiファイル
+        """
+        if audio_file is None:
             try:
                 logger.info("Gemini APIへファイルアップロードを開始...")
-                audio_file = genai.upload_file(path=audio_file_path)
+                upload_start_time = time.time()
+                with tracer.span("gemini.upload_file", size_mb=round(file_size_mb, 2)):
+                    audio_file = genai.upload_file(path=audio_file_path)
+                STAGE_DURATION.observe(time.time() - upload_start_time, stage="gemini_upload")
                 logger.info(f"ファイルアップロード完了: {audio_file.name}")
             except Exception as e:
                 logger.error(f"ファイルアップロードエラー: {str(e)}")
@@ -137,11 +242,15 @@ class GeminiService:
                     f"ファイル形式を確認してください。\n"
                     f"エラー詳細: {str(e)}"
                 )
-
-            # アップロード処理の完了を待機
-            max_wait_time = 300  # 最大300秒（5分）待機
-            wait_interval = 3  # 3秒ごとにチェック
-            elapsed_time = 0
+            if on_uploaded is not None:
+                on_uploaded(audio_file.name)
+
+        # アップロード処理の完了を待機
+        max_wait_time = 300  # 最大300秒（5分）待機
+        wait_interval = 3  # 3秒ごとにチェック
+        elapsed_time = 0
+        processing_start_time = time.time()
+        with tracer.span("gemini.processing_wait", file=audio_file.name):
             while audio_file.state.name == "PROCESSING":
                 if elapsed_time >= max_wait_time:
                     raise TimeoutError(f"ファイル処理がタイムアウトしました（{max_wait_time}秒経過）")
@@ -150,24 +259,86 @@ class GeminiService:
                 audio_file = genai.get_file(audio_file.name)
                 elapsed_time += wait_interval
 
-            if audio_file.state.name == "FAILED":
-                raise ValueError(f"ファイル処理に失敗しました: {audio_file.state.name}")
+        STAGE_DURATION.observe(time.time() - processing_start_time, stage="gemini_processing_wait")
+
+        if audio_file.state.name == "FAILED":
+            raise ValueError(f"ファイル処理に失敗しました: {audio_file.state.name}")
+
+        logger.info(f"ファイル処理完了: {audio_file.state.name}")
+        return audio_file
+
+    def _analyze_audio_blocking(self, audio_file_path: str, file_name: Optional[str] = None,
+                                on_uploaded: Optional[Callable[[str], None]] = None,
+                                previous_minutes: Optional[str] = None) -> str:
+        """
+        音声ファイルをGemini APIで解析（同期処理）
+
+        Args:
+            audio_file_path: 解析する音声ファイルのパス
+            file_name: 前回アップロード済みのGeminiファイル名
+            on_uploaded: アップロード完了時にファイル名を受け取る処理
+            previous_minutes: 音声が続きの部分の場合、それまでの議事録
+
+        Returns:
+            解析結果（統合された議事録）
+        """
+        try:
+            # ファイルサイズを取得
+            import os
+            file_size_mb = os.path.getsize(audio_file_path) / (1024 * 1024)
+            logger.info(f"Gemini APIで音声を解析: {audio_file_path} ({file_size_mb:.2f} MB)")
+            logger.info(f"使用モデル: {self.model_name}")
 
-            logger.info(f"ファイル処理完了: {audio_file.state.name}")
+            # 小さい音声はリクエストに直接含め、それ以外はFiles APIでアップロード（前回のアップロードが有効なら再利用）
+            audio_file = self._reuse_uploaded_file(file_name) if file_name else None
+            mime_type = INLINE_MIME_TYPES.get(os.path.splitext(audio_file_path)[1].lower())
+            transfer_start_time = time.time()
+            if audio_file is None and mime_type and os.path.getsize(audio_file_path) <= GEMINI_INLINE_MAX_BYTES:
+                transfer_mode = "inline"
+                with tracer.span("gemini.inline_audio", size_mb=round(file_size_mb, 2), mime_type=mime_type):
+                    with open(audio_file_path, "rb") as f:
+                        audio_part = {"mime_type": mime_type, "data": f.read()}
+                STAGE_DURATION.observe(time.time() - transfer_start_time, stage="gemini_inline_read")
+                logger.info("音声をリクエストに直接含めて送信（Files APIのアップロード・処理待ちを省略）")
+            else:
+                transfer_mode = "files_api"
+                audio_file = self._upload_audio_file(audio_file_path, file_size_mb, audio_file, on_uploaded)
+                audio_part = audio_file
 
             # Geminiで解析
             logger.info("Gemini APIに解析リクエストを送信")
             analysis_start_time = time.time()
+            model, cache_used = self._get_prompt_model()
+            logger.info(f"システムプロンプト: {'コンテキストキャッシュ使用' if cache_used else 'system_instruction使用'}")
+            contents = [audio_part]
+            if previous_minutes:
+                # 続きの音声のみを送り、それまでの議事録と統合した全体を出力させる
+                contents = [CONTINUATION_PROMPT.format(previous_minutes=previous_minutes), audio_part]
             try:
-                response = self.model.generate_content(
-                    [self.prompt, audio_file],
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.1,  # 創造性を最小限に抑えて重複を防止
-                        max_output_tokens=65536,  # Gemini 2.5 Flashの最大値（3時間超の会議に対応）
+                with tracer.span("gemini.generate_content", model=self.model_name, context_cache=cache_used,
+                                 continuation=bool(previous_minutes), audio_transfer=transfer_mode):
+                    response = model.generate_content(
+                        contents,
+                        generation_config=genai.types.GenerationConfig(
+                            temperature=0.1,  # 創造性を最小限に抑えて重複を防止
+                            max_output_tokens=MAX_OUTPUT_TOKENS,
+                        )
                     )
-                )
                 analysis_time = time.time() - analysis_start_time
+                STAGE_DURATION.observe(analysis_time, stage="gemini_generate")
+                GEMINI_AUDIO_DURATION.observe(time.time() - transfer_start_time, mode=transfer_mode)
                 logger.info(f"Gemini API解析完了 - 処理時間: {analysis_time:.2f}秒")
+                usage = getattr(response, "usage_metadata", None)
+                if usage is not None:
+                    cached_tokens = getattr(usage, 'cached_content_token_count', 0) or 0
+                    logger.info(
+                        f"トークン使用量 - 入力: {usage.prompt_token_count}, "
+                        f"キャッシュ: {cached_tokens}, "
+                        f"出力: {usage.candidates_token_count}"
+                    )
+                    GEMINI_TOKENS.inc(usage.prompt_token_count or 0, type="prompt")
+                    GEMINI_TOKENS.inc(cached_tokens, type="cached")
+                    GEMINI_TOKENS.inc(usage.candidates_token_count or 0, type="output")
             except Exception as e:
                 error_msg = str(e)
                 logger.error(f"generate_contentエラー: {error_msg}")
@@ -198,6 +369,7 @@ class GeminiService:
                 if str(finish_reason) == "FinishReason.MAX_TOKENS" or str(finish_reason) == "2":
                     logger.warning("【警告】出力がmax_output_tokensに達して途中で切れました")
                     output_truncated = True
+                    GEMINI_TRUNCATED.inc()
 
             # レスポンスのパース
             result_text = response.text
@@ -212,12 +384,14 @@ class GeminiService:
             # 重複行を検出・削除する後処理
             result_text = self._remove_duplicate_lines(result_text)
 
-            # アップロードしたファイルを削除
-            try:
-                genai.delete_file(audio_file.name)
-                logger.info("アップロードファイルを削除")
-            except Exception as e:
-                logger.warning(f"ファイル削除エラー: {str(e)}")
+            # アップロードしたファイルを削除（リクエストに直接含めた場合は不要）
+            if audio_file is not None:
+                try:
+                    with tracer.span("gemini.delete_file", file=audio_file.name):
+                        genai.delete_file(audio_file.name)
+                    logger.info("アップロードファイルを削除")
+                except Exception as e:
+                    logger.warning(f"ファイル削除エラー: {str(e)}")
 
             return result_text.strip()
 
@@ -225,6 +399,145 @@ class GeminiService:
             logger.error(f"Gemini API解析エラー: {str(e)}")
             raise
 
+    def count_prompt_tokens(self) -> int:
+        """
+        システムプロンプトのトークン数を取得（初回のみAPIで計測）
+
+        Returns:
+            プロンプトのトークン数
+        """
+        now = time.time()
+        if self._prompt_token_count is None or (self._prompt_token_retry_at and now >= self._prompt_token_retry_at):
+            try:
+                result = self.model.count_tokens(
+                    self.prompt, request_options={"timeout": COUNT_TOKENS_TIMEOUT_SECONDS}
+                )
+                self._prompt_token_count = result.total_tokens
+                self._prompt_token_retry_at = 0.0
+            except Exception as e:
+                # 計測できない場合は文字数から概算（日本語は概ね1文字1トークン）し、しばらくは再計測しない
+                logger.warning(
+                    f"トークン数の計測エラー（概算値を使用し{COUNT_TOKENS_RETRY_SECONDS}秒後に再計測）: {str(e)}"
+                )
+                self._prompt_token_count = len(self.prompt)
+                self._prompt_token_retry_at = now + COUNT_TOKENS_RETRY_SECONDS
+        return self._prompt_token_count
+
+    def estimate_input_tokens(self, duration_seconds: float) -> int:
+        """
+        音声の長さから入力トークン数を見積もり
+
+        Args:
+            duration_seconds: 音声の再生時間（秒）
+
+        Returns:
+            推定入力トークン数（プロンプト + 音声）
+        """
+        audio_tokens = int(duration_seconds * AUDIO_TOKENS_PER_SECOND)
+        return self.count_prompt_tokens() + audio_tokens
+
+    def _get_prompt_model(self) -> Tuple[Any, bool]:
+        """
+        システムプロンプトを保持したモデルを取得
+        コンテキストキャッシュが使えればキャッシュ済みモデルを再利用し、
+        使えない場合はsystem_instruction付きモデルにフォールバック
+
+        Returns:
+            (モデル, コンテキストキャッシュを使用しているかどうか)
+        """
+        model_name = self.model_name
+        if CONTEXT_CACHE_ENABLED and model_name not in self._context_cache_disabled:
+            cached_model = self._get_cached_model(model_name)
+            if cached_model is not None:
+                return cached_model, True
+
+        with self._cache_lock:
+            model = self._system_models.get(model_name)
+            if model is None:
+                model = genai.GenerativeModel(model_name, system_instruction=self.prompt)
+                self._system_models[model_name] = model
+        return model, False
+
+    def _get_cached_model(self, model_name: str):
+        """
+        コンテキストキャッシュ済みモデルを取得（期限が近ければ延長、なければ作成）
+
+        Args:
+            model_name: モデル名
+
+        Returns:
+            キャッシュ済みモデル。キャッシュが利用できない場合はNone
+        """
+        # プロンプトが最小トークン数に満たない場合は作成しても必ず失敗するため試さない
+        min_tokens = CONTEXT_CACHE_MIN_TOKENS.get(model_name, CONTEXT_CACHE_DEFAULT_MIN_TOKENS)
+        prompt_tokens = self.count_prompt_tokens()
+        if prompt_tokens < min_tokens:
+            # 概算値の場合は計測できるまで判断を保留
+            if not self._prompt_token_retry_at:
+                self._disable_context_cache(
+                    model_name, f"プロンプトが最小トークン数未満（{prompt_tokens} < {min_tokens}）"
+                )
+            return None
+
+        with self._cache_lock:
+            now = time.time()
+            entry = self._context_caches.get(model_name)
+
+            if entry is not None:
+                cached_content, model, expires_at = entry
+                if now < expires_at - CONTEXT_CACHE_REFRESH_MARGIN_SECONDS:
+                    return model
+
+                # 有効期限が近いのでTTLを延長
+                try:
+                    cached_content.update(ttl=timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS))
+                    self._context_caches[model_name] = (
+                        cached_content, model, now + CONTEXT_CACHE_TTL_SECONDS
+                    )
+                    logger.info(f"コンテキストキャッシュを延長: {cached_content.name}")
+                    return model
+                except Exception as e:
+                    logger.warning(f"コンテキストキャッシュ延長エラー（再作成します）: {str(e)}")
+                    del self._context_caches[model_name]
+
+            if now < self._context_cache_retry_at.get(model_name, 0):
+                return None
+
+            try:
+                cached_content = caching.CachedContent.create(
+                    model=model_name,
+                    display_name="minutes-system-prompt",
+                    system_instruction=self.prompt,
+                    ttl=timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS),
+                )
+                model = genai.GenerativeModel.from_cached_content(cached_content)
+            except Exception as e:
+                # 最小トークン数未満は再試行しても変わらないため、このモデルではキャッシュを使わない
+                if _is_cache_too_small(e):
+                    self._context_cache_disabled.add(model_name)
+                    logger.info(f"コンテキストキャッシュを使用しません（{model_name}）: {str(e)}")
+                    return None
+                # 未対応モデル・一時的なエラーなどはsystem_instructionで処理を継続
+                logger.warning(
+                    f"コンテキストキャッシュ作成不可（{CONTEXT_CACHE_RETRY_SECONDS}秒後に再試行）: {str(e)}"
+                )
+                self._context_cache_retry_at[model_name] = now + CONTEXT_CACHE_RETRY_SECONDS
+                return None
+
+            self._context_caches[model_name] = (
+                cached_content, model, now + CONTEXT_CACHE_TTL_SECONDS
+            )
+            logger.info(f"コンテキストキャッシュ作成: {cached_content.name}")
+            return model
+
+    def _disable_context_cache(self, model_name: str, reason: str):
+        """モデルのコンテキストキャッシュを無効化（ログは最初の1回のみ）"""
+        with self._cache_lock:
+            if model_name in self._context_cache_disabled:
+                return
+            self._context_cache_disabled.add(model_name)
+        logger.info(f"コンテキストキャッシュを使用しません（{model_name}）: {reason}")
+
     def _remove_duplicate_lines(self, text: str) -> str:
         """
         重複行を検出・削除する後処理
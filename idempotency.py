@@ -0,0 +1,117 @@
+"""
+リクエストの重複排除モジュール
+同じ冪等キーの同時リクエストは実行中の1件の結果を共有し（single-flight）、
+完了後の再試行には保存済みの結果を返す
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 完了した結果をメモリに保持する時間（秒）
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# メモリに保持する結果の最大件数
+IDEMPOTENCY_MAX_ENTRIES = 500
+
+
+class SingleFlight:
+    """冪等キーごとに処理を1回だけ実行"""
+
+    def __init__(self, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS,
+                 max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        """
+        Args:
+            ttl_seconds: 完了した結果を保持する時間（秒）
+            max_entries: 保持する結果の最大件数
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._done: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.replayed_count = 0
+        self.joined_count = 0
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]],
+                  lookup: Optional[Callable[[], Awaitable[Any]]] = None) -> Tuple[Any, bool]:
+        """
+        冪等キーに対応する処理を実行（実行中・完了済みなら既存の結果を使用）
+
+        Args:
+            key: 冪等キー
+            func: 結果を生成する処理
+            lookup: メモリにない場合に永続化済みの結果を探す処理（見つからなければNone）
+
+        Returns:
+            (結果, 既存の結果を返したか)
+        """
+        cached = self._get_done(key)
+        if cached is not None:
+            self.replayed_count += 1
+            logger.info(f"完了済みの結果を返却: {key}")
+            return cached, True
+
+        if key not in self._inflight and lookup is not None:
+            stored = await lookup()
+            if stored is not None:
+                self._set_done(key, stored)
+                self.replayed_count += 1
+                logger.info(f"保存済みの結果を返却: {key}")
+                return stored, True
+            # 検索を待つ間に同じキーの処理が完了・開始している場合はそれを使用
+            cached = self._get_done(key)
+            if cached is not None:
+                self.replayed_count += 1
+                logger.info(f"完了済みの結果を返却: {key}")
+                return cached, True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.joined_count += 1
+            logger.info(f"実行中の処理に合流: {key}")
+            # 待機側がキャンセルされても実行中の処理は止めない
+            return await asyncio.shield(task), True
+
+        # 最初のリクエストが切断されても処理を完了させ、結果を後続に渡すため別タスクで実行
+        task = asyncio.ensure_future(func())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._on_done(key, t))
+        return await asyncio.shield(task), False
+
+    def is_running(self, key: str) -> bool:
+        """冪等キーの処理が実行中か"""
+        return key in self._inflight
+
+    def _on_done(self, key: str, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        # 失敗した場合は保持せず、再試行で再実行する
+        if not task.cancelled() and task.exception() is None:
+            self._set_done(key, task.result())
+
+    def _get_done(self, key: str) -> Optional[Any]:
+        entry = self._done.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            self._done.pop(key, None)
+            return None
+        return result
+
+    def _set_done(self, key: str, result: Any):
+        self._done[key] = (time.monotonic(), result)
+        self._done.move_to_end(key)
+        while len(self._done) > self.max_entries:
+            self._done.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """実行中・保持中の件数と重複排除の回数"""
+        return {
+            "inflight": len(self._inflight),
+            "cached": len(self._done),
+            "replayed": self.replayed_count,
+            "joined": self.joined_count,
+        }
@@ -0,0 +1,406 @@
+"""
+議事録生成ジョブのチェックポイント
+ステージ（ダウンロード → 圧縮 → Geminiアップロード → 解析結果）ごとの成果を永続化し、
+失敗後の再試行やコンテナ再起動後は完了済みのステージを飛ばして再開する
+本番はGCS（アップロード用バケットの checkpoints/ 配下）、ローカルはファイルシステムに保存
+"""
+import os
+import json
+import time
+import shutil
+import threading
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# 保存先（gcs / local / none、gcsでもバケット未設定の場合はlocal）
+CHECKPOINT_STORE = os.getenv("CHECKPOINT_STORE", "gcs").lower()
+# GCS上の保存先の接頭辞
+CHECKPOINT_PREFIX = os.getenv("CHECKPOINT_PREFIX", "checkpoints/")
+# ローカルの保存先
+CHECKPOINT_DIR = os.getenv(
+    "CHECKPOINT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "checkpoints")
+)
+# 起動時に、この時間以上更新されていない（前のコンテナで中断した）ジョブを再開（秒）
+CHECKPOINT_STALE_SECONDS = float(os.getenv("CHECKPOINT_STALE_SECONDS", "1800"))
+# 処理中のジョブが中断したとみなされないよう生存を記録する間隔（秒、CHECKPOINT_STALE_SECONDS より十分短くする）
+CHECKPOINT_HEARTBEAT_SECONDS = float(os.getenv("CHECKPOINT_HEARTBEAT_SECONDS", "300"))
+# Gemini Files APIのファイルの保持期間（48時間）より少し短い再利用の上限（秒）
+GEMINI_FILE_REUSE_SECONDS = 46 * 3600
+
+# 読み込んだ時点のチェックポイントの版（再開の引き受けを1つのインスタンスに限る条件付き書き込みに使用、保存はしない）
+VERSION_FIELD = "_version"
+# 処理中のインスタンスが最後に生存を記録した時刻（state.json とは別に保存し、読み込み時に付加）
+HEARTBEAT_FIELD = "_heartbeat_at"
+# 読み込み時に付加し、保存しない項目
+TRANSIENT_FIELDS = (VERSION_FIELD, HEARTBEAT_FIELD)
+# 生存の記録のファイル名
+HEARTBEAT_NAME = "heartbeat"
+
+# ステージ（後のものほど進んでいる）
+STAGES = ("downloaded", "compressed", "gemini_uploaded", "result")
+
+
+def checkpoint_id(job_key: str) -> str:
+    """冪等キーから保存用のIDを作成（ユーザー名などをパスに含めない）"""
+    return hashlib.sha256(job_key.encode("utf-8")).hexdigest()[:32]
+
+
+def reached(state: Optional[Dict], stage: str) -> bool:
+    """
+    チェックポイントが指定のステージに到達しているか
+
+    Args:
+        state: チェックポイント
+        stage: ステージ名
+
+    Returns:
+        到達している場合True
+    """
+    if not state or state.get("stage") not in STAGES:
+        return False
+    return STAGES.index(state["stage"]) >= STAGES.index(stage)
+
+
+def gemini_file_usable(state: Optional[Dict]) -> bool:
+    """チェックポイントのGeminiファイルがまだ保持期間内か"""
+    uploaded_at = (state or {}).get("gemini_uploaded_at")
+    return bool(uploaded_at) and time.time() - uploaded_at < GEMINI_FILE_REUSE_SECONDS
+
+
+class CheckpointStore(ABC):
+    """チェックポイントの保存先の共通インターフェース"""
+
+    @abstractmethod
+    def load(self, job_key: str) -> Optional[Dict]:
+        """
+        チェックポイントを読み込み
+
+        Args:
+            job_key: ジョブの冪等キー
+
+        Returns:
+            チェックポイント（存在しない場合はNone）
+        """
+
+    @abstractmethod
+    def _write_state(self, job_key: str, state: Dict):
+        """チェックポイントを書き込み"""
+
+    @abstractmethod
+    def _write_state_if(self, job_key: str, state: Dict, version) -> bool:
+        """
+        チェックポイントが読み込んだ時点の版のままの場合のみ書き込み
+
+        Args:
+            job_key: ジョブの冪等キー
+            state: 書き込むチェックポイント
+            version: 読み込んだ時点の版（iter_states の VERSION_FIELD）
+
+        Returns:
+            書き込めた場合True（他のインスタンスが先に更新していればFalse）
+        """
+
+    @abstractmethod
+    def touch(self, job_key: str):
+        """
+        処理中のジョブの生存を記録（ステージの間の長い処理中に他のインスタンスが中断したとみなさないように）
+
+        Args:
+            job_key: ジョブの冪等キー
+        """
+
+    @abstractmethod
+    def put_artifact(self, job_key: str, name: str, path: str):
+        """
+        ステージの成果物（圧縮済み音声など）を保存
+
+        Args:
+            job_key: ジョブの冪等キー
+            name: 成果物の名前
+            path: 保存するファイル
+        """
+
+    @abstractmethod
+    def get_artifact(self, job_key: str, name: str, path: str) -> bool:
+        """
+        成果物を取得
+
+        Args:
+            job_key: ジョブの冪等キー
+            name: 成果物の名前
+            path: 保存先のファイル
+
+        Returns:
+            取得できた場合True
+        """
+
+    @abstractmethod
+    def delete(self, job_key: str):
+        """
+        チェックポイントと成果物を削除（ジョブ完了時）
+
+        Args:
+            job_key: ジョブの冪等キー
+        """
+
+    @abstractmethod
+    def iter_states(self) -> Iterator[Dict]:
+        """
+        全チェックポイントを取得（起動時の再開用）
+
+        Yields:
+            チェックポイント
+        """
+
+    def save(self, job_key: str, stage: str, state: Dict, **values) -> Dict:
+        """
+        ステージの完了を記録
+
+        Args:
+            job_key: ジョブの冪等キー
+            stage: 完了したステージ
+            state: 現在のチェックポイント（更新して返す）
+            **values: 記録する値
+
+        Returns:
+            更新後のチェックポイント
+        """
+        state.update(values)
+        for field in TRANSIENT_FIELDS:
+            state.pop(field, None)
+        state["key"] = job_key
+        state["stage"] = stage
+        state["updated_at"] = time.time()
+        try:
+            self._write_state(job_key, state)
+            logger.info(f"チェックポイント保存: {stage}")
+        except Exception as e:
+            # 保存に失敗してもジョブは継続（再試行時に前のステージからやり直すだけ）
+            logger.warning(f"チェックポイント保存エラー: {stage} - {str(e)}")
+        return state
+
+    def claim(self, job_key: str, state: Dict, **values) -> Optional[Dict]:
+        """
+        中断したジョブの再開を引き受ける（複数のインスタンスが同時に見つけても1つだけが成功）
+
+        Args:
+            job_key: ジョブの冪等キー
+            state: stale_states で取得したチェックポイント
+            **values: 記録する値
+
+        Returns:
+            更新後のチェックポイント（他のインスタンスが先に引き受けた・更新した場合はNone）
+        """
+        claimed = {key: value for key, value in state.items() if key not in TRANSIENT_FIELDS}
+        claimed.update(values)
+        claimed["updated_at"] = time.time()
+        try:
+            if not self._write_state_if(job_key, claimed, state.get(VERSION_FIELD)):
+                return None
+        except Exception as e:
+            logger.warning(f"チェックポイントの引き受けエラー: {str(e)}")
+            return None
+        return claimed
+
+    def stale_states(self, stale_seconds: float = CHECKPOINT_STALE_SECONDS) -> Iterator[Dict]:
+        """
+        一定時間更新されていない（中断した）チェックポイント
+
+        Args:
+            stale_seconds: 中断とみなす経過時間（秒）
+
+        Yields:
+            チェックポイント
+        """
+        now = time.time()
+        for state in self.iter_states():
+            last_seen = max(state.get("updated_at", 0), state.get(HEARTBEAT_FIELD) or 0)
+            if now - last_seen >= stale_seconds:
+                yield state
+
+
+class LocalCheckpointStore(CheckpointStore):
+    """ローカルのディレクトリに保存（単一インスタンス用）"""
+
+    def __init__(self, directory: str = CHECKPOINT_DIR):
+        """
+        Args:
+            directory: 保存先のディレクトリ
+        """
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        logger.info(f"チェックポイント保存先（ローカル）: {directory}")
+
+    def _job_dir(self, job_key: str) -> str:
+        return os.path.join(self.directory, checkpoint_id(job_key))
+
+    def load(self, job_key: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self._job_dir(job_key), "state.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_state(self, job_key: str, state: Dict):
+        job_dir = self._job_dir(job_key)
+        os.makedirs(job_dir, exist_ok=True)
+        # 書き込み途中で停止しても壊れたファイルを残さない
+        temp_path = os.path.join(job_dir, "state.json.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(temp_path, os.path.join(job_dir, "state.json"))
+
+    def _write_state_if(self, job_key: str, state: Dict, version) -> bool:
+        # 単一インスタンス用のため、同じプロセス内で更新されていないことだけを確認
+        with self._lock:
+            current = self.load(job_key)
+            if current is None or current.get("updated_at") != version:
+                return False
+            self._write_state(job_key, state)
+            return True
+
+    def touch(self, job_key: str):
+        job_dir = self._job_dir(job_key)
+        os.makedirs(job_dir, exist_ok=True)
+        with open(os.path.join(job_dir, HEARTBEAT_NAME), "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
+
+    def put_artifact(self, job_key: str, name: str, path: str):
+        job_dir = self._job_dir(job_key)
+        os.makedirs(job_dir, exist_ok=True)
+        shutil.copyfile(path, os.path.join(job_dir, name))
+
+    def get_artifact(self, job_key: str, name: str, path: str) -> bool:
+        try:
+            shutil.copyfile(os.path.join(self._job_dir(job_key), name), path)
+            return True
+        except OSError:
+            return False
+
+    def delete(self, job_key: str):
+        shutil.rmtree(self._job_dir(job_key), ignore_errors=True)
+
+    def iter_states(self) -> Iterator[Dict]:
+        for entry in os.scandir(self.directory):
+            try:
+                with open(os.path.join(entry.path, "state.json"), encoding="utf-8") as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            state[VERSION_FIELD] = state.get("updated_at")
+            try:
+                state[HEARTBEAT_FIELD] = os.path.getmtime(os.path.join(entry.path, HEARTBEAT_NAME))
+            except OSError:
+                pass
+            yield state
+
+
+class GCSCheckpointStore(CheckpointStore):
+    """GCSに保存（Cloud Runの再起動・別インスタンスからも再開可能）"""
+
+    def __init__(self, bucket, prefix: str = CHECKPOINT_PREFIX):
+        """
+        Args:
+            bucket: GCSバケット
+            prefix: 保存先の接頭辞
+        """
+        self.bucket = bucket
+        self.prefix = prefix
+        logger.info(f"チェックポイント保存先（GCS）: {prefix}")
+
+    def _blob_name(self, job_key: str, name: str) -> str:
+        return f"{self.prefix}{checkpoint_id(job_key)}/{name}"
+
+    def load(self, job_key: str) -> Optional[Dict]:
+        try:
+            data = self.bucket.blob(self._blob_name(job_key, "state.json")).download_as_bytes()
+            return json.loads(data)
+        except Exception:
+            return None
+
+    def _write_state(self, job_key: str, state: Dict):
+        self.bucket.blob(self._blob_name(job_key, "state.json")).upload_from_string(
+            json.dumps(state, ensure_ascii=False).encode("utf-8"), content_type="application/json"
+        )
+
+    def _write_state_if(self, job_key: str, state: Dict, version) -> bool:
+        from google.api_core.exceptions import PreconditionFailed
+
+        blob = self.bucket.blob(self._blob_name(job_key, "state.json"))
+        try:
+            # 読み込んだ時点の世代のままの場合のみ上書き（他のインスタンスが先に書き込んでいれば失敗）
+            blob.upload_from_string(
+                json.dumps(state, ensure_ascii=False).encode("utf-8"), content_type="application/json",
+                if_generation_match=version
+            )
+        except PreconditionFailed:
+            return False
+        return True
+
+    def touch(self, job_key: str):
+        # state.json の世代（再開の引き受けの条件）を変えないよう別のオブジェクトに記録
+        self.bucket.blob(self._blob_name(job_key, HEARTBEAT_NAME)).upload_from_string(
+            b"", content_type="text/plain"
+        )
+
+    def put_artifact(self, job_key: str, name: str, path: str):
+        self.bucket.blob(self._blob_name(job_key, name)).upload_from_filename(path)
+
+    def get_artifact(self, job_key: str, name: str, path: str) -> bool:
+        try:
+            self.bucket.blob(self._blob_name(job_key, name)).download_to_filename(path)
+            return True
+        except Exception as e:
+            logger.warning(f"チェックポイントの成果物を取得できません: {name} - {str(e)}")
+            return False
+
+    def delete(self, job_key: str):
+        for blob in self.bucket.list_blobs(prefix=f"{self.prefix}{checkpoint_id(job_key)}/"):
+            try:
+                blob.delete()
+            except Exception as e:
+                logger.warning(f"チェックポイント削除エラー: {blob.name} - {str(e)}")
+
+    def iter_states(self) -> Iterator[Dict]:
+        # 生存の記録は一覧の更新日時を使う（ジョブごとの読み込みは state.json のみ）
+        blobs = list(self.bucket.list_blobs(prefix=self.prefix))
+        heartbeats = {
+            blob.name.rsplit("/", 1)[0]: blob.updated.timestamp()
+            for blob in blobs if blob.name.endswith(f"/{HEARTBEAT_NAME}") and blob.updated is not None
+        }
+        for blob in blobs:
+            if not blob.name.endswith("/state.json"):
+                continue
+            try:
+                # 一覧の世代を指定して読み込み、条件付き書き込みの版と内容を一致させる
+                state = json.loads(blob.download_as_bytes(if_generation_match=blob.generation))
+            except Exception:
+                continue
+            state[VERSION_FIELD] = blob.generation
+            heartbeat_at = heartbeats.get(blob.name.rsplit("/", 1)[0])
+            if heartbeat_at is not None:
+                state[HEARTBEAT_FIELD] = heartbeat_at
+            yield state
+
+
+def create_checkpoint_store(bucket) -> Optional[CheckpointStore]:
+    """
+    CHECKPOINT_STORE に応じた保存先を作成
+
+    Args:
+        bucket: GCSバケット（未設定の場合はNone）
+
+    Returns:
+        保存先（none の場合はNone）
+    """
+    if CHECKPOINT_STORE == "none":
+        return None
+    if CHECKPOINT_STORE == "gcs" and bucket is not None:
+        return GCSCheckpointStore(bucket)
+    return LocalCheckpointStore()
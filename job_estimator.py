@@ -0,0 +1,122 @@
+"""
+処理時間・トークン数の事前見積もりモジュール
+過去の処理実績（ステージごとの所要時間）から処理時間を推定
+"""
+import threading
+import logging
+from collections import deque
+from statistics import median
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 分割処理を推奨する閾値（上限に対する割合）
+CHUNKED_THRESHOLD_RATIO = 0.8
+
+
+class StageTimingHistory:
+    """ステージごとの処理実績を保持（単位量あたりの所要時間）"""
+
+    # 実績がない場合の既定値
+    # download: 1MBあたりの秒数, compress/gemini: 音声1分あたりの秒数
+    # output_chars: 音声1分あたりの議事録文字数
+    DEFAULT_RATES = {
+        "download": 0.05,
+        "compress": 0.5,
+        "gemini": 1.5,
+        "output_chars": 150.0,
+    }
+
+    def __init__(self, max_samples: int = 200):
+        """
+        Args:
+            max_samples: ステージごとに保持する実績数
+        """
+        self.max_samples = max_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, value: float, basis: float):
+        """
+        処理実績を記録
+
+        Args:
+            stage: ステージ名（download, compress, gemini, output_chars）
+            value: 実測値（秒または文字数）
+            basis: 基準量（MBまたは音声の分数）
+        """
+        if not basis or basis <= 0:
+            return
+        with self._lock:
+            samples = self._samples.setdefault(stage, deque(maxlen=self.max_samples))
+            samples.append(value / basis)
+
+    def rate(self, stage: str) -> float:
+        """
+        単位量あたりの値（実績の中央値、実績がなければ既定値）
+
+        Args:
+            stage: ステージ名
+
+        Returns:
+            単位量あたりの値
+        """
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples:
+                return median(samples)
+        return self.DEFAULT_RATES.get(stage, 0.0)
+
+    def sample_count(self, stage: str) -> int:
+        """ステージの実績数"""
+        with self._lock:
+            return len(self._samples.get(stage, ()))
+
+
+class JobEstimator:
+    """音声の長さとサイズから処理時間・トークン数を見積もる"""
+
+    def __init__(self, history: Optional[StageTimingHistory] = None):
+        self.history = history or StageTimingHistory()
+
+    def estimate(self, duration_seconds: float, file_size_bytes: int, input_tokens: int) -> Dict:
+        """
+        処理の見積もりを作成
+
+        Args:
+            duration_seconds: 音声の再生時間（秒）
+            file_size_bytes: 元ファイルのサイズ（バイト）
+            input_tokens: 推定入力トークン数
+
+        Returns:
+            見積もり結果
+        """
+        # google.generativeaiのimportを起動時に行わないよう遅延import
+        from gemini_service import MAX_OUTPUT_TOKENS, INPUT_TOKEN_LIMIT
+
+        duration_minutes = duration_seconds / 60
+        file_size_mb = file_size_bytes / (1024 * 1024)
+
+        stage_seconds = {
+            "download": self.history.rate("download") * file_size_mb,
+            "compress": self.history.rate("compress") * duration_minutes,
+            "gemini": self.history.rate("gemini") * duration_minutes,
+        }
+        expected_output_tokens = int(self.history.rate("output_chars") * duration_minutes)
+
+        chunked_recommended = (
+            input_tokens > INPUT_TOKEN_LIMIT * CHUNKED_THRESHOLD_RATIO
+            or expected_output_tokens > MAX_OUTPUT_TOKENS * CHUNKED_THRESHOLD_RATIO
+        )
+
+        return {
+            "duration_seconds": round(duration_seconds, 1),
+            "file_size_mb": round(file_size_mb, 2),
+            "estimated_input_tokens": input_tokens,
+            "estimated_output_tokens": expected_output_tokens,
+            "max_output_tokens": MAX_OUTPUT_TOKENS,
+            "estimated_stage_seconds": {k: round(v, 1) for k, v in stage_seconds.items()},
+            "estimated_total_seconds": round(sum(stage_seconds.values()), 1),
+            "history_samples": self.history.sample_count("gemini"),
+            "chunked_recommended": chunked_recommended,
+        }
@@ -0,0 +1,176 @@
+"""
+イベントループの遅延・ブロッキング検出モジュール
+ループ上の定期タスクで遅延を計測し、監視スレッドがループの停止を検出したら
+その時点のスタックを採取してログ・メトリクスに記録
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+import logging
+from collections import Counter as _Counter, deque
+from typing import Dict, List, Optional
+
+from metrics import LOOP_LAG, LOOP_BLOCKED_TOTAL, LOOP_BLOCKED_DURATION
+
+logger = logging.getLogger(__name__)
+
+# 監視の有効/無効
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+# この時間以上ループが止まったらブロッキングとして記録（ミリ秒）
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+# 遅延の計測間隔（秒）
+LOOP_LAG_INTERVAL_SECONDS = 0.5
+# 保持するブロッキングの記録数
+MAX_BLOCKING_EVENTS = 100
+# 1回のブロッキングで保持するスタックの深さ
+STACK_LIMIT = 30
+
+
+class BlockingEvent:
+    """イベントループを止めた処理の記録"""
+
+    def __init__(self, started_at: float, stack: List[str]):
+        self.started_at = started_at
+        self.wall_time = time.time()
+        self.stack = stack
+        self.duration_seconds: Optional[float] = None
+
+    @property
+    def location(self) -> str:
+        """ブロックしていた箇所（アプリケーションコードの最も内側のフレーム）"""
+        for frame in reversed(self.stack):
+            if not any(marker in frame for marker in ("site-packages", "/lib/python", "<frozen")):
+                return frame.splitlines()[0].strip()
+        return self.stack[-1].splitlines()[0].strip() if self.stack else "unknown"
+
+    def to_dict(self) -> Dict:
+        return {
+            "timestamp": self.wall_time,
+            "duration_seconds": round(self.duration_seconds, 3) if self.duration_seconds is not None else None,
+            "location": self.location,
+            "stack": self.stack,
+        }
+
+
+class LoopMonitor:
+    """イベントループの遅延とブロッキングを監視"""
+
+    def __init__(self, threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS,
+                 interval_seconds: float = LOOP_LAG_INTERVAL_SECONDS):
+        """
+        Args:
+            threshold_ms: ブロッキングとみなす停止時間（ミリ秒）
+            interval_seconds: 遅延の計測間隔（秒）
+        """
+        self.threshold_seconds = threshold_ms / 1000
+        self.interval_seconds = interval_seconds
+        self.events: deque = deque(maxlen=MAX_BLOCKING_EVENTS)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._current: Optional[BlockingEvent] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._lag_task: Optional[asyncio.Task] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """
+        監視を開始（イベントループ上から呼び出す）
+
+        Args:
+            loop: 監視するイベントループ
+        """
+        if self._loop is not None:
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+
+        # ループが動いている間は短い間隔で生存時刻を更新
+        loop.call_soon(self._beat)
+        self._lag_task = loop.create_task(self._measure_lag())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        logger.info(f"イベントループ監視開始（閾値: {self.threshold_seconds * 1000:.0f}ms）")
+
+    def stop(self):
+        """監視を停止"""
+        self._stop.set()
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        self._loop = None
+
+    def _beat(self):
+        """ループ上で実行される生存通知"""
+        now = time.monotonic()
+        with self._lock:
+            event = self._current
+            self._current = None
+            self._last_beat = now
+        if event is not None:
+            self._finish(event, now)
+        if not self._stop.is_set() and self._loop is not None:
+            self._loop.call_later(self.threshold_seconds / 4, self._beat)
+
+    async def _measure_lag(self):
+        """sleepの予定時刻からの遅れをループ遅延として記録"""
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            expected = loop.time() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+    def _watch(self):
+        """監視スレッド：ループが閾値以上止まっていたらスタックを採取"""
+        while not self._stop.wait(self.threshold_seconds / 2):
+            with self._lock:
+                stalled = time.monotonic() - self._last_beat
+                if stalled < self.threshold_seconds or self._current is not None:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+                stack = traceback.format_stack(frame, limit=STACK_LIMIT)
+                self._current = BlockingEvent(self._last_beat, stack)
+
+    def _finish(self, event: BlockingEvent, resumed_at: float):
+        """ブロッキングの終了を記録"""
+        event.duration_seconds = resumed_at - event.started_at
+        self.events.append(event)
+        LOOP_BLOCKED_TOTAL.inc()
+        LOOP_BLOCKED_DURATION.observe(event.duration_seconds)
+        logger.warning(
+            f"イベントループが{event.duration_seconds * 1000:.0f}ms停止しました: {event.location}\n"
+            + "".join(event.stack[-8:])
+        )
+
+    def report(self) -> Dict:
+        """
+        ブロッキングの記録を集計
+
+        Returns:
+            箇所ごとの回数・合計時間と直近の記録
+        """
+        events = list(self.events)
+        counts = _Counter(event.location for event in events)
+        totals: Dict[str, float] = {}
+        for event in events:
+            totals[event.location] = totals.get(event.location, 0.0) + (event.duration_seconds or 0.0)
+
+        return {
+            "enabled": self._loop is not None,
+            "threshold_ms": self.threshold_seconds * 1000,
+            "locations": [
+                {"location": location, "count": count, "total_seconds": round(totals[location], 3)}
+                for location, count in counts.most_common()
+            ],
+            "recent": [event.to_dict() for event in events[-20:]],
+        }
+
+
+# アプリケーション全体で共有するモニター
+loop_monitor = LoopMonitor()
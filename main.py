@@ -1,30 +1,57 @@
 """
 議事録自動生成システム - FastAPI Backend
 """
-from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, status, Form
+import time
+_import_start = time.perf_counter()
+
+from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, status, Form, Request, Query, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, HTMLResponse
+from fastapi.responses import FileResponse, JSONResponse, HTMLResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import Optional
 import os
-import tempfile
+import asyncio
 import logging
 from datetime import datetime, timedelta
 import jwt
 from dotenv import load_dotenv
-from google.cloud import storage
-from google.auth import default
 import uuid
 
 # .envファイルから環境変数を読み込み
 load_dotenv()
 
-from audio_processor import AudioProcessor
-from gemini_service import GeminiService
+# Gemini・GCS・音声処理・ドキュメント生成は起動時間短縮のため初回利用時にimport
 from auth_service import AuthService
-from document_generator import DocumentGenerator
+from job_estimator import JobEstimator
+from transcode_pool import transcode_pool
+from scratch_space import ScratchSpace, ScratchSpaceFull
+from service_registry import ServiceRegistry
+from static_assets import StaticAssetCache
+from loop_monitor import loop_monitor, LOOP_MONITOR_ENABLED
+from minutes_store import create_minutes_store, new_minutes_id
+from minutes_search import build_search_index
+from idempotency import SingleFlight
+from gcs_sweeper import GCSOrphanSweeper, SweepInProgress, GCS_SWEEP_INTERVAL_SECONDS
+from fair_scheduler import FairScheduler, estimate_duration
+from job_checkpoint import (
+    create_checkpoint_store, reached, gemini_file_usable, CHECKPOINT_PREFIX, CHECKPOINT_HEARTBEAT_SECONDS
+)
+from audio_fingerprint import create_fingerprint_index, CONTINUATION_OVERLAP_SECONDS
+from direct_upload import create_direct_upload_store, is_direct_upload, UploadTooLarge, DirectUploadError
+from work_queue import (
+    create_work_queue, QueueWorkers, WORK_QUEUE, WORK_QUEUE_WORKERS, PENDING as WORK_PENDING,
+    RUNNING as WORK_RUNNING, FAILED as WORK_FAILED
+)
+import metrics
+from tracing import tracer, current_job_id, TracedBucket, TracingMiddleware
+
+services = ServiceRegistry(started_at=_import_start)
+services.record_phase("imports", time.perf_counter() - _import_start)
+_setup_start = time.perf_counter()
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
@@ -49,30 +76,286 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# APIリクエストごとのトレーシング（レスポンスヘッダー X-Job-Id でジョブIDを返す）
+# 順番待ちの定期確認・管理画面の参照はジョブとして記録しない（保持する直近のジョブを押し出さないように）
+app.add_middleware(
+    TracingMiddleware, tracer=tracer, exclude_paths=("/api/queue", "/api/admin/", "/api/metrics/")
+)
+
 # セキュリティ
 security = HTTPBearer()
 
 # GCS設定
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
-if GCS_BUCKET_NAME:
+
+# 起動時にバックグラウンドで全サービスを初期化するか
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+
+# 中断したジョブの確認間隔（秒、0で自動再開しない）と1ジョブあたりの再開回数の上限
+CHECKPOINT_RESUME_INTERVAL_SECONDS = float(os.getenv("CHECKPOINT_RESUME_INTERVAL_SECONDS", "300"))
+CHECKPOINT_MAX_RESUMES = int(os.getenv("CHECKPOINT_MAX_RESUMES", "3"))
+
+def _create_bucket():
+    """GCSバケットを初期化（未設定・初期化エラーの場合はNone）"""
+    if not GCS_BUCKET_NAME:
+        logger.warning("GCS_BUCKET_NAMEが設定されていません。GCS機能は無効です。")
+        return None
     try:
+        from google.cloud import storage
         storage_client = storage.Client()
         bucket = storage_client.bucket(GCS_BUCKET_NAME)
         logger.info(f"GCS初期化成功: バケット名 = {GCS_BUCKET_NAME}")
+        # blob操作をスパンとして記録
+        return TracedBucket(bucket, tracer)
     except Exception as e:
         logger.warning(f"GCS初期化エラー: {str(e)}")
-        storage_client = None
-        bucket = None
-else:
-    logger.warning("GCS_BUCKET_NAMEが設定されていません。GCS機能は無効です。")
-    storage_client = None
-    bucket = None
-
-# サービスの初期化
-audio_processor = AudioProcessor()
-gemini_service = GeminiService()
+        return None
+
+def _create_audio_processor():
+    from audio_processor import AudioProcessor
+    return AudioProcessor()
+
+def _create_gemini_service():
+    from gemini_service import GeminiService
+    return GeminiService()
+
+def _create_doc_generator():
+    from document_generator import DocumentGenerator
+    return DocumentGenerator()
+
+# サービスの初期化（重いものは初回利用時）
+bucket_service = services.register("gcs_bucket", _create_bucket)
+audio_processor_service = services.register("audio_processor", _create_audio_processor)
+gemini_service_holder = services.register("gemini_service", _create_gemini_service)
+doc_generator_service = services.register("doc_generator", _create_doc_generator)
+minutes_store_service = services.register("minutes_store", create_minutes_store)
+search_index_service = services.register("minutes_search", lambda: build_search_index(get_minutes_store()))
+checkpoint_store_service = services.register("checkpoints", lambda: create_checkpoint_store(get_bucket()))
+work_queue_service = services.register("work_queue", create_work_queue)
+fingerprint_index_service = services.register("fingerprint_index", create_fingerprint_index)
+direct_upload_service = services.register("direct_uploads", create_direct_upload_store)
+# チェックポイントは中断したジョブの再開に使うため削除しない（完了時・再開の上限到達時に削除）
+gcs_sweeper_service = services.register(
+    "gcs_sweeper",
+    lambda: GCSOrphanSweeper(get_bucket(), exclude_prefixes=[CHECKPOINT_PREFIX]) if get_bucket() else None
+)
 auth_service = AuthService()
-doc_generator = DocumentGenerator()
+job_estimator = JobEstimator()
+scratch_space = ScratchSpace()
+upload_flights = SingleFlight()
+fair_scheduler = FairScheduler()
+queue_workers: Optional[QueueWorkers] = None
+static_assets = StaticAssetCache()
+
+def get_bucket():
+    """GCSバケットを取得（未設定の場合はNone）"""
+    return bucket_service.get()
+
+def get_audio_processor():
+    """AudioProcessorを取得"""
+    return audio_processor_service.get()
+
+def get_gemini_service():
+    """GeminiServiceを取得"""
+    return gemini_service_holder.get()
+
+def get_doc_generator():
+    """DocumentGeneratorを取得"""
+    return doc_generator_service.get()
+
+def get_minutes_store():
+    """議事録の保存先を取得（無効の場合はNone）"""
+    return minutes_store_service.get()
+
+def get_search_index():
+    """議事録の検索インデックスを取得（初回は保存済みの全議事録から作成）"""
+    return search_index_service.get()
+
+def get_gcs_sweeper():
+    """GCSの孤立ファイル削除を取得（GCS未設定の場合はNone）"""
+    return gcs_sweeper_service.get()
+
+def get_checkpoint_store():
+    """ジョブのチェックポイントの保存先を取得（無効の場合はNone）"""
+    return checkpoint_store_service.get()
+
+def get_fingerprint_index():
+    """音声の指紋の保存先を取得（無効の場合はNone）"""
+    return fingerprint_index_service.get()
+
+def get_direct_upload_store():
+    """直接アップロードの保存先を取得（無効の場合はNone）"""
+    return direct_upload_service.get()
+
+def _source_blob(blob_name: str):
+    """
+    音声ファイルのblobを取得（直接アップロードはローカルのファイル、それ以外はGCS）
+
+    Args:
+        blob_name: blob名
+
+    Returns:
+        reload / size / download_to_filename / delete を持つblob
+    """
+    if is_direct_upload(blob_name):
+        store = get_direct_upload_store()
+        if store is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="直接アップロードが無効です"
+            )
+        try:
+            return store.blob(blob_name)
+        except DirectUploadError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    bucket = get_bucket()
+    if not bucket:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="GCSが設定されていません"
+        )
+    return bucket.blob(blob_name)
+
+def get_work_queue():
+    """インスタンス間で共有するワークキューを取得（無効の場合はNone）"""
+    return work_queue_service.get()
+
+def _start_queue_workers(queue) -> QueueWorkers:
+    """このインスタンスのワーカーを開始（開始済みなら何もしない）"""
+    global queue_workers
+    if queue_workers is None:
+        queue_workers = QueueWorkers(queue, _handle_work_item, workers=WORK_QUEUE_WORKERS or fair_scheduler.slots)
+    queue_workers.start()
+    return queue_workers
+
+async def _handle_work_item(item: dict) -> dict:
+    """ワークキューのジョブを処理（受け付けたリクエストのジョブIDでトレースを記録）"""
+    payload = item["payload"]
+    with tracer.job("upload.worker", job_id=payload.get("job_id"), attempt=item.get("attempts")):
+        result = await _process_upload(idempotency_key=item["key"], **payload["request"])
+    return result.model_dump()
+
+def _start_gcs_sweeper():
+    try:
+        sweeper = get_gcs_sweeper()
+        if sweeper is not None:
+            sweeper.start()
+    except Exception as e:
+        logger.warning(f"GCS孤立ファイル削除の開始エラー: {str(e)}")
+
+async def _resume_interrupted_jobs():
+    """前のコンテナで中断したジョブ（一定時間更新のないチェックポイント）を定期的に再開"""
+    while True:
+        try:
+            checkpoints = await run_in_threadpool(get_checkpoint_store)
+            if checkpoints is None:
+                return
+            states = await run_in_threadpool(lambda: list(checkpoints.stale_states()))
+            queue = await run_in_threadpool(get_work_queue)
+            for state in states:
+                key = state.get("key")
+                if not key or not state.get("request") or upload_flights.is_running(key):
+                    continue
+                # ワークキューに残っているジョブはリース切れ後にワーカーが引き継ぐ
+                if queue is not None:
+                    item = await run_in_threadpool(queue.get, key)
+                    if item is not None and item["state"] in (WORK_PENDING, WORK_RUNNING):
+                        continue
+                asyncio.create_task(_resume_job(checkpoints, key, state))
+        except Exception as e:
+            logger.warning(f"中断したジョブの確認エラー: {str(e)}")
+        await asyncio.sleep(CHECKPOINT_RESUME_INTERVAL_SECONDS)
+
+async def _resume_job(checkpoints, key: str, state: dict):
+    """チェックポイントからジョブを再開（結果は議事録の保存先に保存され、クライアントの再試行で返却）"""
+    attempts = state.get("resume_attempts", 0) + 1
+    if attempts > CHECKPOINT_MAX_RESUMES:
+        logger.warning(f"再開の上限に達したためチェックポイントを破棄: {state.get('stage')}")
+        await run_in_threadpool(checkpoints.delete, key)
+        return
+    # 読み込んだ時点から更新されていない場合のみ引き受ける（他のインスタンスが先に再開していれば何もしない）
+    # 再開中は更新日時が新しくなるため、次の確認で重複して再開しない
+    claimed = await run_in_threadpool(checkpoints.claim, key, state, resume_attempts=attempts)
+    if claimed is None:
+        logger.info(f"他のインスタンスが再開したジョブのためスキップ: {state.get('stage')}")
+        return
+    state = claimed
+
+    with tracer.job("upload.resume", stage=state["stage"], attempt=attempts):
+        logger.info(f"中断したジョブを再開: {state['stage']}（{attempts}回目）")
+
+        async def _lookup():
+            saved = await _find_saved_minutes(key)
+            if saved is not None:
+                await run_in_threadpool(checkpoints.delete, key)
+            return saved
+
+        try:
+            await upload_flights.run(
+                key, lambda: _process_upload(idempotency_key=key, **state["request"]), lookup=_lookup
+            )
+        except Exception as e:
+            logger.warning(f"中断したジョブの再開に失敗: {str(e)}")
+
+async def _checkpoint_heartbeat(checkpoints, key: str, state: dict):
+    """処理中のジョブの生存を定期的に記録（他のインスタンスが中断したとみなして重複して再開しないように）"""
+    while True:
+        await asyncio.sleep(CHECKPOINT_HEARTBEAT_SECONDS)
+        # 最初のステージを保存するまではチェックポイントがなく、再開の対象にならない
+        if not state.get("stage"):
+            continue
+        try:
+            await run_in_threadpool(checkpoints.touch, key)
+        except Exception as e:
+            logger.warning(f"ジョブの生存の記録エラー: {str(e)}")
+
+services.record_phase("app_setup", time.perf_counter() - _setup_start)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """バックグラウンド処理の開始"""
+    # 前回クラッシュ時などに残った一時ファイルを定期削除
+    scratch_space.start_sweeper()
+
+    # 処理されずに残った直接アップロードのファイルを定期削除
+    store = await run_in_threadpool(get_direct_upload_store)
+    if store is not None:
+        store.start_sweeper()
+
+    # 期限切れのアップロードファイルをGCSから定期削除（GCSの初期化を待たないようスレッドで開始）
+    if GCS_SWEEP_INTERVAL_SECONDS > 0:
+        asyncio.get_running_loop().run_in_executor(None, _start_gcs_sweeper)
+
+    # ワークキューのジョブを処理（他のインスタンスが受け付けたジョブ・停止したインスタンスのジョブも実行）
+    if WORK_QUEUE != "none":
+        asyncio.create_task(_start_queue_workers_in_background())
+    # インスタンス間で共有するキューがない場合は、中断したジョブをチェックポイントから再開
+    # （SQLiteのキューはコンテナと共に消えるため、キューに残っていないジョブはチェックポイントから再開）
+    if WORK_QUEUE != "firestore" and CHECKPOINT_RESUME_INTERVAL_SECONDS > 0:
+        asyncio.create_task(_resume_interrupted_jobs())
+
+    # イベントループを塞ぐ処理の検出
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start(asyncio.get_running_loop())
+
+    services.mark_ready()
+    if WARMUP_ON_STARTUP:
+        services.warm_up()
+
+async def _start_queue_workers_in_background():
+    try:
+        queue = await run_in_threadpool(get_work_queue)
+        if queue is not None:
+            _start_queue_workers(queue)
+    except Exception as e:
+        logger.warning(f"ワークキューの開始エラー: {str(e)}")
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """停止時の処理（実行中のジョブは他のインスタンスが引き継げるよう手放す）"""
+    if queue_workers is not None:
+        await queue_workers.stop()
 
 # リクエスト/レスポンスモデル
 class LoginRequest(BaseModel):
@@ -91,6 +374,19 @@ class MetadataInput(BaseModel):
 class MinutesResponse(BaseModel):
     summary: str
     dynamic_title: str
+    job_id: Optional[str] = None
+    minutes_id: Optional[str] = None
+
+class EstimateResponse(BaseModel):
+    duration_seconds: float
+    file_size_mb: float
+    estimated_input_tokens: int
+    estimated_output_tokens: int
+    max_output_tokens: int
+    estimated_stage_seconds: dict
+    estimated_total_seconds: float
+    history_samples: int
+    chunked_recommended: bool
 
 class ExportRequest(BaseModel):
     summary: str
@@ -100,6 +396,18 @@ class ExportRequest(BaseModel):
 # 認証用のデコレータ
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """JWTトークンから現在のユーザーを取得"""
+    return _decode_token(credentials)["sub"]
+
+async def get_current_session(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """
+    JWTトークンからログインごとのセッションIDを取得（実行枠の公平な割り当てに使用）
+    全員が同じユーザー名になるため、ユーザー名ではなくログインごとに区別（セッションIDのない古いトークンはユーザー名）
+    """
+    payload = _decode_token(credentials)
+    return payload.get("sid") or payload["sub"]
+
+def _decode_token(credentials: HTTPAuthorizationCredentials) -> dict:
+    """JWTトークンを検証して内容を取得"""
     token = credentials.credentials
     try:
         payload = jwt.decode(
@@ -107,13 +415,12 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production"),
             algorithms=["HS256"]
         )
-        username = payload.get("sub")
-        if username is None:
+        if payload.get("sub") is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="無効な認証トークンです"
             )
-        return username
+        return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -125,44 +432,148 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="無効なトークンです"
         )
 
-# 静的ファイルの配信（HTMLファイル）
+# 静的ファイルの配信（メモリキャッシュ・圧縮・ETag対応）
 @app.get("/", response_class=HTMLResponse)
-async def read_root():
+async def read_root(request: Request):
     """ルートパスでログインページを表示"""
-    try:
-        with open("index.html", "r", encoding="utf-8") as f:
-            return f.read()
-    except FileNotFoundError:
+    response = static_assets.response(request, "index.html", "text/html")
+    if response is None:
         return HTMLResponse(content="<h1>Welcome to 議事録自動生成システム</h1><p>index.htmlが見つかりません</p>", status_code=404)
+    return response
 
 @app.get("/index.html", response_class=HTMLResponse)
-async def read_index():
+async def read_index(request: Request):
     """index.htmlを表示"""
-    try:
-        with open("index.html", "r", encoding="utf-8") as f:
-            return f.read()
-    except FileNotFoundError:
+    response = static_assets.response(request, "index.html", "text/html")
+    if response is None:
         return HTMLResponse(content="<h1>Welcome to 議事録自動生成システム</h1><p>index.htmlが見つかりません</p>", status_code=404)
+    return response
 
 @app.get("/dashboard.html", response_class=HTMLResponse)
-async def read_dashboard():
+async def read_dashboard(request: Request):
     """ダッシュボードページを表示"""
-    try:
-        with open("dashboard.html", "r", encoding="utf-8") as f:
-            return f.read()
-    except FileNotFoundError:
+    response = static_assets.response(request, "dashboard.html", "text/html")
+    if response is None:
         return HTMLResponse(content="<h1>Dashboard not found</h1>", status_code=404)
+    return response
 
 @app.get("/app.js")
-async def read_app_js():
+async def read_app_js(request: Request):
     """JavaScriptファイルを配信"""
-    return FileResponse("app.js", media_type="application/javascript")
+    response = static_assets.response(request, "app.js", "application/javascript")
+    if response is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="app.jsが見つかりません")
+    return response
 
 @app.get("/health")
 async def health_check():
     """ヘルスチェック用エンドポイント"""
     return {"status": "healthy", "service": "議事録自動生成システム"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus形式のメトリクス（ステージ別所要時間・サイズ・トークン数・処理中ジョブ数）"""
+    return PlainTextResponse(
+        metrics.registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@app.get("/api/admin/startup")
+async def startup_report(current_user: str = Depends(get_current_user)):
+    """起動時間の内訳（import・各サービス初期化・ウォームアップ）"""
+    return services.report()
+
+@app.get("/api/admin/jobs/{job_id}/trace")
+async def job_trace(job_id: str, current_user: str = Depends(get_current_user)):
+    """ジョブのタイムライン（GCS・ffmpeg・Geminiの各スパン）"""
+    timeline = tracer.job_timeline(job_id)
+    if timeline is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="指定されたジョブのトレースが見つかりません"
+        )
+    return timeline
+
+@app.get("/api/admin/event-loop")
+async def event_loop_report(current_user: str = Depends(get_current_user)):
+    """イベントループを停止させた処理の集計（箇所ごとの回数・合計時間、直近のスタック）"""
+    return loop_monitor.report()
+
+@app.get("/api/admin/gcs/orphans")
+async def gcs_orphan_report(current_user: str = Depends(get_current_user)):
+    """GCSの孤立ファイル削除の直近の結果"""
+    sweeper = await run_in_threadpool(get_gcs_sweeper)
+    if sweeper is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="GCSが設定されていません"
+        )
+    return {"ttl_hours": sweeper.ttl.total_seconds() / 3600, "last_report": sweeper.last_report}
+
+@app.post("/api/admin/gcs/orphans/sweep")
+async def sweep_gcs_orphans(dry_run: bool = False, current_user: str = Depends(get_current_user)):
+    """
+    GCSの孤立ファイルを今すぐ削除（dry_run=trueの場合は対象の集計のみ）
+    Cloud Schedulerなどから定期的に呼び出すことも可能
+    """
+    sweeper = await run_in_threadpool(get_gcs_sweeper)
+    if sweeper is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="GCSが設定されていません"
+        )
+    try:
+        return await run_in_threadpool(sweeper.sweep, dry_run)
+    except SweepInProgress as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+@app.get("/api/queue")
+async def queue_status(
+    blob_name: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: str = Depends(get_current_user),
+    session_id: str = Depends(get_current_session)
+):
+    """
+    自分のジョブの実行状態とキュー上の順番
+    blob_name または Idempotency-Key を指定すると /api/upload 中のそのジョブのみ返す
+    """
+    key = None
+    if idempotency_key or blob_name:
+        key = f"{current_user}:{idempotency_key or 'blob:' + blob_name}"
+    result = fair_scheduler.user_status(session_id, key)
+
+    # このインスタンスで実行枠を待っていないジョブは、ワークキュー上の状態を返す
+    queue = get_work_queue() if work_queue_service.initialized else None
+    if key is not None and not result["jobs"] and queue is not None:
+        item = await run_in_threadpool(queue.get, key)
+        if item is not None:
+            # 取得順（仮想終了時刻）で前にある待機中のジョブ数から順番を計算
+            position = await run_in_threadpool(queue.position, item)
+            result["jobs"] = [{
+                "key": key,
+                "lane": item.get("lane"),
+                "state": "queued" if item["state"] == WORK_PENDING else item["state"],
+                "position": position,
+                "waited_seconds": round(time.time() - item["enqueued_at"], 1),
+            }]
+    return result
+
+@app.get("/api/admin/work-queue")
+async def work_queue_report(current_user: str = Depends(get_current_user)):
+    """ワークキューのジョブ数とこのインスタンスのワーカーの状態"""
+    queue = await run_in_threadpool(get_work_queue)
+    if queue is None:
+        return {"enabled": False}
+    if queue_workers is None:
+        return {"enabled": True, "queue": await run_in_threadpool(queue.stats)}
+    return {"enabled": True, **await run_in_threadpool(queue_workers.stats)}
+
+@app.get("/api/metrics/transcode")
+async def transcode_metrics(current_user: str = Depends(get_current_user)):
+    """ffmpegワーカープールのキュー長・変換速度（リアルタイム比）"""
+    return transcode_pool.stats()
+
 @app.post("/api/auth/login", response_model=LoginResponse)
 async def login(request: LoginRequest):
     """ログインエンドポイント（パスワードのみ）"""
@@ -176,7 +587,7 @@ async def login(request: LoginRequest):
 
         # JWTトークンの生成
         access_token = auth_service.create_access_token(
-            data={"sub": user["username"]}
+            data={"sub": user["username"], "sid": uuid.uuid4().hex}
         )
 
         return LoginResponse(access_token=access_token)
@@ -200,6 +611,7 @@ async def generate_upload_url(
     GCSへの署名付きアップロードURLを生成（IAM Credentials API使用）
     """
     try:
+        bucket = await run_in_threadpool(get_bucket)
         if not bucket:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -215,41 +627,46 @@ async def generate_upload_url(
         # GCSのblobオブジェクトを作成
         blob = bucket.blob(blob_name)
 
-        # サービスアカウント情報を取得
-        from google.auth import default as google_auth_default
-        from google.auth.transport import requests as google_auth_requests
+        def _sign_upload_url() -> str:
+            """署名付きURLを生成（認証情報の更新・メタデータサーバー・IAM APIへの通信を含む）"""
+            # サービスアカウント情報を取得
+            from google.auth import default as google_auth_default
+            from google.auth.transport import requests as google_auth_requests
 
-        credentials, _ = google_auth_default()
-        auth_request = google_auth_requests.Request()
-        credentials.refresh(auth_request)
+            credentials, _ = google_auth_default()
+            auth_request = google_auth_requests.Request()
+            credentials.refresh(auth_request)
 
-        # メタデータサーバーからサービスアカウントのメールを取得
-        import urllib.request
-        try:
-            metadata_server = "http://metadata.google.internal/computeMetadata/v1/"
-            req = urllib.request.Request(
-                metadata_server + 'instance/service-accounts/default/email',
-                headers={'Metadata-Flavor': 'Google'}
-            )
-            with urllib.request.urlopen(req, timeout=2) as response:
-                service_account_email = response.read().decode('utf-8')
-            logger.info(f"サービスアカウント: {service_account_email}")
-        except Exception as e:
-            logger.error(f"サービスアカウント取得エラー: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="サービスアカウントの取得に失敗しました"
+            # メタデータサーバーからサービスアカウントのメールを取得
+            import urllib.request
+            try:
+                metadata_server = "http://metadata.google.internal/computeMetadata/v1/"
+                req = urllib.request.Request(
+                    metadata_server + 'instance/service-accounts/default/email',
+                    headers={'Metadata-Flavor': 'Google'}
+                )
+                with urllib.request.urlopen(req, timeout=2) as response:
+                    service_account_email = response.read().decode('utf-8')
+                logger.info(f"サービスアカウント: {service_account_email}")
+            except Exception as e:
+                logger.error(f"サービスアカウント取得エラー: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="サービスアカウントの取得に失敗しました"
+                )
+
+            # 署名付きURL生成（IAM Credentials APIを使用）
+            return blob.generate_signed_url(
+                version="v4",
+                expiration=timedelta(minutes=15),
+                method="PUT",
+                content_type=content_type,
+                service_account_email=service_account_email,
+                access_token=credentials.token
             )
 
-        # 署名付きURL生成（IAM Credentials APIを使用）
-        upload_url = blob.generate_signed_url(
-            version="v4",
-            expiration=timedelta(minutes=15),
-            method="PUT",
-            content_type=content_type,
-            service_account_email=service_account_email,
-            access_token=credentials.token
-        )
+        # 通信を伴うためイベントループを塞がないようスレッドで実行
+        upload_url = await run_in_threadpool(_sign_upload_url)
 
         logger.info(f"署名付きURL生成成功: {blob_name}")
 
@@ -267,118 +684,628 @@ async def generate_upload_url(
             detail=f"署名付きURLの生成中にエラーが発生しました: {str(e)}"
         )
 
+@app.put("/api/direct-upload")
+async def direct_upload(
+    request: Request,
+    filename: str = Query(...),
+    content_length: Optional[int] = Header(None),
+    current_user: str = Depends(get_current_user)
+):
+    """
+    音声ファイルをサーバーに直接アップロード（GCSが使えない環境用）
+    本文（ファイルそのもの）を一定サイズずつディスクに書き込み、返却した blob_name を /api/upload に指定
+    """
+    store = await run_in_threadpool(get_direct_upload_store)
+    if store is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="直接アップロードが無効です"
+        )
+
+    max_bytes = app.state.max_upload_size
+    if content_length is not None and content_length > max_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"ファイルサイズが上限（{max_bytes / (1024 * 1024):.0f} MB）を超えています"
+        )
+
+    if not await run_in_threadpool(store.has_capacity, content_length or 0):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="サーバーが混雑しています。しばらくしてから再度お試しください"
+        )
+
+    try:
+        with tracer.span("direct_upload.receive", content_length=content_length) as span:
+            result = await store.receive(request.stream(), current_user, filename, max_bytes)
+            span.set_attribute("size", result["size"])
+        logger.info(f"ユーザー {current_user} が直接アップロード: {filename} → {result['blob_name']}")
+        return result
+
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except DirectUploadError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"直接アップロードエラー: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"アップロード中にエラーが発生しました: {str(e)}"
+        )
+
+@app.post("/api/estimate", response_model=EstimateResponse)
+async def estimate_processing(
+    blob_name: str = Form(...),
+    duration_seconds: Optional[float] = Form(None),
+    current_user: str = Depends(get_current_user)
+):
+    """
+    処理前に入力トークン数・処理時間・分割処理の要否を見積もり
+    duration_seconds が指定されない場合はGCSから取得してffprobeで計測
+    """
+    try:
+        blob = await run_in_threadpool(_source_blob, blob_name)
+        await run_in_threadpool(blob.reload)
+        file_size = blob.size or 0
+
+        if duration_seconds is None:
+            with scratch_space.workspace(blob_name) as workspace:
+                workspace.reserve(file_size)
+                file_extension = os.path.splitext(blob_name)[1]
+                temp_file_path = workspace.file_path(suffix=file_extension)
+                await run_in_threadpool(blob.download_to_filename, temp_file_path)
+                audio_processor = await run_in_threadpool(get_audio_processor)
+                duration_seconds = await run_in_threadpool(audio_processor.get_duration, temp_file_path)
+            if duration_seconds is None:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="音声ファイルの再生時間を取得できませんでした"
+                )
+
+        gemini_service = await run_in_threadpool(get_gemini_service)
+        # 初回はトークン数の計測（API呼び出し）を伴うためスレッドで実行
+        input_tokens = await run_in_threadpool(gemini_service.estimate_input_tokens, duration_seconds)
+        estimate = job_estimator.estimate(duration_seconds, file_size, input_tokens)
+        logger.info(f"ユーザー {current_user} の見積もり: {blob_name} - {estimate}")
+        return EstimateResponse(**estimate)
+
+    except HTTPException:
+        raise
+    except ScratchSpaceFull as e:
+        logger.warning(f"一時作業領域不足: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="サーバーが混雑しています。しばらくしてから再度お試しください"
+        )
+    except Exception as e:
+        logger.error(f"見積もりエラー: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"見積もり中にエラーが発生しました: {str(e)}"
+        )
+
 @app.post("/api/upload", response_model=MinutesResponse)
 async def upload_audio(
+    response: Response,
     blob_name: str = Form(...),
     created_date: str = Form(...),
     creator: str = Form(...),
     customer_name: str = Form(...),
     meeting_place: str = Form(...),
-    current_user: str = Depends(get_current_user)
+    idempotency_key: Optional[str] = Header(None),
+    current_user: str = Depends(get_current_user),
+    session_id: str = Depends(get_current_session)
 ):
     """
     GCSから音声ファイルを取得して議事録を生成
+    同じ Idempotency-Key（省略時は blob_name）のリクエストは1回だけ処理し、
+    同時に届いたものは実行中の処理の結果を、完了後の再試行は保存済みの結果を返す
+    """
+    key = f"{current_user}:{idempotency_key or 'blob:' + blob_name}"
+    request = {
+        "blob_name": blob_name,
+        "created_date": created_date,
+        "creator": creator,
+        "customer_name": customer_name,
+        "meeting_place": meeting_place,
+        "current_user": current_user,
+        "session_id": session_id,
+    }
+    result, replayed = await upload_flights.run(
+        key,
+        lambda: _run_upload(key, request),
+        lookup=lambda: _find_saved_minutes(key)
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+async def _run_upload(key: str, request: dict) -> MinutesResponse:
+    """
+    ジョブをワークキューに登録して完了を待機（いずれかのインスタンスのワーカーが処理）
+    ワークキューが無効の場合（直接アップロードでホスト間共有のキューの場合も）はこのリクエスト内で処理
     """
+    queue = await run_in_threadpool(get_work_queue)
+    # 直接アップロードのファイルはこのホストのディスクにあるため、他のホストと共有するキューには登録しない
+    if queue is None or (is_direct_upload(request["blob_name"]) and WORK_QUEUE != "sqlite"):
+        return await _process_upload(idempotency_key=key, **request)
+
+    workers = _start_queue_workers(queue)
+    # 再生時間は処理を始めるまで分からないため、ファイルサイズから見積もってキューの取得順（WFQ）を決める
     try:
-        if not bucket:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="GCSが設定されていません"
+        blob = await run_in_threadpool(_source_blob, request["blob_name"])
+        await run_in_threadpool(blob.reload)
+        size_bytes = blob.size
+    except Exception:
+        size_bytes = None
+    lane, cost = fair_scheduler.weighted_cost(estimate_duration(size_bytes))
+    await run_in_threadpool(
+        queue.enqueue, key, {"request": request, "job_id": current_job_id()},
+        request.get("session_id") or request["current_user"], lane, cost
+    )
+    item = await workers.wait(key)
+    if item["state"] == WORK_FAILED:
+        error = item.get("error") or {}
+        raise HTTPException(
+            status_code=error.get("status_code") or status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=error.get("detail") or "音声ファイルの処理に失敗しました"
+        )
+    return MinutesResponse(**item["result"])
+
+async def _find_saved_minutes(key: str) -> Optional[MinutesResponse]:
+    """冪等キーで保存済みの議事録を検索（見つからなければNone）"""
+    store = await run_in_threadpool(get_minutes_store)
+    if store is None:
+        return None
+    record = await run_in_threadpool(store.find_by_idempotency_key, key)
+    if record is None:
+        return None
+    return MinutesResponse(
+        summary=record["summary"],
+        dynamic_title=record.get("title") or "",
+        job_id=record.get("job_id"),
+        minutes_id=record["id"]
+    )
+
+async def _find_related_recording(audio_file: str, owner: str):
+    """
+    音声の指紋で関連する録音の議事録を検索
+    続きを録音した録音（区間ハッシュで前回の録音を先頭に含む）を優先し、
+    なければ同じ録音（再エンコード・再書き出しされたもの）を検索
+
+    Args:
+        audio_file: 音声ファイル
+        owner: ユーザー
+
+    Returns:
+        (指紋, 一致した議事録, 続きの場合は前回の録音の長さ（秒）・同じ録音の場合はNone)
+        指紋を作成できない（無音など）場合は (None, None, None)、一致しない場合は (指紋, None, None)
+    """
+    index = await run_in_threadpool(get_fingerprint_index)
+    if index is None:
+        return None, None, None
+    try:
+        audio_processor = await run_in_threadpool(get_audio_processor)
+        fingerprint = await run_in_threadpool(audio_processor.fingerprint, audio_file)
+        if fingerprint is None or not len(fingerprint):
+            return None, None, None
+        with tracer.span("fingerprint.lookup", frames=len(fingerprint), segments=len(fingerprint.segments)) as span:
+            continued = await run_in_threadpool(index.find_continued, fingerprint, owner)
+            match = continued or await run_in_threadpool(index.find_match, fingerprint, owner)
+            span.set_attribute("matched", "continued" if continued else "same" if match else "none")
+        record = None
+        if match is not None:
+            store = await run_in_threadpool(get_minutes_store)
+            record = await run_in_threadpool(store.get, match["minutes_id"])
+        if record is None:
+            metrics.FINGERPRINT_LOOKUPS.inc(result="miss")
+            return fingerprint, None, None
+        if continued is not None:
+            metrics.FINGERPRINT_LOOKUPS.inc(result="continued")
+            logger.info(
+                f"続きの録音を検出: {match['minutes_id']} "
+                f"(前回の録音: {match['duration_seconds']:.1f}秒, 一致した区間: {match['segments']})"
             )
+            return fingerprint, record, match["duration_seconds"]
+        metrics.FINGERPRINT_LOOKUPS.inc(result="hit")
+        logger.info(
+            f"同じ録音の議事録を再利用: {match['minutes_id']} "
+            f"(ビット誤り率: {match['bit_error_rate']}, ずれ: {match['offset_seconds']}秒)"
+        )
+        return fingerprint, record, None
+    except Exception as e:
+        # 検索に失敗しても通常どおりGeminiで解析
+        logger.warning(f"音声の指紋による検索エラー: {str(e)}")
+        metrics.FINGERPRINT_LOOKUPS.inc(result="error")
+        return None, None, None
+
+async def _process_upload(
+    blob_name: str,
+    created_date: str,
+    creator: str,
+    customer_name: str,
+    meeting_place: str,
+    current_user: str,
+    idempotency_key: str,
+    session_id: Optional[str] = None
+) -> MinutesResponse:
+    """
+    議事録生成のパイプライン（ダウンロード → 圧縮 → Gemini解析 → 保存）
+    """
+    start_time = None
+    heartbeat = None
+    try:
+        blob = await run_in_threadpool(_source_blob, blob_name)
 
-        import time
         start_time = time.time()
+        metrics.JOBS_IN_FLIGHT.inc()
+        # 初回は初期化（認証・クライアント作成）を伴うためイベントループを塞がないようスレッドで取得
+        audio_processor = await run_in_threadpool(get_audio_processor)
+        gemini_service = await run_in_threadpool(get_gemini_service)
 
         logger.info(f"=== 音声処理開始 ===")
+        logger.info(f"ジョブID: {current_job_id()}")
         logger.info(f"ユーザー: {current_user}")
         logger.info(f"ファイル: {blob_name}")
 
         # 動的タイトルの生成
         dynamic_title = f"{created_date}_{creator}_{customer_name}_{meeting_place}_議事録"
 
-        # 変数の初期化
-        temp_file_path = None
-        processed_file = None
+        # 前回の試行で完了したステージはチェックポイントから再開
+        checkpoints = await run_in_threadpool(get_checkpoint_store)
+        state = await run_in_threadpool(checkpoints.load, idempotency_key) if checkpoints else None
+        if state:
+            logger.info(f"チェックポイントから再開: {state.get('stage')}")
+        else:
+            state = {"request": {
+                "blob_name": blob_name,
+                "created_date": created_date,
+                "creator": creator,
+                "customer_name": customer_name,
+                "meeting_place": meeting_place,
+                "current_user": current_user,
+                "session_id": session_id,
+            }}
+        resumed_from = state.get("stage")
+        if checkpoints is not None:
+            heartbeat = asyncio.create_task(_checkpoint_heartbeat(checkpoints, idempotency_key, state))
 
-        try:
-            # GCSからファイルをダウンロード
-            logger.info("[Step 1/4] GCSからファイルをダウンロード中...")
-            blob = bucket.blob(blob_name)
-
-            # ファイルサイズを確認
-            blob.reload()
-            file_size_mb = blob.size / (1024 * 1024) if blob.size else 0
-            logger.info(f"ファイルサイズ: {file_size_mb:.2f} MB")
-
-            # 一時ファイルに保存
-            file_extension = os.path.splitext(blob_name)[1]
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-                blob.download_to_file(temp_file)
-                temp_file_path = temp_file.name
-
-            download_time = time.time() - start_time
-            logger.info(f"[Step 1/4] ダウンロード完了 ({download_time:.2f}秒)")
-
-            # 音声ファイルの処理（圧縮のみ）
-            logger.info("[Step 2/4] 音声ファイルを圧縮中...")
-            compress_start = time.time()
-            processed_files = audio_processor.process_audio(temp_file_path)
-            processed_file = processed_files[0]
-
-            # 圧縮後のファイルサイズ
-            compressed_size_mb = os.path.getsize(processed_file) / (1024 * 1024)
-            compress_time = time.time() - compress_start
-            logger.info(f"[Step 2/4] 圧縮完了 ({compress_time:.2f}秒) - 圧縮後サイズ: {compressed_size_mb:.2f} MB")
-
-            # Gemini APIで音声解析
-            logger.info("[Step 3/4] Gemini APIで音声解析中...")
-            gemini_start = time.time()
-            final_summary = await gemini_service.analyze_audio(processed_file)
-            gemini_time = time.time() - gemini_start
-            logger.info(f"[Step 3/4] 解析完了 ({gemini_time:.2f}秒) - 議事録文字数: {len(final_summary)}")
-
-            # GCSからファイルを削除（処理完了後）
+        async def _checkpoint(stage: str, **values):
+            if checkpoints is not None:
+                await run_in_threadpool(checkpoints.save, idempotency_key, stage, state, **values)
+
+        def _checkpoint_gemini_file(file_name: str):
+            # Geminiの解析スレッドから呼ばれるためそのまま保存
+            if checkpoints is not None:
+                checkpoints.save(idempotency_key, "gemini_uploaded", state,
+                                 gemini_file=file_name, gemini_uploaded_at=time.time())
+
+        download_time = compress_time = gemini_time = fingerprint_time = queue_wait = 0.0
+        fingerprint = None
+        reused_from = state.get("reused_from")
+        continued_from = state.get("continued_from")
+        appended_from = state.get("appended_from_seconds")
+        file_size_mb = state.get("file_size_mb", 0)
+        duration_seconds = state.get("duration_seconds")
+        duration_minutes = (duration_seconds or 0) / 60
+        final_summary = state.get("result")
+        gemini_file = state.get("gemini_file") if gemini_file_usable(state) else None
+
+        # ジョブ用の作業ディレクトリ（終了時に中のファイルごと必ず削除）
+        with scratch_space.workspace(blob_name) as workspace:
+            processed_file = None
+
+            # 圧縮済みの音声があれば取得（Geminiファイルが期限切れの場合の再アップロードにも使用）
+            if final_summary is None and reached(state, "compressed"):
+                workspace.reserve(state.get("compressed_size", 0))
+                processed_file = workspace.file_path(suffix=state.get("compressed_suffix", ""), prefix="checkpoint-")
+                if not await run_in_threadpool(checkpoints.get_artifact, idempotency_key, "compressed", processed_file):
+                    processed_file = None
+
+            if final_summary is None and processed_file is None:
+                # GCSからファイルをダウンロード
+                logger.info("[Step 1/4] GCSからファイルをダウンロード中...")
+                download_start = time.time()
+
+                # ファイルサイズを確認（GCS・ファイル操作はイベントループを塞がないようスレッドで実行）
+                await run_in_threadpool(blob.reload)
+                file_size_mb = blob.size / (1024 * 1024) if blob.size else 0
+                logger.info(f"ファイルサイズ: {file_size_mb:.2f} MB")
+
+                # 元ファイルと圧縮後ファイルの分の容量を予約
+                workspace.reserve((blob.size or 0) * 2)
+
+                # 作業ディレクトリに保存
+                file_extension = os.path.splitext(blob_name)[1]
+                temp_file_path = workspace.file_path(suffix=file_extension, prefix="source-")
+                await run_in_threadpool(blob.download_to_filename, temp_file_path)
+
+                download_time = time.time() - download_start
+                logger.info(f"[Step 1/4] ダウンロード完了 ({download_time:.2f}秒)")
+                metrics.STAGE_DURATION.observe(download_time, stage="download")
+                metrics.INPUT_SIZE.observe(blob.size or 0)
+                job_estimator.history.record("download", download_time, file_size_mb)
+                if duration_seconds is None:
+                    duration_seconds = await run_in_threadpool(audio_processor.get_duration, temp_file_path)
+                    duration_minutes = (duration_seconds or 0) / 60
+                    await _checkpoint("downloaded", file_size_mb=file_size_mb, duration_seconds=duration_seconds)
+
+            if final_summary is None:
+                # 圧縮・Gemini解析はユーザー間で公平に実行枠を割り当て（短い音声を優先）
+                # 全員が同じユーザー名のため、ログインごとのセッションで公平に割り当て
+                async with fair_scheduler.slot(session_id or current_user, duration_seconds,
+                                               key=idempotency_key) as ticket:
+                    queue_wait = ticket.started_at - ticket.enqueued_at
+
+                    if processed_file is None:
+                        # 音声ファイルの処理（圧縮のみ）
+                        logger.info("[Step 2/4] 音声ファイルを圧縮中...")
+                        compress_start = time.time()
+                        # ffmpegワーカープールの待機中もイベントループを塞がないようスレッドで実行
+                        processed_files = await run_in_threadpool(
+                            audio_processor.process_audio, temp_file_path, duration_seconds, workspace.path
+                        )
+                        processed_file = processed_files[0]
+
+                        # 圧縮後のファイルサイズ
+                        compressed_size = os.path.getsize(processed_file)
+                        compressed_size_mb = compressed_size / (1024 * 1024)
+                        compress_time = time.time() - compress_start
+                        metrics.STAGE_DURATION.observe(compress_time, stage="compress")
+                        metrics.COMPRESSED_SIZE.observe(compressed_size)
+                        if blob.size:
+                            metrics.COMPRESSION_RATIO.observe(compressed_size / blob.size)
+                        logger.info(f"[Step 2/4] 圧縮完了 ({compress_time:.2f}秒) - 圧縮後サイズ: {compressed_size_mb:.2f} MB")
+                        job_estimator.history.record("compress", compress_time, duration_minutes)
+
+                        # 再試行時に圧縮をやり直さないよう圧縮済みの音声を保存
+                        if checkpoints is not None:
+                            try:
+                                await run_in_threadpool(
+                                    checkpoints.put_artifact, idempotency_key, "compressed", processed_file
+                                )
+                                await _checkpoint(
+                                    "compressed",
+                                    compressed_size=compressed_size,
+                                    compressed_suffix=os.path.splitext(processed_file)[1],
+                                )
+                            except Exception as e:
+                                logger.warning(f"圧縮済み音声の保存エラー: {str(e)}")
+
+                    # 同じ録音（再エンコード・再書き出ししたもの）の議事録があればGemini解析を省略
+                    # 前回の録音の続きを録音したものなら、追加部分のみ解析して前回の議事録に統合
+                    fingerprint_start = time.time()
+                    fingerprint, related, previous_duration = await _find_related_recording(
+                        processed_file, current_user
+                    )
+                    fingerprint_time = time.time() - fingerprint_start
+                    metrics.STAGE_DURATION.observe(fingerprint_time, stage="fingerprint")
+
+                    analyze_file, previous_minutes = processed_file, None
+                    if related is not None and previous_duration is not None:
+                        appended_from = max(0.0, previous_duration - CONTINUATION_OVERLAP_SECONDS)
+                        tail_file = await run_in_threadpool(
+                            audio_processor.extract_tail, processed_file, appended_from, workspace.path,
+                            duration_seconds
+                        )
+                        if tail_file is not None:
+                            analyze_file, previous_minutes = tail_file, related["summary"]
+                            continued_from = related["id"]
+                            logger.info(f"追加部分（{appended_from:.1f}秒以降）のみ解析します")
+                        else:
+                            appended_from = None
+
+                    if related is not None and previous_duration is None:
+                        final_summary = related["summary"]
+                        reused_from = related["id"]
+                        await _checkpoint("result", result=final_summary, reused_from=reused_from)
+                    else:
+                        # Gemini APIで音声解析（続きの場合はGeminiファイルを再利用しない）
+                        logger.info("[Step 3/4] Gemini APIで音声解析中...")
+                        gemini_start = time.time()
+                        final_summary = await gemini_service.analyze_audio(
+                            analyze_file,
+                            file_name=None if continued_from else gemini_file,
+                            on_uploaded=None if continued_from else _checkpoint_gemini_file,
+                            previous_minutes=previous_minutes,
+                        )
+                        gemini_time = time.time() - gemini_start
+                        metrics.STAGE_DURATION.observe(gemini_time, stage="gemini")
+                        logger.info(f"[Step 3/4] 解析完了 ({gemini_time:.2f}秒) - 議事録文字数: {len(final_summary)}")
+                        analyzed_minutes = (duration_seconds - (appended_from or 0)) / 60 if duration_seconds else 0
+                        job_estimator.history.record("gemini", gemini_time, analyzed_minutes)
+                        if not continued_from:
+                            job_estimator.history.record("output_chars", len(final_summary), duration_minutes)
+                        await _checkpoint(
+                            "result", result=final_summary,
+                            continued_from=continued_from, appended_from_seconds=appended_from
+                        )
+
+            # GCS（直接アップロードの場合はローカル）からファイルを削除（処理完了後）
             logger.info("[Step 4/4] クリーンアップ中...")
             try:
-                blob.delete()
+                await run_in_threadpool(blob.delete)
                 logger.info(f"GCSファイル削除: {blob_name}")
             except Exception as e:
                 logger.warning(f"GCSファイル削除エラー: {blob_name} - {str(e)}")
 
             total_time = time.time() - start_time
             logger.info(f"=== 音声処理完了 (合計: {total_time:.2f}秒) ===")
+            metrics.STAGE_DURATION.observe(total_time, stage="total")
+            metrics.JOBS_TOTAL.inc(status="success")
 
-            return MinutesResponse(
-                summary=final_summary,
-                dynamic_title=dynamic_title
-            )
+            # 続きの録音の場合は前回の議事録を統合した内容で置き換え（議事録IDはそのまま）
+            record_id, created_at = new_minutes_id(), time.time()
+            if continued_from:
+                store = await run_in_threadpool(get_minutes_store)
+                previous = await run_in_threadpool(store.get, continued_from)
+                if previous is not None:
+                    record_id, created_at = previous["id"], previous["created_at"]
 
-        finally:
-            # 一時ファイルのクリーンアップ
-            if temp_file_path and os.path.exists(temp_file_path):
+            # 生成結果を保存（保存に失敗しても議事録は返す）
+            minutes_id = await save_minutes({
+                "id": record_id,
+                "created_at": created_at,
+                "owner": current_user,
+                "title": dynamic_title,
+                "summary": final_summary,
+                "metadata": {
+                    "created_date": created_date,
+                    "creator": creator,
+                    "customer_name": customer_name,
+                    "meeting_place": meeting_place,
+                },
+                "timings": {
+                    "download_seconds": round(download_time, 2),
+                    "queue_wait_seconds": round(queue_wait, 2),
+                    "compress_seconds": round(compress_time, 2),
+                    "gemini_seconds": round(gemini_time, 2),
+                    "fingerprint_seconds": round(fingerprint_time, 2),
+                    "total_seconds": round(total_time, 2),
+                    "file_size_mb": round(file_size_mb, 2),
+                    "duration_seconds": round(duration_seconds, 1) if duration_seconds else None,
+                    "resumed_from": resumed_from,
+                    "reused_from": reused_from,
+                    "appended_from_seconds": round(appended_from, 1) if appended_from is not None else None,
+                },
+                "blob_name": blob_name,
+                "job_id": current_job_id(),
+                "idempotency_key": idempotency_key,
+            })
+
+            # 次に同じ録音がアップロードされた時に再利用できるよう指紋を登録
+            if fingerprint is not None and minutes_id is not None:
                 try:
-                    os.unlink(temp_file_path)
-                    logger.debug(f"一時ファイル削除: {temp_file_path}")
+                    index = await run_in_threadpool(get_fingerprint_index)
+                    await run_in_threadpool(index.add, minutes_id, current_user, fingerprint)
                 except Exception as e:
-                    logger.warning(f"一時ファイル削除エラー: {temp_file_path} - {str(e)}")
+                    logger.warning(f"音声の指紋の登録エラー: {str(e)}")
 
-            if processed_file and os.path.exists(processed_file):
+            # 完了したジョブのチェックポイントと圧縮済み音声を削除
+            if checkpoints is not None:
                 try:
-                    os.unlink(processed_file)
-                    logger.debug(f"処理済みファイル削除: {processed_file}")
+                    await run_in_threadpool(checkpoints.delete, idempotency_key)
                 except Exception as e:
-                    logger.warning(f"処理済みファイル削除エラー: {processed_file} - {str(e)}")
+                    logger.warning(f"チェックポイント削除エラー: {str(e)}")
+
+            return MinutesResponse(
+                summary=final_summary,
+                dynamic_title=dynamic_title,
+                job_id=current_job_id(),
+                minutes_id=minutes_id
+            )
 
+    except ScratchSpaceFull as e:
+        logger.warning(f"一時作業領域不足: {str(e)}")
+        metrics.JOBS_TOTAL.inc(status="rejected")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="サーバーが混雑しています。しばらくしてから再度お試しください"
+        )
     except HTTPException:
+        metrics.JOBS_TOTAL.inc(status="rejected")
         raise
+    except DirectUploadError as e:
+        logger.warning(f"直接アップロードのファイルエラー: {str(e)}")
+        metrics.JOBS_TOTAL.inc(status="rejected")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         import traceback
         logger.error(f"音声処理エラー: {str(e)}")
         logger.error(f"スタックトレース: {traceback.format_exc()}")
+        metrics.JOBS_TOTAL.inc(status="error")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"音声ファイルの処理中にエラーが発生しました: {str(e)}"
         )
+    finally:
+        if heartbeat is not None:
+            heartbeat.cancel()
+        if start_time is not None:
+            metrics.JOBS_IN_FLIGHT.dec()
+
+async def save_minutes(record: dict) -> Optional[str]:
+    """
+    議事録を保存
+
+    Args:
+        record: 保存する議事録
+
+    Returns:
+        議事録ID（保存先が無効・保存に失敗した場合はNone）
+    """
+    try:
+        store = await run_in_threadpool(get_minutes_store)
+        if store is None:
+            return None
+        with tracer.span("minutes_store.save"):
+            minutes_id = await run_in_threadpool(store.save, record)
+    except Exception as e:
+        logger.warning(f"議事録の保存エラー: {str(e)}")
+        return None
+
+    # 検索インデックスを更新（未作成の場合は初回検索時に保存先から作成される）
+    if search_index_service.initialized:
+        try:
+            search_index_service.get().add(dict(record, id=minutes_id))
+        except Exception as e:
+            logger.warning(f"検索インデックスの更新エラー: {str(e)}")
+    return minutes_id
+
+async def _require_minutes_store():
+    store = await run_in_threadpool(get_minutes_store)
+    if store is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="議事録の保存が無効です"
+        )
+    return store
+
+@app.get("/api/minutes")
+async def list_minutes(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: str = Depends(get_current_user)
+):
+    """
+    保存済みの議事録一覧（新しい順、本文を除く）
+    次ページは next_cursor を cursor に指定して取得
+    """
+    store = await _require_minutes_store()
+    try:
+        items, next_cursor = await run_in_threadpool(store.list, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/api/minutes/search")
+async def search_minutes(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: str = Depends(get_current_user)
+):
+    """
+    保存済みの議事録を全文検索（お客様名・品番・金額など、空白区切りでAND検索）
+    """
+    store = await _require_minutes_store()
+    index = await run_in_threadpool(get_search_index)
+    await run_in_threadpool(index.refresh, store)
+    try:
+        return await run_in_threadpool(index.search, q, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@app.get("/api/minutes/{minutes_id}")
+async def get_minutes(minutes_id: str, current_user: str = Depends(get_current_user)):
+    """保存済みの議事録を取得"""
+    store = await _require_minutes_store()
+    record = await run_in_threadpool(store.get, minutes_id)
+    if record is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="議事録が見つかりません"
+        )
+    return record
 
 @app.post("/api/export")
 async def export_minutes(
@@ -392,19 +1319,26 @@ async def export_minutes(
         logger.info(f"ユーザー {current_user} が {request.format} 形式でエクスポート")
 
         # ドキュメント生成
+        # 初回はdocx/fpdf等の読み込みを伴うためイベントループを塞がないようスレッドで取得
+        doc_generator = await run_in_threadpool(get_doc_generator)
+        render_start = time.time()
         if request.format.lower() == "word":
-            output_path = doc_generator.generate_word(
-                request.summary,
-                request.metadata.model_dump()
-            )
+            with metrics.EXPORTS_IN_FLIGHT.track_inprogress():
+                output_path = await run_in_threadpool(
+                    doc_generator.generate_word,
+                    request.summary,
+                    request.metadata.model_dump()
+                )
             media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
             filename = f"{request.metadata.created_date}_{request.metadata.customer_name}_議事録.docx"
 
         elif request.format.lower() == "pdf":
-            output_path = doc_generator.generate_pdf(
-                request.summary,
-                request.metadata.model_dump()
-            )
+            with metrics.EXPORTS_IN_FLIGHT.track_inprogress():
+                output_path = await run_in_threadpool(
+                    doc_generator.generate_pdf,
+                    request.summary,
+                    request.metadata.model_dump()
+                )
             media_type = "application/pdf"
             filename = f"{request.metadata.created_date}_{request.metadata.customer_name}_議事録.pdf"
 
@@ -414,10 +1348,14 @@ async def export_minutes(
                 detail="サポートされていないフォーマットです"
             )
 
+        metrics.EXPORT_RENDER_DURATION.observe(time.time() - render_start, format=request.format.lower())
+
+        # 送信完了後に生成ファイルを削除
         return FileResponse(
             path=output_path,
             media_type=media_type,
-            filename=filename
+            filename=filename,
+            background=BackgroundTask(os.unlink, output_path)
         )
 
     except Exception as e:
@@ -0,0 +1,340 @@
+"""
+Prometheus形式のメトリクスモジュール
+処理ステージごとの所要時間・サイズ・トークン数などを集計し、/metricsで公開
+"""
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 所要時間（秒）のバケット
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+# イベントループ遅延（秒）のバケット
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# ファイルサイズ（バイト）のバケット
+SIZE_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 5, 10, 25, 50, 100, 200, 500, 1000, 2000))
+# 圧縮率（圧縮後 / 圧縮前）のバケット
+RATIO_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    """ラベル値のエスケープ（バックスラッシュ・ダブルクォート・改行）"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: Optional[Dict[str, str]] = None) -> str:
+    """ラベルをPrometheusのテキスト形式に変換"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.extend(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """メトリクスの共通処理"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} のラベルが不正です: {labels}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        # ラベルなしのメトリクスは0から出力
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """増減する値"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        # ラベルなしのメトリクスは0から出力
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0.0}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def track_inprogress(self, **labels) -> "_InProgress":
+        """with文の間だけ値を1増やす"""
+        return _InProgress(self, labels)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class _InProgress:
+    def __init__(self, gauge: Gauge, labels: Dict[str, str]):
+        self.gauge = gauge
+        self.labels = labels
+
+    def __enter__(self):
+        self.gauge.inc(**self.labels)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.gauge.dec(**self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    """分布（バケットごとの件数・合計・件数）"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            return sum(self._counts.get(self._key(labels), ()))
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            for key in sorted(self._counts):
+                cumulative = 0
+                for bound, count in zip(self.buckets, self._counts[key]):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                base_labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{base_labels} {_format_value(self._sums[key])}")
+                lines.append(f"{self.name}_count{base_labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスの登録とテキスト形式への出力"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[str]]):
+        """
+        出力時に値を計算するメトリクスを登録
+
+        Args:
+            collector: Prometheus形式の行を返す関数
+        """
+        self._collectors.append(collector)
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Prometheusのテキスト形式で出力
+
+        Returns:
+            メトリクスのテキスト
+        """
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+# アプリケーション全体で共有するメトリクス
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.histogram(
+    "minutes_stage_duration_seconds",
+    "パイプラインの各ステージの所要時間（秒）",
+    ["stage"],
+)
+JOBS_TOTAL = registry.counter(
+    "minutes_jobs_total",
+    "処理した議事録生成ジョブ数",
+    ["status"],
+)
+JOBS_IN_FLIGHT = registry.gauge(
+    "minutes_jobs_in_flight",
+    "処理中の議事録生成ジョブ数",
+)
+INPUT_SIZE = registry.histogram(
+    "minutes_input_size_bytes",
+    "アップロードされた音声ファイルのサイズ（バイト）",
+    buckets=SIZE_BUCKETS,
+)
+COMPRESSED_SIZE = registry.histogram(
+    "minutes_compressed_size_bytes",
+    "圧縮後の音声ファイルのサイズ（バイト）",
+    buckets=SIZE_BUCKETS,
+)
+COMPRESSION_RATIO = registry.histogram(
+    "minutes_compression_ratio",
+    "圧縮後サイズ / 元サイズ",
+    buckets=RATIO_BUCKETS,
+)
+GEMINI_TOKENS = registry.counter(
+    "minutes_gemini_tokens_total",
+    "Gemini APIのトークン使用量",
+    ["type"],
+)
+GEMINI_AUDIO_DURATION = registry.histogram(
+    "minutes_gemini_audio_seconds",
+    "音声の送信方法別の、Gemini APIへの受け渡し開始から解析完了までの時間（秒）",
+    ["mode"],
+)
+GEMINI_TRUNCATED = registry.counter(
+    "minutes_gemini_truncated_total",
+    "max_output_tokensに達して出力が途中で切れた回数",
+)
+EXPORT_RENDER_DURATION = registry.histogram(
+    "minutes_export_render_seconds",
+    "Word/PDFの生成時間（秒）",
+    ["format"],
+)
+EXPORTS_IN_FLIGHT = registry.gauge(
+    "minutes_exports_in_flight",
+    "生成中のWord/PDF数",
+)
+TRANSCODE_QUEUE_DEPTH = registry.gauge(
+    "minutes_transcode_queue_depth",
+    "ffmpegワーカープールの待機ジョブ数",
+)
+TRANSCODE_RUNNING = registry.gauge(
+    "minutes_transcode_running",
+    "実行中のffmpegプロセス数",
+)
+TRANSCODE_SPEED = registry.histogram(
+    "minutes_transcode_speed_x_realtime",
+    "ffmpegの変換速度（音声の長さ / 変換時間）",
+    buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000),
+)
+LOOP_LAG = registry.histogram(
+    "minutes_event_loop_lag_seconds",
+    "イベントループの遅延（予定時刻からの遅れ、秒）",
+    buckets=LAG_BUCKETS,
+)
+LOOP_BLOCKED_TOTAL = registry.counter(
+    "minutes_event_loop_blocked_total",
+    "イベントループが閾値以上停止した回数",
+)
+LOOP_BLOCKED_DURATION = registry.histogram(
+    "minutes_event_loop_blocked_seconds",
+    "イベントループが停止していた時間（秒）",
+    buckets=LAG_BUCKETS,
+)
+GCS_ORPHANS_DELETED = registry.counter(
+    "minutes_gcs_orphans_deleted_total",
+    "削除したGCSの孤立ファイル数",
+)
+GCS_ORPHAN_BYTES_RECLAIMED = registry.counter(
+    "minutes_gcs_orphan_reclaimed_bytes_total",
+    "孤立ファイルの削除で回収したGCSの容量（バイト）",
+)
+SCHEDULER_QUEUE_DEPTH = registry.gauge(
+    "minutes_scheduler_queue_depth",
+    "実行枠を待っているジョブ数",
+    ("lane",),
+)
+SCHEDULER_RUNNING = registry.gauge(
+    "minutes_scheduler_running",
+    "実行枠を使用中のジョブ数",
+    ("lane",),
+)
+SCHEDULER_WAIT = registry.histogram(
+    "minutes_scheduler_wait_seconds",
+    "実行枠の待機時間（秒）",
+    ("lane",),
+    buckets=DURATION_BUCKETS,
+)
+FINGERPRINT_LOOKUPS = registry.counter(
+    "minutes_fingerprint_lookups_total",
+    "音声の指紋による関連録音の検索回数（result: hit（同じ録音） / continued（続きの録音） / miss / error）",
+    ("result",),
+)
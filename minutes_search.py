@@ -0,0 +1,286 @@
+"""
+議事録の全文検索モジュール
+文字bigramの転置インデックスで日本語（お客様名・品番・金額など）を検索し、BM25でランキング
+議事録の保存時にインクリメンタルに更新
+"""
+import os
+import re
+import time
+import math
+import heapq
+import threading
+import unicodedata
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+# 他インスタンスで保存された議事録を取り込む間隔（秒）
+MINUTES_SEARCH_REFRESH_SECONDS = float(os.getenv("MINUTES_SEARCH_REFRESH_SECONDS", "30"))
+
+# BM25のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+# フィールドごとの重み（メタデータの一致を本文より優先）
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "customer_name": 3.0,
+    "creator": 2.0,
+    "meeting_place": 2.0,
+    "created_date": 1.0,
+    "summary": 1.0,
+}
+METADATA_FIELDS = ("customer_name", "creator", "meeting_place", "created_date")
+# 検索結果の抜粋の前後文字数
+SNIPPET_RADIUS = 40
+
+_NUMBER_SEPARATOR = re.compile(r"(?<=\d)[,，](?=\d)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """
+    検索用の正規化（全角英数→半角、小文字化、数字の桁区切り除去、空白の統一）
+
+    Args:
+        text: 元のテキスト
+
+    Returns:
+        正規化したテキスト
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _NUMBER_SEPARATOR.sub("", text)
+    return _WHITESPACE.sub(" ", text)
+
+
+def bigrams(text: str) -> List[str]:
+    """
+    正規化済みテキストを文字bigramに分割（空白をまたぐbigramは除外）
+
+    Args:
+        text: 正規化済みテキスト
+
+    Returns:
+        bigramの一覧
+    """
+    return [text[i:i + 2] for i in range(len(text) - 1) if " " not in text[i:i + 2]]
+
+
+class MinutesSearchIndex:
+    """議事録の転置インデックス"""
+
+    def __init__(self):
+        # term -> {議事録ID: 重み付き出現回数}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_lengths: Dict[str, float] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._doc_texts: Dict[str, str] = {}
+        self._doc_info: Dict[str, Dict] = {}
+        self._total_length = 0.0
+        self._lock = threading.RLock()
+        self._last_refresh = 0.0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def add(self, record: Dict):
+        """
+        議事録をインデックスに追加（同じIDがあれば置き換え）
+
+        Args:
+            record: 議事録（id, title, summary, metadata, created_at）
+        """
+        minutes_id = record["id"]
+        metadata = record.get("metadata") or {}
+        fields = {"title": record.get("title") or "", "summary": record.get("summary") or ""}
+        fields.update({name: str(metadata.get(name) or "") for name in METADATA_FIELDS})
+
+        frequencies: Counter = Counter()
+        for name, value in fields.items():
+            weight = FIELD_WEIGHTS[name]
+            for term in bigrams(normalize(value)):
+                frequencies[term] += weight
+
+        with self._lock:
+            self._remove_locked(minutes_id)
+            for term, frequency in frequencies.items():
+                self._postings.setdefault(term, {})[minutes_id] = frequency
+            length = sum(frequencies.values())
+            self._doc_lengths[minutes_id] = length
+            self._doc_terms[minutes_id] = list(frequencies)
+            self._doc_texts[minutes_id] = normalize(" ".join(fields.values()))
+            self._doc_info[minutes_id] = {
+                "id": minutes_id,
+                "title": record.get("title"),
+                "metadata": metadata,
+                "created_at": record.get("created_at"),
+                "summary_preview": (record.get("summary") or "")[:SNIPPET_RADIUS * 2],
+            }
+            self._total_length += length
+
+    def remove(self, minutes_id: str):
+        """議事録をインデックスから削除"""
+        with self._lock:
+            self._remove_locked(minutes_id)
+
+    def _remove_locked(self, minutes_id: str):
+        terms = self._doc_terms.pop(minutes_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(minutes_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(minutes_id, 0.0)
+        self._doc_texts.pop(minutes_id, None)
+        self._doc_info.pop(minutes_id, None)
+
+    def __contains__(self, minutes_id: str) -> bool:
+        return minutes_id in self._doc_lengths
+
+    def search(self, query: str, limit: int = 20) -> Dict:
+        """
+        検索（空白区切りの語はすべて含むものを対象に、BM25でランキング）
+
+        Args:
+            query: 検索語
+            limit: 取得件数
+
+        Returns:
+            件数・所要時間・検索結果
+        """
+        start = time.perf_counter()
+        phrases = [phrase for phrase in normalize(query).split(" ") if phrase]
+        if not phrases or any(len(phrase) < 2 for phrase in phrases):
+            raise ValueError("検索語は2文字以上で入力してください")
+
+        query_terms = Counter(term for phrase in phrases for term in bigrams(phrase))
+        with self._lock:
+            # 出現数の少ないtermから絞り込み
+            postings = sorted((self._postings.get(term, {}) for term in query_terms), key=len)
+            candidates = set(postings[0]) if postings else set()
+            for posting in postings[1:]:
+                candidates &= posting.keys()
+                if not candidates:
+                    break
+            # bigramがすべて含まれていても語として連続していないものを除外
+            matched = [
+                minutes_id for minutes_id in candidates
+                if all(phrase in self._doc_texts[minutes_id] for phrase in phrases)
+            ]
+
+            doc_count = len(self._doc_lengths)
+            average_length = self._total_length / doc_count if doc_count else 0.0
+            length_norms = {
+                minutes_id: BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[minutes_id] / (average_length or 1))
+                for minutes_id in matched
+            }
+            scores = dict.fromkeys(matched, 0.0)
+            for term, query_frequency in query_terms.items():
+                posting = self._postings[term] if matched else {}
+                idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+                weight = query_frequency * idf * (BM25_K1 + 1)
+                for minutes_id in matched:
+                    frequency = posting[minutes_id]
+                    scores[minutes_id] += weight * frequency / (frequency + length_norms[minutes_id])
+
+            top = heapq.nsmallest(
+                limit, scores.items(),
+                key=lambda item: (-item[1], -(self._doc_info[item[0]].get("created_at") or 0))
+            )
+
+            items = []
+            for minutes_id, score in top:
+                item = dict(self._doc_info[minutes_id])
+                item.pop("summary_preview")
+                item["score"] = round(score, 4)
+                item["snippet"] = self._snippet(minutes_id, phrases[0])
+                items.append(item)
+
+        return {
+            "query": query,
+            "total": len(matched),
+            "took_ms": round((time.perf_counter() - start) * 1000, 3),
+            "items": items,
+        }
+
+    def _snippet(self, minutes_id: str, phrase: str) -> str:
+        """一致箇所の前後を抜粋"""
+        text = self._doc_texts[minutes_id]
+        position = text.find(phrase)
+        if position < 0:
+            return self._doc_info[minutes_id]["summary_preview"]
+        begin = max(0, position - SNIPPET_RADIUS)
+        end = min(len(text), position + len(phrase) + SNIPPET_RADIUS)
+        return ("…" if begin > 0 else "") + text[begin:end] + ("…" if end < len(text) else "")
+
+    def add_all(self, records: Iterable[Dict]) -> int:
+        """
+        議事録をまとめて追加
+
+        Args:
+            records: 議事録の一覧
+
+        Returns:
+            追加した件数
+        """
+        count = 0
+        for record in records:
+            self.add(record)
+            count += 1
+        return count
+
+    def refresh(self, store, force: bool = False) -> int:
+        """
+        保存先から未登録の議事録を取り込む（他インスタンスで保存された分）
+
+        Args:
+            store: 議事録の保存先
+            force: 間隔に関係なく実行するか
+
+        Returns:
+            取り込んだ件数
+        """
+        now = time.monotonic()
+        if not force and now - self._last_refresh < MINUTES_SEARCH_REFRESH_SECONDS:
+            return 0
+        self._last_refresh = now
+
+        # 新しい順に読み、登録済みのIDに達したら終了
+        added = 0
+        cursor = None
+        while True:
+            items, cursor = store.list(limit=50, cursor=cursor)
+            new_items = [item for item in items if item["id"] not in self]
+            for item in new_items:
+                record = store.get(item["id"])
+                if record is not None:
+                    self.add(record)
+                    added += 1
+            if not cursor or len(new_items) < len(items):
+                break
+        if added:
+            logger.info(f"検索インデックスに{added}件追加（合計: {len(self)}件）")
+        return added
+
+
+def build_search_index(store) -> MinutesSearchIndex:
+    """
+    保存先の全議事録からインデックスを作成
+
+    Args:
+        store: 議事録の保存先（Noneの場合は空のインデックス）
+
+    Returns:
+        検索インデックス
+    """
+    index = MinutesSearchIndex()
+    if store is not None:
+        start = time.perf_counter()
+        count = index.add_all(store.iter_records())
+        index._last_refresh = time.monotonic()
+        logger.info(f"検索インデックス作成完了: {count}件 ({time.perf_counter() - start:.2f}秒)")
+    return index
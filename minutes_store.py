@@ -0,0 +1,333 @@
+"""
+議事録の保存モジュール
+生成した議事録をメタデータ・処理時間とともに保存し、一覧・取得を提供
+ローカルはSQLite、本番はFirestore（MINUTES_STORE=firestore）を使用
+"""
+import os
+import json
+import time
+import uuid
+import base64
+import sqlite3
+import threading
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 保存先（sqlite / firestore / none）
+MINUTES_STORE = os.getenv("MINUTES_STORE", "sqlite").lower()
+# SQLiteのファイルパス
+MINUTES_DB_PATH = os.getenv(
+    "MINUTES_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "minutes.sqlite3")
+)
+# Firestoreのコレクション名
+MINUTES_FIRESTORE_COLLECTION = os.getenv("MINUTES_FIRESTORE_COLLECTION", "minutes")
+# 一覧の最大件数
+MAX_PAGE_SIZE = 100
+
+
+def new_minutes_id() -> str:
+    """議事録IDを発行"""
+    return uuid.uuid4().hex
+
+
+def _encode_cursor(created_at: float, minutes_id: str) -> str:
+    """ページングカーソル（最後の要素の作成日時とID）"""
+    raw = json.dumps([created_at, minutes_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        created_at, minutes_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(created_at), str(minutes_id)
+    except Exception:
+        raise ValueError("不正なカーソルです")
+
+
+def _summary_item(record: Dict) -> Dict:
+    """一覧表示用（本文を除く）"""
+    return {key: value for key, value in record.items() if key != "summary"}
+
+
+class MinutesStore(ABC):
+    """議事録の保存先の共通インターフェース"""
+
+    @abstractmethod
+    def save(self, record: Dict) -> str:
+        """
+        議事録を保存（同じ冪等キーの議事録があれば、そのIDで上書き）
+
+        Args:
+            record: 議事録（id, owner, title, summary, metadata, timings, blob_name, job_id, idempotency_key）
+
+        Returns:
+            議事録ID
+        """
+
+    @abstractmethod
+    def get(self, minutes_id: str) -> Optional[Dict]:
+        """
+        議事録を取得
+
+        Args:
+            minutes_id: 議事録ID
+
+        Returns:
+            議事録（存在しない場合はNone）
+        """
+
+    @abstractmethod
+    def list(self, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        議事録の一覧を新しい順に取得（本文を除く）
+
+        Args:
+            limit: 取得件数
+            cursor: 前ページの next_cursor
+
+        Returns:
+            (議事録の一覧, 次ページのカーソル)
+        """
+
+    @abstractmethod
+    def find_by_idempotency_key(self, key: str) -> Optional[Dict]:
+        """
+        冪等キーで議事録を検索（/api/upload の再試行に保存済みの結果を返すため）
+
+        Args:
+            key: 冪等キー
+
+        Returns:
+            議事録（存在しない場合はNone）
+        """
+
+    def iter_records(self) -> Iterator[Dict]:
+        """
+        全議事録を本文付きで順に取得（検索インデックスの作成用）
+
+        Yields:
+            議事録
+        """
+        cursor = None
+        while True:
+            items, cursor = self.list(limit=MAX_PAGE_SIZE, cursor=cursor)
+            for item in items:
+                record = self.get(item["id"])
+                if record is not None:
+                    yield record
+            if not cursor:
+                break
+
+    @staticmethod
+    def _normalize(record: Dict) -> Dict:
+        """保存前にIDと作成日時を補完"""
+        record = dict(record)
+        record.setdefault("id", new_minutes_id())
+        record.setdefault("created_at", time.time())
+        record.setdefault("metadata", {})
+        record.setdefault("timings", {})
+        return record
+
+
+class SQLiteMinutesStore(MinutesStore):
+    """SQLiteに保存（ローカル・単一インスタンス用）"""
+
+    def __init__(self, path: str = MINUTES_DB_PATH):
+        """
+        Args:
+            path: データベースファイルのパス
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS minutes (
+                    id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    owner TEXT,
+                    title TEXT,
+                    summary TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    timings TEXT NOT NULL,
+                    blob_name TEXT,
+                    job_id TEXT,
+                    idempotency_key TEXT
+                )
+                """
+            )
+            # 冪等キー追加前に作成したデータベースの移行
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(minutes)")}
+            if "idempotency_key" not in columns:
+                self._conn.execute("ALTER TABLE minutes ADD COLUMN idempotency_key TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_minutes_created ON minutes (created_at DESC, id DESC)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_minutes_idempotency ON minutes (idempotency_key)")
+        logger.info(f"議事録ストア（SQLite）: {path}")
+
+    def save(self, record: Dict) -> str:
+        record = self._normalize(record)
+        with self._lock, self._conn:
+            # 同じジョブが重複して実行された場合も議事録は1件にまとめる
+            if record.get("idempotency_key"):
+                existing = self._conn.execute(
+                    "SELECT id, created_at FROM minutes WHERE idempotency_key = ? ORDER BY created_at LIMIT 1",
+                    (record["idempotency_key"],),
+                ).fetchone()
+                if existing is not None:
+                    record.update(id=existing["id"], created_at=existing["created_at"])
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO minutes
+                    (id, created_at, owner, title, summary, metadata, timings, blob_name, job_id, idempotency_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    record["id"], record["created_at"], record.get("owner"), record.get("title"),
+                    record["summary"],
+                    json.dumps(record["metadata"], ensure_ascii=False),
+                    json.dumps(record["timings"], ensure_ascii=False),
+                    record.get("blob_name"), record.get("job_id"), record.get("idempotency_key"),
+                ),
+            )
+        return record["id"]
+
+    def get(self, minutes_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM minutes WHERE id = ?", (minutes_id,)).fetchone()
+        return self._to_record(row) if row else None
+
+    def list(self, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        columns = "id, created_at, owner, title, '' AS summary, metadata, timings, blob_name, job_id, idempotency_key"
+        with self._lock:
+            if cursor:
+                created_at, minutes_id = _decode_cursor(cursor)
+                rows = self._conn.execute(
+                    f"SELECT {columns} FROM minutes WHERE (created_at, id) < (?, ?) "
+                    "ORDER BY created_at DESC, id DESC LIMIT ?",
+                    (created_at, minutes_id, limit + 1),
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    f"SELECT {columns} FROM minutes ORDER BY created_at DESC, id DESC LIMIT ?",
+                    (limit + 1,),
+                ).fetchall()
+
+        items = [_summary_item(self._to_record(row)) for row in rows[:limit]]
+        next_cursor = _encode_cursor(items[-1]["created_at"], items[-1]["id"]) if len(rows) > limit else None
+        return items, next_cursor
+
+    def find_by_idempotency_key(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM minutes WHERE idempotency_key = ? ORDER BY created_at DESC LIMIT 1", (key,)
+            ).fetchone()
+        return self._to_record(row) if row else None
+
+    def iter_records(self) -> Iterator[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM minutes ORDER BY created_at DESC, id DESC").fetchall()
+        for row in rows:
+            yield self._to_record(row)
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> Dict:
+        record = dict(row)
+        record["metadata"] = json.loads(record["metadata"])
+        record["timings"] = json.loads(record["timings"])
+        return record
+
+
+class FirestoreMinutesStore(MinutesStore):
+    """Firestoreに保存（Cloud Runの複数インスタンス間で共有）"""
+
+    def __init__(self, collection: str = MINUTES_FIRESTORE_COLLECTION):
+        """
+        Args:
+            collection: コレクション名
+        """
+        from google.cloud import firestore
+        from google.api_core.exceptions import FailedPrecondition
+
+        self._firestore = firestore
+        self._missing_index_error = FailedPrecondition
+        self._client = firestore.Client()
+        self._collection = self._client.collection(collection)
+        logger.info(f"議事録ストア（Firestore）: {collection}")
+
+    def save(self, record: Dict) -> str:
+        record = self._normalize(record)
+        key = record.get("idempotency_key")
+
+        @self._firestore.transactional
+        def _save(transaction) -> str:
+            # 同じジョブが重複して実行された場合も議事録は1件にまとめる
+            if key:
+                query = self._collection.where("idempotency_key", "==", key).limit(1)
+                for snapshot in transaction.get(query):
+                    existing = snapshot.to_dict()
+                    record.update(id=existing["id"], created_at=existing["created_at"])
+            transaction.set(self._collection.document(record["id"]), record)
+            return record["id"]
+
+        return _save(self._client.transaction())
+
+    def get(self, minutes_id: str) -> Optional[Dict]:
+        snapshot = self._collection.document(minutes_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def list(self, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query = (
+            self._collection
+            .order_by("created_at", direction=self._firestore.Query.DESCENDING)
+            .order_by("id", direction=self._firestore.Query.DESCENDING)
+        )
+        if cursor:
+            query = query.start_after(list(_decode_cursor(cursor)))
+        try:
+            records = [snapshot.to_dict() for snapshot in query.limit(limit + 1).stream()]
+        except self._missing_index_error:
+            logger.error(
+                "議事録一覧のFirestore複合インデックス（created_at 降順 + id 降順）がありません。"
+                "firestore.indexes.json のインデックスを作成してください"
+            )
+            raise
+
+        items = [_summary_item(record) for record in records[:limit]]
+        next_cursor = _encode_cursor(items[-1]["created_at"], items[-1]["id"]) if len(records) > limit else None
+        return items, next_cursor
+
+    def find_by_idempotency_key(self, key: str) -> Optional[Dict]:
+        query = self._collection.where("idempotency_key", "==", key).limit(1)
+        for snapshot in query.stream():
+            return snapshot.to_dict()
+        return None
+
+    def iter_records(self) -> Iterator[Dict]:
+        for snapshot in self._collection.stream():
+            yield snapshot.to_dict()
+
+
+def create_minutes_store() -> Optional[MinutesStore]:
+    """
+    MINUTES_STORE に応じた保存先を作成
+
+    Returns:
+        保存先（none の場合はNone）
+    """
+    if MINUTES_STORE == "none":
+        return None
+    if MINUTES_STORE == "firestore":
+        return FirestoreMinutesStore()
+    return SQLiteMinutesStore()
@@ -0,0 +1,126 @@
+"""
+WAVの窓ごとの読み込み・モノラル化・リサンプリング
+ffmpegが使えない環境で、録音全体をメモリに載せずに一定時間ずつ変換する
+（メモリ使用量は録音の長さに関係なく窓の大きさのみ）
+"""
+import wave
+import logging
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+# 1回に読み込む時間（秒）
+WINDOW_SECONDS = 10
+# ダウンサンプリング前のローパスフィルタのタップ数と、変換後のナイキスト周波数に対する遮断周波数の割合
+LOWPASS_TAPS = 101
+LOWPASS_CUTOFF_RATIO = 0.9
+
+
+class StreamingResampler:
+    """窓ごとに受け取ったPCMをリサンプリング（窓の境目でも連続した出力になるよう状態を保持）"""
+
+    def __init__(self, source_rate: int, target_rate: int):
+        """
+        Args:
+            source_rate: 入力のサンプリングレート
+            target_rate: 出力のサンプリングレート
+        """
+        self.ratio = source_rate / target_rate
+        self._taps = None
+        if source_rate > target_rate:
+            # 折り返し雑音を防ぐ窓関数法のローパスフィルタ
+            cutoff = LOWPASS_CUTOFF_RATIO * target_rate / 2 / source_rate
+            n = np.arange(LOWPASS_TAPS) - (LOWPASS_TAPS - 1) / 2
+            taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(LOWPASS_TAPS)
+            self._taps = (taps / taps.sum()).astype(np.float32)
+            self._history = np.zeros(LOWPASS_TAPS - 1, dtype=np.float32)
+        # 前の窓の最後のサンプルと、その通し番号・次に出力するサンプルの番号
+        self._carry = np.zeros(0, dtype=np.float32)
+        self._base = 0
+        self._next = 0
+
+    def process(self, samples):
+        """
+        PCMをリサンプリング
+
+        Args:
+            samples: 入力のサンプル（float32）
+
+        Returns:
+            出力のサンプル（float32）
+        """
+        if self.ratio == 1:
+            return samples
+        if self._taps is not None:
+            padded = np.concatenate([self._history, samples])
+            self._history = padded[-(LOWPASS_TAPS - 1):]
+            samples = np.convolve(padded, self._taps, mode="valid").astype(np.float32)
+
+        buffer = np.concatenate([self._carry, samples])
+        if not len(buffer):
+            return buffer
+        last = self._base + len(buffer) - 1
+        end = int(last // self.ratio)
+        if end < self._next:
+            output = np.zeros(0, dtype=np.float32)
+        else:
+            # 出力サンプルの時刻を録音全体の通し番号で計算して線形補間
+            times = np.arange(self._next, end + 1) * self.ratio - self._base
+            output = np.interp(times, np.arange(len(buffer)), buffer).astype(np.float32)
+            self._next = end + 1
+        self._carry = buffer[-1:]
+        self._base = last
+        return output
+
+
+def _to_float(data: bytes, width: int):
+    """WAVのサンプルを -1〜1 のfloat32に変換（8/16/24/32bit）"""
+    if width == 1:
+        return (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128.0
+    if width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        values = np.where(values >= 1 << 23, values - (1 << 24), values)
+        return values.astype(np.float32) / float(1 << 23)
+    dtype = {2: "<i2", 4: "<i4"}[width]
+    return np.frombuffer(data, dtype=dtype).astype(np.float32) / float(1 << (width * 8 - 1))
+
+
+def iter_wav_pcm(file_path: str, target_rate: int, window_seconds: float = WINDOW_SECONDS) -> Iterator:
+    """
+    WAVを一定時間ずつ読み込み、モノラル化・リサンプリングしたPCMを順に返す
+
+    Args:
+        file_path: WAVファイルのパス
+        target_rate: 出力のサンプリングレート
+        window_seconds: 1回に読み込む時間（秒）
+
+    Yields:
+        モノラルのサンプル（float32、-1〜1）
+
+    Raises:
+        wave.Error: WAV（PCM）以外のファイル
+    """
+    with wave.open(file_path, 'rb') as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        rate = wav.getframerate()
+        if width not in (1, 2, 3, 4):
+            raise wave.Error(f"未対応のサンプルサイズです: {width * 8}bit")
+        resampler = StreamingResampler(rate, target_rate)
+        window_frames = max(1, int(rate * window_seconds))
+        while True:
+            data = wav.readframes(window_frames)
+            if not data:
+                break
+            samples = _to_float(data, width)
+            if channels > 1:
+                samples = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+            yield resampler.process(samples)
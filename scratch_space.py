@@ -0,0 +1,284 @@
+"""
+一時作業領域の管理モジュール
+ジョブごとの作業ディレクトリ（確実に削除）、容量上限、孤立ファイルの定期削除
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# tmpfs（メモリ上のファイルシステム）の場合、メモリ上限に対して使用してよい割合
+TMPFS_MEMORY_RATIO = 0.25
+# ディスクの場合、空き容量に対して使用してよい割合
+DISK_FREE_RATIO = 0.8
+# 作業ディレクトリ名の接頭辞
+WORKSPACE_PREFIX = "job-"
+
+
+class ScratchSpaceFull(Exception):
+    """一時作業領域の容量上限を超える場合の例外"""
+
+
+def _mount_fstype(path: str) -> Optional[str]:
+    """
+    パスが属するファイルシステムの種類を取得（/proc/mountsを参照）
+
+    Args:
+        path: 対象パス
+
+    Returns:
+        ファイルシステム名（取得できない場合はNone）
+    """
+    path = os.path.realpath(path)
+    best_mount, best_type = "", None
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mount_point, fstype = parts[1], parts[2]
+                if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) \
+                        and len(mount_point) > len(best_mount):
+                    best_mount, best_type = mount_point, fstype
+    except OSError:
+        return None
+    return best_type
+
+
+def _memory_limit_bytes() -> Optional[int]:
+    """コンテナのメモリ上限（cgroup、なければ物理メモリ）"""
+    for cgroup_file in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(cgroup_file) as f:
+                value = f.read().strip()
+            if value != "max" and int(value) < 1 << 60:
+                return int(value)
+        except (OSError, ValueError):
+            continue
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _directory_size(path: str) -> int:
+    """ディレクトリ配下の合計サイズ"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                continue
+    return total
+
+
+def _pid_alive(pid: int) -> bool:
+    """プロセスが生存しているか"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobWorkspace:
+    """1ジョブ分の作業ディレクトリ"""
+
+    def __init__(self, scratch: "ScratchSpace", path: str):
+        self.scratch = scratch
+        self.path = path
+        self.reserved_bytes = 0
+
+    def reserve(self, size_bytes: int):
+        """
+        書き込み前に容量を予約（上限を超える場合はScratchSpaceFull）
+
+        Args:
+            size_bytes: 予約するバイト数
+        """
+        self.scratch._reserve(self, size_bytes)
+
+    def file_path(self, suffix: str = "", prefix: str = "") -> str:
+        """
+        作業ディレクトリ内の新しいファイルパスを生成
+
+        Args:
+            suffix: 拡張子
+            prefix: ファイル名の接頭辞
+
+        Returns:
+            ファイルパス
+        """
+        return os.path.join(self.path, f"{prefix}{uuid.uuid4().hex}{suffix}")
+
+
+class ScratchSpace:
+    """容量上限付きの一時作業領域"""
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        """
+        Args:
+            root: 作業領域のルートディレクトリ（デフォルト: SCRATCH_DIR または システム一時ディレクトリ配下）
+            max_bytes: 容量上限（デフォルト: SCRATCH_MAX_BYTES または tmpfs/ディスクから自動決定）
+        """
+        self.root = root or os.getenv("SCRATCH_DIR") or os.path.join(tempfile.gettempdir(), "minutes-scratch")
+        os.makedirs(self.root, exist_ok=True)
+
+        fstype = _mount_fstype(self.root)
+        self.is_tmpfs = fstype in ("tmpfs", "ramfs")
+        self.max_bytes = max_bytes or int(os.getenv("SCRATCH_MAX_BYTES", "0")) or self._default_max_bytes()
+
+        self._lock = threading.Lock()
+        self._active: Dict[str, JobWorkspace] = {}
+        self._reserved_total = 0
+        self._sweeper = None
+
+        logger.info(
+            f"一時作業領域: {self.root} (種類: {fstype or '不明'}, "
+            f"上限: {self.max_bytes / (1024 * 1024):.0f} MB)"
+        )
+
+    def _default_max_bytes(self) -> int:
+        """tmpfsならメモリ上限、ディスクなら空き容量から上限を決定"""
+        if self.is_tmpfs:
+            memory = _memory_limit_bytes()
+            if memory:
+                return int(memory * TMPFS_MEMORY_RATIO)
+        free = shutil.disk_usage(self.root).free
+        return int(free * DISK_FREE_RATIO)
+
+    @contextmanager
+    def workspace(self, job_id: Optional[str] = None) -> Iterator[JobWorkspace]:
+        """
+        ジョブ用の作業ディレクトリを作成し、終了時に必ず削除
+
+        Args:
+            job_id: ジョブID（ログ用）
+
+        Yields:
+            作業ディレクトリ
+        """
+        path = tempfile.mkdtemp(prefix=f"{WORKSPACE_PREFIX}{os.getpid()}-", dir=self.root)
+        workspace = JobWorkspace(self, path)
+        with self._lock:
+            self._active[path] = workspace
+        logger.debug(f"作業ディレクトリ作成: {path} (ジョブ: {job_id})")
+        try:
+            yield workspace
+        finally:
+            with self._lock:
+                self._active.pop(path, None)
+                self._reserved_total -= workspace.reserved_bytes
+            shutil.rmtree(path, ignore_errors=True)
+            logger.debug(f"作業ディレクトリ削除: {path}")
+
+    def _reserve(self, workspace: JobWorkspace, size_bytes: int):
+        """容量を予約（上限を超える場合は例外）"""
+        with self._lock:
+            if self._reserved_total + size_bytes > self.max_bytes:
+                raise ScratchSpaceFull(
+                    f"一時作業領域の容量が不足しています "
+                    f"(要求: {size_bytes / (1024 * 1024):.1f} MB, "
+                    f"使用中: {self._reserved_total / (1024 * 1024):.1f} MB, "
+                    f"上限: {self.max_bytes / (1024 * 1024):.1f} MB)"
+                )
+            self._reserved_total += size_bytes
+            workspace.reserved_bytes += size_bytes
+
+    def usage(self) -> Dict:
+        """作業領域の使用状況"""
+        with self._lock:
+            return {
+                "root": self.root,
+                "tmpfs": self.is_tmpfs,
+                "max_bytes": self.max_bytes,
+                "reserved_bytes": self._reserved_total,
+                "active_workspaces": len(self._active),
+            }
+
+    def sweep(self, max_age_seconds: float) -> Tuple[int, int]:
+        """
+        クラッシュ等で残った作業ディレクトリを削除
+        終了済みプロセスのもの、または一定時間を超えたものが対象
+
+        Args:
+            max_age_seconds: 使用中でないディレクトリを削除するまでの時間（秒）
+
+        Returns:
+            (削除したディレクトリ数, 解放したバイト数)
+        """
+        removed, reclaimed = 0, 0
+        now = time.time()
+        try:
+            entries = os.listdir(self.root)
+        except OSError as e:
+            logger.warning(f"一時作業領域の走査エラー: {str(e)}")
+            return (0, 0)
+
+        for name in entries:
+            path = os.path.join(self.root, name)
+            with self._lock:
+                if path in self._active:
+                    continue
+
+            orphaned = False
+            if name.startswith(WORKSPACE_PREFIX):
+                try:
+                    pid = int(name[len(WORKSPACE_PREFIX):].split("-", 1)[0])
+                    orphaned = pid != os.getpid() and not _pid_alive(pid)
+                except ValueError:
+                    pass
+            try:
+                expired = now - os.path.getmtime(path) > max_age_seconds
+            except OSError:
+                continue
+            if not (orphaned or expired):
+                continue
+
+            size = _directory_size(path) if os.path.isdir(path) else os.path.getsize(path)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.unlink(path)
+                removed += 1
+                reclaimed += size
+            except OSError as e:
+                logger.warning(f"孤立ファイル削除エラー: {path} - {str(e)}")
+
+        if removed:
+            logger.info(f"孤立した一時ファイルを削除: {removed}件 ({reclaimed / (1024 * 1024):.1f} MB)")
+        return (removed, reclaimed)
+
+    def start_sweeper(self, interval_seconds: float = 600, max_age_seconds: float = 3 * 3600):
+        """
+        孤立ファイルの定期削除をバックグラウンドで開始
+
+        Args:
+            interval_seconds: 実行間隔（秒）
+            max_age_seconds: 削除対象とする経過時間（秒）
+        """
+        if self._sweeper is not None:
+            return
+
+        def _loop():
+            while True:
+                try:
+                    self.sweep(max_age_seconds)
+                except Exception as e:
+                    logger.warning(f"一時ファイルの定期削除エラー: {str(e)}")
+                time.sleep(interval_seconds)
+
+        self._sweeper = threading.Thread(target=_loop, name="scratch-sweeper", daemon=True)
+        self._sweeper.start()
@@ -0,0 +1,151 @@
+"""
+サービスの遅延初期化モジュール
+重いサービス（Gemini、GCS、音声処理、ドキュメント生成）を初回利用時に初期化し、
+起動時間の内訳を記録
+"""
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LazyService:
+    """初回利用時に初期化されるサービス"""
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        """
+        Args:
+            name: サービス名
+            factory: サービスを生成する関数
+        """
+        self.name = name
+        self.factory = factory
+        self._instance = None
+        self._initialized = False
+        self._lock = threading.Lock()
+        self.init_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def get(self) -> Any:
+        """
+        サービスを取得（未初期化なら初期化）
+
+        Returns:
+            サービスのインスタンス
+        """
+        if self._initialized:
+            return self._instance
+
+        with self._lock:
+            if not self._initialized:
+                start = time.perf_counter()
+                try:
+                    self._instance = self.factory()
+                    self.error = None
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                finally:
+                    self.init_seconds = time.perf_counter() - start
+                self._initialized = True
+                logger.info(f"{self.name} 初期化完了 ({self.init_seconds:.3f}秒)")
+        return self._instance
+
+    def override(self, instance: Any):
+        """
+        サービスを差し替え（ベンチマーク・ローカル検証用）
+
+        Args:
+            instance: 差し替えるインスタンス
+        """
+        with self._lock:
+            self._instance = instance
+            self._initialized = True
+
+    @property
+    def initialized(self) -> bool:
+        return self._initialized
+
+
+class ServiceRegistry:
+    """遅延初期化サービスの一覧と起動時間の記録"""
+
+    def __init__(self, started_at: Optional[float] = None):
+        """
+        Args:
+            started_at: プロセス起動処理の開始時刻（time.perf_counter）
+        """
+        self._services: Dict[str, LazyService] = {}
+        self._phases: List[Dict] = []
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.ready_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+
+    def register(self, name: str, factory: Callable[[], Any]) -> LazyService:
+        """
+        サービスを登録
+
+        Args:
+            name: サービス名
+            factory: サービスを生成する関数
+
+        Returns:
+            登録したサービス
+        """
+        service = LazyService(name, factory)
+        self._services[name] = service
+        return service
+
+    def record_phase(self, name: str, seconds: float):
+        """
+        起動処理の所要時間を記録
+
+        Args:
+            name: 処理名
+            seconds: 所要時間（秒）
+        """
+        self._phases.append({"name": name, "seconds": round(seconds, 4)})
+
+    def mark_ready(self):
+        """リクエスト受付可能になった時点を記録"""
+        self.ready_seconds = time.perf_counter() - self.started_at
+        logger.info(f"起動完了 ({self.ready_seconds:.3f}秒)")
+
+    def warm_up(self):
+        """
+        全サービスをバックグラウンドで初期化（最初のリクエストの待ち時間を削減）
+        """
+        def _run():
+            start = time.perf_counter()
+            for service in self._services.values():
+                try:
+                    service.get()
+                except Exception as e:
+                    logger.warning(f"{service.name} のウォームアップに失敗しました: {str(e)}")
+            self.warmup_seconds = time.perf_counter() - start
+            logger.info(f"ウォームアップ完了 ({self.warmup_seconds:.3f}秒)")
+
+        threading.Thread(target=_run, name="service-warmup", daemon=True).start()
+
+    def report(self) -> Dict:
+        """
+        起動時間の内訳
+
+        Returns:
+            起動処理・各サービス初期化の所要時間
+        """
+        return {
+            "phases": list(self._phases),
+            "ready_seconds": round(self.ready_seconds, 4) if self.ready_seconds is not None else None,
+            "warmup_seconds": round(self.warmup_seconds, 4) if self.warmup_seconds is not None else None,
+            "services": {
+                name: {
+                    "initialized": service.initialized,
+                    "init_seconds": round(service.init_seconds, 4) if service.init_seconds is not None else None,
+                    "error": service.error,
+                }
+                for name, service in self._services.items()
+            },
+        }
@@ -0,0 +1,184 @@
+"""
+静的ファイル配信モジュール
+HTML/JSをメモリにキャッシュし、圧縮版・ETag・Cache-Controlを付けて配信
+"""
+import os
+import gzip
+import hashlib
+import threading
+import logging
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+# brotliはオプション（未インストールの場合はgzipのみ）
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+# バージョン付きURL（?v=...）で参照される資産のキャッシュ期間
+VERSIONED_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# バージョンなしの資産は毎回ETagで再検証
+UNVERSIONED_CACHE_CONTROL = "no-cache"
+# これより小さいファイルは圧縮しない
+MIN_COMPRESS_BYTES = 1024
+# 圧縮方式の優先順（クライアントの q 値が同じ場合）
+ENCODING_PREFERENCE = ("br", "gzip")
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """
+    Accept-Encoding を圧縮方式ごとの q 値に変換
+
+    Args:
+        header: Accept-Encoding ヘッダーの値
+
+    Returns:
+        圧縮方式（小文字）ごとの q 値（q=0 は受け付けない）
+    """
+    accepted: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, *params = [value.strip() for value in part.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.lower()] = quality
+    return accepted
+
+
+def select_encoding(header: str, available) -> Optional[str]:
+    """
+    クライアントが受け付ける圧縮方式から、q 値が最も高いものを選択
+
+    Args:
+        header: Accept-Encoding ヘッダーの値
+        available: 用意している圧縮方式
+
+    Returns:
+        圧縮方式（該当なし・q=0 のみの場合はNone）
+    """
+    accepted = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for encoding in ENCODING_PREFERENCE:
+        if encoding not in available:
+            continue
+        # 明示されていない方式は * の q 値に従う
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class StaticAsset:
+    """メモリ上にキャッシュした静的ファイル（圧縮版を含む）"""
+
+    def __init__(self, path: str, media_type: str):
+        self.path = path
+        self.media_type = media_type
+        self.mtime = os.path.getmtime(path)
+        with open(path, "rb") as f:
+            self.body = f.read()
+        self.digest = hashlib.sha256(self.body).hexdigest()[:32]
+
+        # 圧縮版を事前に作成
+        self.variants: Dict[str, bytes] = {}
+        if len(self.body) >= MIN_COMPRESS_BYTES:
+            self.variants["gzip"] = gzip.compress(self.body, compresslevel=9, mtime=0)
+            if BROTLI_AVAILABLE:
+                self.variants["br"] = brotli.compress(self.body, quality=11)
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        """表現（圧縮形式）ごとの強いETag"""
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+
+class StaticAssetCache:
+    """静的ファイルのインメモリキャッシュ"""
+
+    def __init__(self, base_dir: Optional[str] = None, hot_reload: Optional[bool] = None):
+        """
+        Args:
+            base_dir: 静的ファイルのディレクトリ（デフォルト: このファイルのディレクトリ）
+            hot_reload: 更新日時を確認して再読み込みするか（デフォルト: STATIC_HOT_RELOAD）
+        """
+        self.base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+        if hot_reload is None:
+            hot_reload = os.getenv("STATIC_HOT_RELOAD", "false").lower() == "true"
+        self.hot_reload = hot_reload
+        self._assets: Dict[str, StaticAsset] = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename: str, media_type: str) -> Optional[StaticAsset]:
+        """
+        キャッシュ済みのファイルを取得（初回のみディスクから読み込み）
+
+        Args:
+            filename: ファイル名
+            media_type: Content-Type
+
+        Returns:
+            キャッシュしたファイル（存在しない場合はNone）
+        """
+        asset = self._assets.get(filename)
+        if asset is not None and not self.hot_reload:
+            return asset
+
+        path = os.path.join(self.base_dir, filename)
+        try:
+            if asset is not None and os.path.getmtime(path) == asset.mtime:
+                return asset
+            with self._lock:
+                asset = StaticAsset(path, media_type)
+                self._assets[filename] = asset
+            logger.info(f"静的ファイルをキャッシュ: {filename} ({len(asset.body)} bytes, 圧縮形式: {list(asset.variants)})")
+            return asset
+        except FileNotFoundError:
+            return None
+
+    def response(self, request: Request, filename: str, media_type: str) -> Optional[Response]:
+        """
+        条件付きリクエスト・圧縮に対応したレスポンスを作成
+
+        Args:
+            request: リクエスト
+            filename: ファイル名
+            media_type: Content-Type
+
+        Returns:
+            レスポンス（ファイルが存在しない場合はNone）
+        """
+        asset = self.get(filename, media_type)
+        if asset is None:
+            return None
+
+        encoding = select_encoding(request.headers.get("accept-encoding", ""), asset.variants)
+
+        cache_control = VERSIONED_CACHE_CONTROL if "v" in request.query_params else UNVERSIONED_CACHE_CONTROL
+        headers = {
+            "ETag": asset.etag(encoding),
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+
+        if_none_match = request.headers.get("if-none-match", "")
+        requested_tags = {tag.strip() for tag in if_none_match.split(",")}
+        if headers["ETag"] in requested_tags or "*" in requested_tags:
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return Response(content=asset.variants[encoding], media_type=media_type, headers=headers)
+        return Response(content=asset.body, media_type=media_type, headers=headers)
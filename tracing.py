@@ -0,0 +1,329 @@
+"""
+リクエスト/ジョブ単位のトレーシングモジュール
+GCS・ffmpeg・Gemini の各処理をスパンとして記録し、ジョブごとのタイムラインを取得
+スパンの形式はOpenTelemetry（OTLP JSON）のフィールド名に準拠
+"""
+import os
+import time
+import asyncio
+import functools
+import uuid
+import threading
+import logging
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ローカルエクスポーターが保持するジョブ数
+LOCAL_EXPORTER_MAX_JOBS = 200
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_current_job_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_job_id", default=None)
+
+
+class Span:
+    """処理区間（OpenTelemetryのSpanに相当）"""
+
+    def __init__(self, name: str, trace_id: str, parent: Optional["Span"], job_id: Optional[str],
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_span_id = parent.span_id if parent else None
+        self.job_id = job_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+        self.status = "UNSET"
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException):
+        self.status = "ERROR"
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.end_time_ns is None:
+            self.end_time_ns = time.time_ns()
+            if self.status == "UNSET":
+                self.status = "OK"
+
+    @property
+    def duration_seconds(self) -> Optional[float]:
+        if self.end_time_ns is None:
+            return None
+        return (self.end_time_ns - self.start_time_ns) / 1e9
+
+    def to_dict(self) -> Dict:
+        """OTLP JSON形式に準拠した辞書"""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_time_ns),
+            "endTimeUnixNano": str(self.end_time_ns or ""),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": f"STATUS_CODE_{self.status}", "message": self.status_message},
+        }
+
+
+class NoopExporter:
+    """スパンを破棄するエクスポーター"""
+
+    def export(self, span: Span):
+        pass
+
+    def get_job(self, job_id: str) -> Optional[List[Span]]:
+        return None
+
+
+class LocalExporter:
+    """直近のジョブのスパンをメモリに保持するエクスポーター"""
+
+    def __init__(self, max_jobs: int = LOCAL_EXPORTER_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        if not span.job_id:
+            return
+        with self._lock:
+            spans = self._jobs.setdefault(span.job_id, [])
+            spans.append(span)
+            self._jobs.move_to_end(span.job_id)
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+    def get_job(self, job_id: str) -> Optional[List[Span]]:
+        with self._lock:
+            spans = self._jobs.get(job_id)
+            return list(spans) if spans is not None else None
+
+
+class Tracer:
+    """スパンの作成とエクスポート"""
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter or NoopExporter()
+
+    @contextmanager
+    def job(self, name: str, job_id: Optional[str] = None, **attributes) -> Iterator[Span]:
+        """
+        ジョブのルートスパンを開始（配下のスパンは同じジョブIDに紐付く）
+
+        Args:
+            name: スパン名
+            job_id: ジョブID（省略時は自動生成）
+            **attributes: スパンの属性
+
+        Yields:
+            ルートスパン
+        """
+        job_id = job_id or uuid.uuid4().hex
+        token = _current_job_id.set(job_id)
+        try:
+            with self._span(name, attributes, new_trace=True) as span:
+                span.set_attribute("job.id", job_id)
+                yield span
+        finally:
+            _current_job_id.reset(token)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """
+        現在のスパンの子スパンを開始
+
+        Args:
+            name: スパン名
+            **attributes: スパンの属性
+
+        Yields:
+            スパン
+        """
+        with self._span(name, attributes, new_trace=False) as span:
+            yield span
+
+    def traced(self, name: str):
+        """
+        関数全体をスパンで記録するデコレーター（async関数にも対応）
+
+        Args:
+            name: スパン名
+        """
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def _span(self, name: str, attributes: Dict[str, Any], new_trace: bool) -> Iterator[Span]:
+        parent = None if new_trace else _current_span.get()
+        trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        span = Span(name, trace_id, parent, _current_job_id.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+            try:
+                self.exporter.export(span)
+            except Exception as e:
+                logger.warning(f"スパンのエクスポートエラー: {str(e)}")
+
+    def job_timeline(self, job_id: str) -> Optional[Dict]:
+        """
+        ジョブのタイムラインを取得
+
+        Args:
+            job_id: ジョブID
+
+        Returns:
+            スパン一覧とタイムライン（記録がない場合はNone）
+        """
+        spans = self.exporter.get_job(job_id)
+        if not spans:
+            return None
+
+        spans = sorted(spans, key=lambda s: s.start_time_ns)
+        job_start = spans[0].start_time_ns
+        depth: Dict[str, int] = {}
+        timeline = []
+        for span in spans:
+            level = depth.get(span.parent_span_id, -1) + 1 if span.parent_span_id else 0
+            depth[span.span_id] = level
+            timeline.append({
+                "name": span.name,
+                "depth": level,
+                "offset_seconds": round((span.start_time_ns - job_start) / 1e9, 3),
+                "duration_seconds": round(span.duration_seconds, 3) if span.duration_seconds is not None else None,
+                "status": span.status,
+                "attributes": span.attributes,
+            })
+
+        return {
+            "job_id": job_id,
+            "trace_id": spans[0].trace_id,
+            "timeline": timeline,
+            "spans": [span.to_dict() for span in spans],
+        }
+
+
+def current_job_id() -> Optional[str]:
+    """現在のジョブID"""
+    return _current_job_id.get()
+
+
+def set_span_attributes(**attributes):
+    """現在のスパンに属性を追加（スパン外では何もしない）"""
+    span = _current_span.get()
+    if span is not None:
+        for key, value in attributes.items():
+            span.set_attribute(key, value)
+
+
+class TracedBlob:
+    """GCS blob の主要操作をスパンで記録するラッパー"""
+
+    TRACED_METHODS = {
+        "reload", "exists", "delete", "download_to_file", "download_to_filename",
+        "upload_from_file", "upload_from_filename", "generate_signed_url",
+    }
+
+    def __init__(self, blob, tracer: "Tracer"):
+        self._blob = blob
+        self._tracer = tracer
+
+    def __getattr__(self, name):
+        attribute = getattr(self._blob, name)
+        if name not in self.TRACED_METHODS or not callable(attribute):
+            return attribute
+
+        def _traced(*args, **kwargs):
+            with self._tracer.span(f"gcs.{name}", blob=self._blob.name):
+                return attribute(*args, **kwargs)
+        return _traced
+
+
+class TracedBucket:
+    """bucket.blob() が TracedBlob を返すようにするラッパー"""
+
+    def __init__(self, bucket, tracer: "Tracer"):
+        self._bucket = bucket
+        self._tracer = tracer
+
+    def blob(self, *args, **kwargs) -> TracedBlob:
+        return TracedBlob(self._bucket.blob(*args, **kwargs), self._tracer)
+
+    def __getattr__(self, name):
+        return getattr(self._bucket, name)
+
+
+class TracingMiddleware:
+    """APIリクエストごとにジョブIDを発行してルートスパンを開始するASGIミドルウェア"""
+
+    def __init__(self, app, tracer: "Tracer", path_prefix: str = "/api/", exclude_paths: Tuple[str, ...] = ()):
+        """
+        Args:
+            app: ASGIアプリケーション
+            tracer: トレーサー
+            path_prefix: 対象とするパスの接頭辞
+            exclude_paths: 対象外とするパスの接頭辞（定期的に呼ばれる参照系のAPIで直近のジョブが押し出されないように）
+        """
+        self.app = app
+        self.tracer = tracer
+        self.path_prefix = path_prefix
+        self.exclude_paths = tuple(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not scope["path"].startswith(self.path_prefix)
+                or scope["path"].startswith(self.exclude_paths)):
+            await self.app(scope, receive, send)
+            return
+
+        job_id = uuid.uuid4().hex
+        with self.tracer.job(f"{scope['method']} {scope['path']}", job_id=job_id) as span:
+            async def send_with_job_id(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-job-id", job_id.encode()))
+                    message["headers"] = headers
+                await send(message)
+
+            await self.app(scope, receive, send_with_job_id)
+
+
+def _create_exporter():
+    """TRACING_EXPORTER（local / none）に応じたエクスポーター"""
+    exporter_name = os.getenv("TRACING_EXPORTER", "local").lower()
+    if exporter_name == "none":
+        return NoopExporter()
+    return LocalExporter()
+
+
+# アプリケーション全体で共有するトレーサー
+tracer = Tracer(_create_exporter())
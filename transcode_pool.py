@@ -0,0 +1,232 @@
+"""
+ffmpeg変換ワーカープール
+利用可能なCPUコア数に合わせて同時実行数を制限し、短い音声を優先して処理
+"""
+import os
+import subprocess
+import threading
+import time
+import logging
+from typing import Dict, List, Optional
+
+from metrics import TRANSCODE_QUEUE_DEPTH, TRANSCODE_RUNNING, TRANSCODE_SPEED
+from tracing import set_span_attributes
+
+logger = logging.getLogger(__name__)
+
+# 待機1秒ごとに「音声60秒分」優先度を上げる（長時間音声の飢餓防止）
+AGING_AUDIO_SECONDS_PER_WAIT_SECOND = 60
+# 再生時間が不明なジョブの優先度計算に使う仮の長さ（秒）
+UNKNOWN_DURATION_SECONDS = 3600
+
+
+def available_cpus() -> int:
+    """
+    コンテナに割り当てられたCPU数を取得（cgroupのクォータを考慮）
+
+    Returns:
+        利用可能なCPU数（1以上）
+    """
+    # cgroup v2
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+            if quota != "max":
+                return max(1, int(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+
+    # cgroup v1
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return max(1, quota // period)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+
+class TranscodeJob:
+    """キューに投入されたffmpegジョブ"""
+
+    def __init__(self, cmd: List[str], duration_seconds: Optional[float], timeout: float):
+        self.cmd = cmd
+        self.duration_seconds = duration_seconds
+        self.timeout = timeout
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self.threads = 1
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def priority(self, now: float) -> float:
+        """値が小さいほど優先（短い音声ほど先、待ち時間に応じて繰り上げ）"""
+        duration = self.duration_seconds if self.duration_seconds else UNKNOWN_DURATION_SECONDS
+        waited = now - self.enqueued_at
+        return duration - waited * AGING_AUDIO_SECONDS_PER_WAIT_SECOND
+
+
+class TranscodePool:
+    """CPU数に応じたサイズのffmpegワーカープール"""
+
+    def __init__(self, max_workers: Optional[int] = None, cpus: Optional[int] = None):
+        """
+        Args:
+            max_workers: 同時実行するffmpegプロセス数（デフォルト: CPU数）
+            cpus: 利用可能なCPU数（デフォルト: 自動検出）
+        """
+        self.cpus = cpus or available_cpus()
+        self.max_workers = max_workers or int(os.getenv("TRANSCODE_WORKERS", "0")) or self.cpus
+        self._queue: List[TranscodeJob] = []
+        self._condition = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._running = 0
+
+        # メトリクス
+        self._completed = 0
+        self._failed = 0
+        self._audio_seconds = 0.0
+        self._encode_seconds = 0.0
+        self._last_speed = None
+
+        logger.info(f"ffmpegワーカープール: 最大{self.max_workers}並列（CPU数: {self.cpus}）")
+
+    def run(self, cmd: List[str], duration_seconds: Optional[float] = None,
+            timeout: float = 600) -> subprocess.CompletedProcess:
+        """
+        ffmpegコマンドをキューに投入し、完了まで待機
+
+        Args:
+            cmd: ffmpegコマンド（出力ファイルが最後の引数）
+            duration_seconds: 入力音声の再生時間（優先度計算に使用）
+            timeout: 実行開始からのタイムアウト（秒）
+
+        Returns:
+            実行結果
+        """
+        job = TranscodeJob(cmd, duration_seconds, timeout)
+        with self._condition:
+            self._ensure_workers()
+            self._queue.append(job)
+            queue_depth = len(self._queue)
+            TRANSCODE_QUEUE_DEPTH.set(queue_depth)
+            busy = self._running >= self.max_workers
+            self._condition.notify()
+
+        if busy:
+            logger.info(f"ffmpegジョブをキューに追加（待機中: {queue_depth}件）")
+
+        job.done.wait()
+        set_span_attributes(
+            queue_wait_seconds=round(job.started_at - job.enqueued_at, 3),
+            ffmpeg_threads=job.threads
+        )
+        if job.error:
+            raise job.error
+        return job.result
+
+    def stats(self) -> Dict:
+        """
+        キューの状態と変換速度のメトリクス
+
+        Returns:
+            メトリクス
+        """
+        with self._condition:
+            average_speed = (
+                self._audio_seconds / self._encode_seconds if self._encode_seconds else None
+            )
+            return {
+                "workers": self.max_workers,
+                "cpus": self.cpus,
+                "queue_depth": len(self._queue),
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "audio_seconds_total": round(self._audio_seconds, 1),
+                "encode_seconds_total": round(self._encode_seconds, 1),
+                "last_speed_x_realtime": round(self._last_speed, 1) if self._last_speed else None,
+                "average_speed_x_realtime": round(average_speed, 1) if average_speed else None,
+            }
+
+    def _ensure_workers(self):
+        """ワーカースレッドを必要数まで起動（呼び出し側でロック取得済み）"""
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"transcode-worker-{len(self._workers)}",
+                daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job(self) -> TranscodeJob:
+        """優先度が最も高いジョブを取り出す（呼び出し側でロック取得済み）"""
+        now = time.time()
+        job = min(self._queue, key=lambda j: j.priority(now))
+        self._queue.remove(job)
+        TRANSCODE_QUEUE_DEPTH.set(len(self._queue))
+        return job
+
+    def _worker_loop(self):
+        """キューからジョブを取り出して実行"""
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                job = self._next_job()
+                self._running += 1
+                TRANSCODE_RUNNING.set(self._running)
+                # 空いているコアを実行中ジョブで分け合う
+                job.threads = max(1, self.cpus // self._running)
+
+            self._execute(job)
+
+            with self._condition:
+                self._running -= 1
+                TRANSCODE_RUNNING.set(self._running)
+
+    def _execute(self, job: TranscodeJob):
+        """ffmpegを実行してジョブに結果を設定"""
+        cmd = job.cmd[:-1] + ['-threads', str(job.threads), job.cmd[-1]]
+        job.started_at = time.time()
+        wait_time = job.started_at - job.enqueued_at
+        try:
+            job.result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=job.timeout
+            )
+        except Exception as e:
+            job.error = e
+        finally:
+            elapsed = time.time() - job.started_at
+            with self._condition:
+                if job.error or (job.result and job.result.returncode != 0):
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                    if job.duration_seconds and elapsed > 0:
+                        self._audio_seconds += job.duration_seconds
+                        self._encode_seconds += elapsed
+                        self._last_speed = job.duration_seconds / elapsed
+                        TRANSCODE_SPEED.observe(self._last_speed)
+            speed = f"{job.duration_seconds / elapsed:.1f}x" if job.duration_seconds and elapsed > 0 else "不明"
+            logger.info(
+                f"ffmpegジョブ完了 - 待機: {wait_time:.2f}秒, 変換: {elapsed:.2f}秒, "
+                f"スレッド数: {job.threads}, 速度: {speed}"
+            )
+            job.done.set()
+
+
+# アプリケーション全体で共有するプール
+transcode_pool = TranscodePool()
@@ -0,0 +1,795 @@
+"""
+インスタンス間で共有するジョブのワークキュー
+/api/upload を受けたインスタンスはジョブを登録して完了を待ち、処理は空いているインスタンスのワーカーが
+リース（一定時間の占有権）を取得して実行する。取得順はセッション・レーンごとの重み付き公平キューイング（WFQ）で、
+短い音声や待機の少ないセッションのジョブが長い音声の後ろで待たされないようにする。ワーカーは定期的にリースを延長し、
+インスタンスが停止して延長されなくなったジョブは別のインスタンスが引き継ぐ（チェックポイントから再開）
+複数インスタンスで共有する場合はFirestore（WORK_QUEUE=firestore）、単一ホストではSQLite（WORK_QUEUE=sqlite）を使用
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 保存先（sqlite / firestore / none、none の場合は受け付けたインスタンスで直接処理）
+# SQLiteはホスト内でしか共有されず、Cloud Runではコンテナ停止で消えるため既定は none
+WORK_QUEUE = os.getenv("WORK_QUEUE", "none").lower()
+# SQLiteのファイルパス
+WORK_QUEUE_DB_PATH = os.getenv(
+    "WORK_QUEUE_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "work_queue.sqlite3")
+)
+# Firestoreのコレクション名
+WORK_QUEUE_COLLECTION = os.getenv("WORK_QUEUE_COLLECTION", "work_items")
+# Firestoreの複合インデックスがない場合に、状態のみで取得して並べ替える件数
+FIRESTORE_FALLBACK_SCAN = 100
+# Firestoreで取得順の計算に使う仮想時刻・セッションごとの仮想終了時刻を保存するドキュメント
+WFQ_STATE_DOCUMENT = "_wfq_state"
+# リースの有効期間（秒、この間に延長されなければ他のワーカーが引き継ぐ）
+WORK_LEASE_SECONDS = float(os.getenv("WORK_LEASE_SECONDS", "120"))
+# 1インスタンスあたりのワーカー数（0で実行枠数 SCHEDULER_SLOTS と同じ）
+WORK_QUEUE_WORKERS = int(os.getenv("WORK_QUEUE_WORKERS", "0"))
+# 空のキューを確認する間隔・完了を確認する間隔（秒）
+WORK_POLL_SECONDS = float(os.getenv("WORK_POLL_SECONDS", "1"))
+# リース切れ（インスタンス停止）で再実行する回数の上限
+WORK_MAX_ATTEMPTS = int(os.getenv("WORK_MAX_ATTEMPTS", "3"))
+# 完了・失敗したジョブ（結果を含む）を保持する時間（時間、0で削除しない）
+WORK_RETENTION_HOURS = float(os.getenv("WORK_RETENTION_HOURS", "24"))
+# 保持期間を過ぎたジョブを削除する間隔（秒）
+WORK_PURGE_INTERVAL_SECONDS = float(os.getenv("WORK_PURGE_INTERVAL_SECONDS", "3600"))
+
+# ジョブの状態
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = (DONE, FAILED)
+
+
+def item_id(key: str) -> str:
+    """冪等キーからジョブIDを作成"""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def _finish_tag(virtual_time: Optional[float], last_finish: Optional[float], cost: float) -> float:
+    """WFQの仮想終了時刻（全体の仮想時刻と同じセッション・レーンの直前のジョブの遅い方から積み上げ）"""
+    return max(virtual_time or 0.0, last_finish or 0.0) + cost
+
+
+def worker_name() -> str:
+    """ワーカーIDの接頭辞（インスタンスの識別用）"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class WorkQueue(ABC):
+    """ワークキューの共通インターフェース"""
+
+    @abstractmethod
+    def enqueue(self, key: str, payload: Dict, owner: Optional[str] = None, lane: str = "batch",
+                cost: float = 0.0) -> Dict:
+        """
+        ジョブを登録（同じキーのジョブが待機中・実行中・完了済みならそれを返し、失敗していれば再登録）
+        所有者・レーンごとに仮想終了時刻（finish_tag）を積み上げ、claim はその小さい順に取得
+
+        Args:
+            key: 冪等キー
+            payload: ジョブの内容
+            owner: 公平に割り当てる単位（ログインごとのセッション）
+            lane: レーン（interactive / batch）
+            cost: 仮想時間の増分（FairScheduler.weighted_cost）
+
+        Returns:
+            ジョブ
+        """
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float = WORK_LEASE_SECONDS) -> Optional[Dict]:
+        """
+        待機中またはリース切れのジョブを仮想終了時刻の小さい順に1件取得してリースを設定
+
+        Args:
+            worker_id: ワーカーID
+            lease_seconds: リースの有効期間（秒）
+
+        Returns:
+            ジョブ（ない場合はNone）
+        """
+
+    @abstractmethod
+    def heartbeat(self, key: str, worker_id: str, lease_seconds: float = WORK_LEASE_SECONDS) -> bool:
+        """
+        リースを延長
+
+        Returns:
+            延長できた場合True（他のワーカーに引き継がれていればFalse）
+        """
+
+    @abstractmethod
+    def complete(self, key: str, worker_id: str, result: Dict) -> bool:
+        """
+        ジョブを完了（リースが切れていても、まだ完了していなければ結果を採用）
+
+        Returns:
+            結果を記録した場合True
+        """
+
+    @abstractmethod
+    def fail(self, key: str, worker_id: str, error: Dict) -> bool:
+        """
+        ジョブを失敗として記録（リースを保持している場合のみ）
+
+        Returns:
+            記録した場合True
+        """
+
+    @abstractmethod
+    def release(self, key: str, worker_id: str):
+        """
+        リースを手放して待機中に戻す（インスタンス停止時、他のインスタンスがすぐ引き継げるように）
+        """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict]:
+        """ジョブを取得（存在しない場合はNone）"""
+
+    @abstractmethod
+    def position(self, item: Dict) -> Optional[int]:
+        """
+        待機中のジョブの順番（取得順で前にある待機中のジョブ数 + 1）
+
+        Args:
+            item: ジョブ
+
+        Returns:
+            順番（待機中でない場合はNone）
+        """
+
+    @abstractmethod
+    def purge(self, older_than: float) -> int:
+        """
+        完了・失敗したジョブを削除（結果は議事録の保存先にも保存済み）
+
+        Args:
+            older_than: この時刻（UNIX時間）より前に更新されたジョブを削除
+
+        Returns:
+            削除したジョブ数
+        """
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        """状態ごとのジョブ数"""
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """SQLiteのワークキュー（ローカル・同一ホストの複数プロセス用）"""
+
+    def __init__(self, path: str = WORK_QUEUE_DB_PATH, max_attempts: int = WORK_MAX_ATTEMPTS):
+        """
+        Args:
+            path: データベースファイルのパス
+            max_attempts: リース切れで再実行する回数の上限
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # 他のプロセスとの排他はトランザクション（BEGIN IMMEDIATE）で行う
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS work_items (
+                    id TEXT PRIMARY KEY,
+                    key TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    worker_id TEXT,
+                    lease_expires_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    enqueued_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT,
+                    lane TEXT,
+                    finish_tag REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            # 取得順（WFQ）追加前に作成したデータベースの移行
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(work_items)")}
+            for column, definition in (("owner", "TEXT"), ("lane", "TEXT"), ("finish_tag", "REAL NOT NULL DEFAULT 0")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE work_items ADD COLUMN {column} {definition}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_work_items_state ON work_items (state, enqueued_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_work_items_order ON work_items (state, finish_tag)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_work_items_owner ON work_items (owner, lane, state)")
+        logger.info(f"ワークキュー（SQLite）: {path}")
+
+    def _transaction(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, key: str, payload: Dict, owner: Optional[str] = None, lane: str = "batch",
+                cost: float = 0.0) -> Dict:
+        now = time.time()
+
+        def _enqueue(conn):
+            row = conn.execute("SELECT * FROM work_items WHERE id = ?", (item_id(key),)).fetchone()
+            if row is not None and row["state"] != FAILED:
+                return
+            # 全体の仮想時刻は取得済みのジョブの仮想終了時刻の最大値
+            virtual_time = conn.execute(
+                "SELECT MAX(finish_tag) FROM work_items WHERE state != ?", (PENDING,)
+            ).fetchone()[0]
+            last_finish = conn.execute(
+                "SELECT MAX(finish_tag) FROM work_items WHERE owner = ? AND lane = ? AND state IN (?, ?)",
+                (owner, lane, PENDING, RUNNING),
+            ).fetchone()[0]
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO work_items
+                    (id, key, payload, state, worker_id, lease_expires_at, attempts, enqueued_at, updated_at,
+                     owner, lane, finish_tag)
+                VALUES (?, ?, ?, ?, NULL, NULL, 0, ?, ?, ?, ?, ?)
+                """,
+                (item_id(key), key, json.dumps(payload, ensure_ascii=False), PENDING, now, now,
+                 owner, lane, _finish_tag(virtual_time, last_finish, cost)),
+            )
+
+        self._transaction(_enqueue)
+        return self.get(key)
+
+    def claim(self, worker_id: str, lease_seconds: float = WORK_LEASE_SECONDS) -> Optional[Dict]:
+        def _claim(conn):
+            now = time.time()
+            while True:
+                row = conn.execute(
+                    """
+                    SELECT * FROM work_items
+                    WHERE state = ? OR (state = ? AND lease_expires_at < ?)
+                    ORDER BY finish_tag, enqueued_at LIMIT 1
+                    """,
+                    (PENDING, RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["attempts"] >= self.max_attempts:
+                    # インスタンスの停止が繰り返されたジョブは打ち切り
+                    conn.execute(
+                        "UPDATE work_items SET state = ?, error = ?, updated_at = ? WHERE id = ?",
+                        (FAILED, json.dumps(_abandoned_error(row["attempts"]), ensure_ascii=False), now, row["id"]),
+                    )
+                    continue
+                conn.execute(
+                    """
+                    UPDATE work_items SET state = ?, worker_id = ?, lease_expires_at = ?,
+                        attempts = attempts + 1, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (RUNNING, worker_id, now + lease_seconds, now, row["id"]),
+                )
+                return row["id"]
+
+        claimed = self._transaction(_claim)
+        return self._get_by_id(claimed) if claimed else None
+
+    def heartbeat(self, key: str, worker_id: str, lease_seconds: float = WORK_LEASE_SECONDS) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE work_items SET lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND state = ? AND worker_id = ?",
+                (now + lease_seconds, now, item_id(key), RUNNING, worker_id),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, key: str, worker_id: str, result: Dict) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE work_items SET state = ?, result = ?, error = NULL, worker_id = ?, "
+                "lease_expires_at = NULL, updated_at = ? WHERE id = ? AND state != ?",
+                (DONE, json.dumps(result, ensure_ascii=False), worker_id, time.time(), item_id(key), DONE),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, key: str, worker_id: str, error: Dict) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE work_items SET state = ?, error = ?, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND state = ? AND worker_id = ?",
+                (FAILED, json.dumps(error, ensure_ascii=False), time.time(), item_id(key), RUNNING, worker_id),
+            )
+        return cursor.rowcount == 1
+
+    def release(self, key: str, worker_id: str):
+        with self._lock:
+            # 正常な停止による中断は再実行回数に数えない
+            self._conn.execute(
+                "UPDATE work_items SET state = ?, worker_id = NULL, lease_expires_at = NULL, "
+                "attempts = MAX(attempts - 1, 0), updated_at = ? WHERE id = ? AND state = ? AND worker_id = ?",
+                (PENDING, time.time(), item_id(key), RUNNING, worker_id),
+            )
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self._get_by_id(item_id(key))
+
+    def _get_by_id(self, id_: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM work_items WHERE id = ?", (id_,)).fetchone()
+        if row is None:
+            return None
+        item = dict(row)
+        for column in ("payload", "result", "error"):
+            item[column] = json.loads(item[column]) if item[column] else None
+        return item
+
+    def position(self, item: Dict) -> Optional[int]:
+        if item["state"] != PENDING:
+            return None
+        finish_tag = item.get("finish_tag") or 0.0
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT COUNT(*) AS ahead FROM work_items
+                WHERE state = ? AND (finish_tag < ? OR (finish_tag = ? AND enqueued_at < ?))
+                """,
+                (PENDING, finish_tag, finish_tag, item["enqueued_at"]),
+            ).fetchone()
+        return row["ahead"] + 1
+
+    def purge(self, older_than: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM work_items WHERE state IN ({', '.join('?' for _ in FINISHED_STATES)}) "
+                "AND updated_at < ?",
+                (*FINISHED_STATES, older_than),
+            )
+        return cursor.rowcount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) AS count FROM work_items GROUP BY state").fetchall()
+        return {row["state"]: row["count"] for row in rows}
+
+
+class FirestoreWorkQueue(WorkQueue):
+    """Firestoreのワークキュー（Cloud Runの複数インスタンス間で共有）"""
+
+    def __init__(self, collection: str = WORK_QUEUE_COLLECTION, max_attempts: int = WORK_MAX_ATTEMPTS):
+        """
+        Args:
+            collection: コレクション名
+            max_attempts: リース切れで再実行する回数の上限
+        """
+        from google.cloud import firestore
+        from google.api_core.exceptions import FailedPrecondition
+
+        self._firestore = firestore
+        self._missing_index_error = FailedPrecondition
+        self._client = firestore.Client()
+        self._collection = self._client.collection(collection)
+        self._wfq_ref = self._collection.document(WFQ_STATE_DOCUMENT)
+        self.max_attempts = max_attempts
+        self._missing_indexes_reported = set()
+        logger.info(f"ワークキュー（Firestore）: {collection}")
+
+    def _update_if(self, key: str, condition: Callable[[Dict], bool], values: Callable[[Dict], Dict]) -> bool:
+        """トランザクション内で条件を満たす場合のみ更新"""
+        ref = self._collection.document(item_id(key))
+
+        @self._firestore.transactional
+        def _update(transaction) -> bool:
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists or not condition(snapshot.to_dict()):
+                return False
+            transaction.update(ref, values(snapshot.to_dict()))
+            return True
+
+        return _update(self._client.transaction())
+
+    def enqueue(self, key: str, payload: Dict, owner: Optional[str] = None, lane: str = "batch",
+                cost: float = 0.0) -> Dict:
+        ref = self._collection.document(item_id(key))
+
+        @self._firestore.transactional
+        def _enqueue(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if snapshot.exists and snapshot.to_dict().get("state") != FAILED:
+                return snapshot.to_dict()
+            # 仮想時刻と、セッション・レーンごとの直前の仮想終了時刻（仮想時刻に追い越されたものは破棄）
+            wfq = self._wfq_ref.get(transaction=transaction)
+            wfq_state = wfq.to_dict() if wfq.exists else {}
+            virtual_time = wfq_state.get("virtual_time", 0.0)
+            last_finish = {
+                lane_key: tag for lane_key, tag in (wfq_state.get("last_finish") or {}).items()
+                if tag > virtual_time
+            }
+            lane_key = item_id(f"{owner}:{lane}")
+            finish_tag = _finish_tag(virtual_time, last_finish.get(lane_key), cost)
+            last_finish[lane_key] = finish_tag
+
+            now = time.time()
+            item = {
+                "id": item_id(key), "key": key, "payload": payload, "state": PENDING,
+                "worker_id": None, "lease_expires_at": None, "attempts": 0,
+                "enqueued_at": now, "updated_at": now, "result": None, "error": None,
+                "owner": owner, "lane": lane, "finish_tag": finish_tag,
+            }
+            transaction.set(ref, item)
+            transaction.set(self._wfq_ref, {"virtual_time": virtual_time, "last_finish": last_finish})
+            return item
+
+        return _enqueue(self._client.transaction())
+
+    def _report_missing_index(self, query_name: str, error: Exception):
+        """複合インデックスがない場合のエラーを記録（クエリごとに最初の1回のみ）"""
+        if query_name in self._missing_indexes_reported:
+            return
+        self._missing_indexes_reported.add(query_name)
+        logger.error(
+            f"ワークキューのFirestore複合インデックスがありません（{query_name}）。"
+            f"firestore.indexes.json のインデックスを作成してください: {str(error)}"
+        )
+
+    def _candidates(self, now: float) -> List:
+        """取得候補（待機中の仮想終了時刻の小さい順と、リース切れの実行中）"""
+        try:
+            pending = list(
+                self._collection.where("state", "==", PENDING)
+                .order_by("finish_tag").limit(5).stream()
+            )
+            expired = list(
+                self._collection.where("state", "==", RUNNING)
+                .where("lease_expires_at", "<", now).limit(5).stream()
+            )
+            # 取得順（WFQ）追加前に登録された finish_tag のないジョブも取得できるよう、最も古い待機中のジョブを最後に追加
+            oldest = list(
+                self._collection.where("state", "==", PENDING)
+                .order_by("enqueued_at").limit(1).stream()
+            )
+        except self._missing_index_error as e:
+            self._report_missing_index("claim", e)
+            # インデックスなしでもジョブが止まらないよう、状態のみで取得してメモリ上で並べ替え
+            pending = sorted(
+                self._collection.where("state", "==", PENDING).limit(FIRESTORE_FALLBACK_SCAN).stream(),
+                key=lambda snapshot: (
+                    snapshot.to_dict().get("finish_tag") or 0.0, snapshot.to_dict().get("enqueued_at") or 0.0
+                ),
+            )[:5]
+            expired = [
+                snapshot for snapshot in
+                self._collection.where("state", "==", RUNNING).limit(FIRESTORE_FALLBACK_SCAN).stream()
+                if (snapshot.to_dict().get("lease_expires_at") or 0) < now
+            ][:5]
+            oldest = []
+        return [snapshot.reference for snapshot in pending + expired + oldest]
+
+    def claim(self, worker_id: str, lease_seconds: float = WORK_LEASE_SECONDS) -> Optional[Dict]:
+        now = time.time()
+        for ref in self._candidates(now):
+            # 他のインスタンスと同時に取得しようとした場合はトランザクションで1つだけ成功
+            @self._firestore.transactional
+            def _claim(transaction):
+                snapshot = ref.get(transaction=transaction)
+                item = snapshot.to_dict() if snapshot.exists else None
+                if item is None:
+                    return None
+                wfq = self._wfq_ref.get(transaction=transaction)
+                virtual_time = (wfq.to_dict() if wfq.exists else {}).get("virtual_time", 0.0)
+                claimable = item["state"] == PENDING or (
+                    item["state"] == RUNNING and (item.get("lease_expires_at") or 0) < time.time()
+                )
+                if not claimable:
+                    return None
+                if item.get("attempts", 0) >= self.max_attempts:
+                    transaction.update(ref, {
+                        "state": FAILED, "error": _abandoned_error(item["attempts"]), "updated_at": time.time(),
+                    })
+                    return None
+                values = {
+                    "state": RUNNING, "worker_id": worker_id, "lease_expires_at": time.time() + lease_seconds,
+                    "attempts": item.get("attempts", 0) + 1, "updated_at": time.time(),
+                }
+                transaction.update(ref, values)
+                # 取得したジョブの仮想終了時刻まで仮想時刻を進める
+                finish_tag = item.get("finish_tag") or 0.0
+                if finish_tag > virtual_time:
+                    transaction.set(self._wfq_ref, {"virtual_time": finish_tag}, merge=True)
+                item.update(values)
+                return item
+
+            item = _claim(self._client.transaction())
+            if item is not None:
+                return item
+        return None
+
+    def heartbeat(self, key: str, worker_id: str, lease_seconds: float = WORK_LEASE_SECONDS) -> bool:
+        return self._update_if(
+            key,
+            lambda item: item["state"] == RUNNING and item.get("worker_id") == worker_id,
+            lambda item: {"lease_expires_at": time.time() + lease_seconds, "updated_at": time.time()},
+        )
+
+    def complete(self, key: str, worker_id: str, result: Dict) -> bool:
+        return self._update_if(
+            key,
+            lambda item: item["state"] != DONE,
+            lambda item: {
+                "state": DONE, "result": result, "error": None, "worker_id": worker_id,
+                "lease_expires_at": None, "updated_at": time.time(),
+            },
+        )
+
+    def fail(self, key: str, worker_id: str, error: Dict) -> bool:
+        return self._update_if(
+            key,
+            lambda item: item["state"] == RUNNING and item.get("worker_id") == worker_id,
+            lambda item: {"state": FAILED, "error": error, "lease_expires_at": None, "updated_at": time.time()},
+        )
+
+    def release(self, key: str, worker_id: str):
+        self._update_if(
+            key,
+            lambda item: item["state"] == RUNNING and item.get("worker_id") == worker_id,
+            lambda item: {
+                "state": PENDING, "worker_id": None, "lease_expires_at": None,
+                "attempts": max(item.get("attempts", 0) - 1, 0), "updated_at": time.time(),
+            },
+        )
+
+    def get(self, key: str) -> Optional[Dict]:
+        snapshot = self._collection.document(item_id(key)).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def position(self, item: Dict) -> Optional[int]:
+        if item["state"] != PENDING:
+            return None
+        query = (
+            self._collection.where("state", "==", PENDING)
+            .where("finish_tag", "<", item.get("finish_tag") or 0.0)
+        )
+        try:
+            return query.count().get()[0][0].value + 1
+        except self._missing_index_error as e:
+            self._report_missing_index("position", e)
+            return None
+
+    def purge(self, older_than: float) -> int:
+        deleted = 0
+        for state in FINISHED_STATES:
+            while True:
+                try:
+                    snapshots = list(
+                        self._collection.where("state", "==", state)
+                        .where("updated_at", "<", older_than).limit(200).stream()
+                    )
+                except self._missing_index_error as e:
+                    self._report_missing_index("purge", e)
+                    return deleted
+                if not snapshots:
+                    break
+                batch = self._client.batch()
+                for snapshot in snapshots:
+                    batch.delete(snapshot.reference)
+                batch.commit()
+                deleted += len(snapshots)
+        return deleted
+
+    def stats(self) -> Dict:
+        return {
+            state: self._collection.where("state", "==", state).count().get()[0][0].value
+            for state in (PENDING, RUNNING)
+        }
+
+
+def _abandoned_error(attempts: int) -> Dict:
+    return {
+        "status_code": 500,
+        "detail": f"処理中のインスタンスが{attempts}回停止したため処理を中止しました。再度お試しください",
+    }
+
+
+class QueueWorkers:
+    """キューからジョブを取得して実行するワーカー（インスタンスごと）"""
+
+    def __init__(self, queue: WorkQueue, handler: Callable[[Dict], Awaitable[Dict]],
+                 workers: int = WORK_QUEUE_WORKERS, lease_seconds: float = WORK_LEASE_SECONDS,
+                 poll_seconds: float = WORK_POLL_SECONDS, retention_hours: float = WORK_RETENTION_HOURS):
+        """
+        Args:
+            queue: ワークキュー
+            handler: ジョブを処理して結果を返す処理（例外は失敗として記録）
+            workers: ワーカー数
+            lease_seconds: リースの有効期間（秒）
+            poll_seconds: 空のキューを確認する間隔（秒）
+            retention_hours: 完了・失敗したジョブを保持する時間（時間、0で削除しない）
+        """
+        self.queue = queue
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.retention_hours = retention_hours
+        self.worker_prefix = worker_name()
+        self._tasks: List[asyncio.Task] = []
+        self._purge_task: Optional[asyncio.Task] = None
+        self._running: Dict[str, str] = {}
+        self._finished: Dict[str, asyncio.Event] = {}
+        self._stopping = False
+        self.processed_count = 0
+        self.lost_lease_count = 0
+        self.purged_count = 0
+
+    def start(self):
+        """ワーカーを開始（イベントループ上から呼び出す、開始済みなら何もしない）"""
+        if self._tasks:
+            return
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._worker_loop(f"{self.worker_prefix}-{index}"))
+            for index in range(self.workers)
+        ]
+        if self.retention_hours > 0:
+            self._purge_task = asyncio.create_task(self._purge_loop())
+        logger.info(f"ワークキューのワーカー開始: {self.workers}件 ({self.worker_prefix})")
+
+    async def stop(self):
+        """ワーカーを停止し、実行中のジョブのリースを手放す（他のインスタンスが引き継ぐ）"""
+        self._stopping = True
+        for key, worker_id in list(self._running.items()):
+            try:
+                await asyncio.to_thread(self.queue.release, key, worker_id)
+                logger.info(f"停止のためジョブを手放しました: {key}")
+            except Exception as e:
+                logger.warning(f"リース解放エラー: {key} - {str(e)}")
+        if self._purge_task is not None:
+            self._purge_task.cancel()
+            self._purge_task = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker_loop(self, worker_id: str):
+        while not self._stopping:
+            try:
+                item = await asyncio.to_thread(self.queue.claim, worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.warning(f"ジョブの取得エラー: {str(e)}")
+                item = None
+            if item is None:
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            await self._execute(worker_id, item)
+
+    async def _purge_loop(self):
+        """保持期間を過ぎた完了・失敗のジョブを定期的に削除"""
+        while not self._stopping:
+            try:
+                deleted = await asyncio.to_thread(
+                    self.queue.purge, time.time() - self.retention_hours * 3600
+                )
+                if deleted:
+                    self.purged_count += deleted
+                    logger.info(f"保持期間を過ぎたジョブを削除: {deleted}件")
+            except Exception as e:
+                logger.warning(f"ジョブの削除エラー: {str(e)}")
+            await asyncio.sleep(WORK_PURGE_INTERVAL_SECONDS)
+
+    async def _execute(self, worker_id: str, item: Dict):
+        key = item["key"]
+        self._running[key] = worker_id
+        task = asyncio.create_task(self.handler(item))
+        heartbeat = asyncio.create_task(self._heartbeat(worker_id, key, task))
+        if item.get("attempts", 1) > 1:
+            logger.info(f"中断したジョブを引き継ぎ: {key}（{item['attempts']}回目）")
+        try:
+            result = await task
+            await asyncio.to_thread(self.queue.complete, key, worker_id, result)
+            self.processed_count += 1
+        except asyncio.CancelledError:
+            # リースを失って中断した場合は、引き継いだワーカーが結果を記録する
+            if heartbeat.cancelled() or not heartbeat.done():
+                raise
+        except Exception as e:
+            error = {
+                "status_code": getattr(e, "status_code", 500),
+                "detail": getattr(e, "detail", None) or str(e),
+            }
+            try:
+                await asyncio.to_thread(self.queue.fail, key, worker_id, error)
+            except Exception as fail_error:
+                logger.warning(f"ジョブの失敗の記録エラー: {key} - {str(fail_error)}")
+        finally:
+            heartbeat.cancel()
+            self._running.pop(key, None)
+            event = self._finished.pop(key, None)
+            if event is not None:
+                event.set()
+
+    async def _heartbeat(self, worker_id: str, key: str, task: asyncio.Task):
+        """リースの有効期間の1/3ごとに延長（他のワーカーに移った場合は処理を中断）"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await asyncio.to_thread(self.queue.heartbeat, key, worker_id, self.lease_seconds):
+                    self.lost_lease_count += 1
+                    logger.warning(f"ジョブのリースが他のワーカーに移ったため処理を中断: {key}")
+                    task.cancel()
+                    return
+            except Exception as e:
+                logger.warning(f"リース延長エラー: {key} - {str(e)}")
+
+    async def wait(self, key: str, poll_seconds: Optional[float] = None) -> Dict:
+        """
+        ジョブの完了を待機（このインスタンスで処理した場合はすぐ、他のインスタンスの場合は定期確認で検知）
+
+        Args:
+            key: 冪等キー
+            poll_seconds: 完了を確認する間隔（秒）
+
+        Returns:
+            完了または失敗したジョブ
+        """
+        interval = poll_seconds or self.poll_seconds
+        try:
+            while True:
+                event = self._finished.setdefault(key, asyncio.Event())
+                item = await asyncio.to_thread(self.queue.get, key)
+                if item is not None and item["state"] in FINISHED_STATES:
+                    return item
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._finished.pop(key, None)
+
+    def stats(self) -> Dict:
+        """ワーカーの状態とキューのジョブ数"""
+        return {
+            "worker_prefix": self.worker_prefix,
+            "workers": len(self._tasks),
+            "running": list(self._running),
+            "processed": self.processed_count,
+            "lost_leases": self.lost_lease_count,
+            "purged": self.purged_count,
+            "queue": self.queue.stats(),
+        }
+
+
+def create_work_queue() -> Optional[WorkQueue]:
+    """
+    WORK_QUEUE に応じたワークキューを作成
+
+    Returns:
+        ワークキュー（none の場合はNone）
+    """
+    if WORK_QUEUE == "none":
+        return None
+    if WORK_QUEUE == "firestore":
+        return FirestoreWorkQueue()
+    return SQLiteWorkQueue()